@@ -1,9 +1,50 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates.
-from .inference import video_inference
-from .test import multi_gpu_test, single_gpu_test
-from .train import init_random_seed, set_random_seed, train_model
+import importlib
+
+from .cpu_engine import cpu_autocast, prepare_cpu_model, setup_cpu_inference
+from .inference import (init_model, keyframe_inference, load_sequence,
+                        load_weights, model_forward, video_inference)
+from .keyframe import (KEYFRAME_MODES, interpolate_frames, lq_depth,
+                       select_keyframes)
+from .memory_planner import (PLAN_MODES, format_plan, memory_budget_scope,
+                             plan_execution)
+from .pruning import (PRUNE_GROUPS, channel_importance, prune_generator,
+                      pruned_width, select_channels)
+from .quantization import (QUANT_TARGETS, quantizable_modules,
+                           quantize_generator)
+from .result_writer import ResultWriter, load_result_frame
+from .server import (InferenceClient, InferenceService, LocalInferenceClient,
+                     serve)
+from .tiled_inference import (auto_tile_size, tiled_equivalence_report,
+                              tiled_forward)
+
+# training and testing helpers pull in mmseg, so they are imported on first use
+_LAZY_ATTRS = {
+    'train_model': '.train',
+    'set_random_seed': '.train',
+    'init_random_seed': '.train',
+    'multi_gpu_test': '.test',
+    'single_gpu_test': '.test',
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        return getattr(importlib.import_module(_LAZY_ATTRS[name], __name__),
+                       name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
 
 __all__ = [
     'train_model', 'set_random_seed', 'init_random_seed',
-    'multi_gpu_test', 'single_gpu_test', 'restoration_video_inference',
+    'multi_gpu_test', 'single_gpu_test', 'ResultWriter', 'load_result_frame',
+    'init_model', 'load_sequence', 'model_forward', 'video_inference', 'tiled_forward', 'auto_tile_size',
+    'tiled_equivalence_report', 'setup_cpu_inference', 'prepare_cpu_model',
+    'cpu_autocast', 'load_weights', 'InferenceService', 'InferenceClient',
+    'LocalInferenceClient', 'serve', 'PLAN_MODES', 'plan_execution',
+    'format_plan', 'memory_budget_scope', 'KEYFRAME_MODES',
+    'keyframe_inference', 'select_keyframes', 'interpolate_frames',
+    'lq_depth', 'QUANT_TARGETS', 'quantizable_modules', 'quantize_generator',
+    'PRUNE_GROUPS', 'pruned_width', 'channel_importance', 'select_channels',
+    'prune_generator',
 ]
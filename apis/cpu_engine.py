@@ -0,0 +1,65 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+import contextlib
+import warnings
+
+import torch
+
+
+def setup_cpu_inference(num_threads=None, num_interop_threads=None):
+    """Configure the intra-op and inter-op thread pools of this process.
+
+    When several inference processes share a machine, give each of them a
+    disjoint share of the cores, e.g. ``num_threads = cores // processes`` and
+    ``num_interop_threads = 1``.
+
+    Args:
+        num_threads (int | None): Intra-op threads. None keeps the default
+            (``OMP_NUM_THREADS`` or the number of physical cores). The
+            environment variables only take effect when exported before the
+            process starts; this sets the pool size directly.
+        num_interop_threads (int | None): Inter-op threads. None keeps the
+            default. This can only be set before the first parallel work of
+            the process.
+    """
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads is not None:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError as e:
+            warnings.warn(f'Inter-op threads were not changed: {e}')
+
+
+def prepare_cpu_model(model, channels_last=True):
+    """Prepare a model for CPU inference.
+
+    Args:
+        model (nn.Module): The model, already in eval mode.
+        channels_last (bool): Convert the convolution weights to the
+            channels_last memory format, which makes the oneDNN convolutions
+            of the propagation backbones run without layout reorders.
+            Default: True.
+
+    Returns:
+        nn.Module: The prepared model.
+    """
+    model = model.cpu()
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    return model
+
+
+def cpu_autocast(enabled=False, dtype=torch.bfloat16):
+    """bf16 autocast context for CPU inference.
+
+    Optical flow, warping, the deformable alignment and the confidence
+    softmax are kept in float32 by the generators (see
+    :func:`model.common.fp32_region`).
+
+    Args:
+        enabled (bool): Whether to enable autocast. Default: False.
+        dtype (torch.dtype): Lower precision dtype. Default: torch.bfloat16.
+    """
+    if not enabled:
+        return contextlib.nullcontext()
+    return torch.autocast(device_type='cpu', dtype=dtype)
@@ -1,4 +1,5 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates.
+import copy
 import glob
 import os
 import os.path as osp
@@ -8,8 +9,76 @@ from functools import reduce
 import mmcv
 import numpy as np
 import torch
+from mmcv.runner import load_state_dict
 
 from datasets import Compose
+from model.builder import build_model
+from .keyframe import interpolate_frames, lq_depth, select_keyframes
+from .memory_planner import memory_budget_scope, plan_execution
+from .tiled_inference import tiled_forward
+
+
+def load_weights(model, checkpoint, map_location='cpu'):
+    """Load the weights of a checkpoint into a model.
+
+    Full training checkpoints (with 'state_dict', 'optimizer' and 'meta')
+    and slim weight files written by ``tools/slim_checkpoint.py`` are both
+    accepted. Files in the zip format of ``torch.save`` are memory-mapped
+    when the installed PyTorch supports it, so only the tensors are read.
+
+    Args:
+        model (nn.Module): The model.
+        checkpoint (str): Checkpoint path.
+        map_location (str | torch.device): Same as :func:`torch.load`.
+            Default: 'cpu'.
+
+    Returns:
+        dict: The loaded checkpoint.
+    """
+    try:
+        ckpt = torch.load(checkpoint, map_location=map_location, mmap=True)
+    except (TypeError, RuntimeError):  # older PyTorch or legacy format
+        ckpt = torch.load(checkpoint, map_location=map_location)
+    state_dict = ckpt.get('state_dict', ckpt)
+    state_dict = {re.sub(r'^module\.', '', k): v for k, v in state_dict.items()}
+    load_state_dict(model, state_dict)
+    return ckpt
+
+
+def init_model(config, checkpoint=None, device='cuda:0'):
+    """Initialize a model from config file.
+
+    If a checkpoint is given, the pretrained SPyNet weights of the config are
+    not loaded, since the checkpoint overwrites them anyway.
+
+    Args:
+        config (str or :obj:`mmcv.Config`): Config file path or the config
+            object.
+        checkpoint (str, optional): Checkpoint path. If left as None, the model
+            will not load any weights.
+        device (str): Which device the model will deploy. Default: 'cuda:0'.
+
+    Returns:
+        nn.Module: The constructed model.
+    """
+    if isinstance(config, str):
+        config = mmcv.Config.fromfile(config)
+    elif not isinstance(config, mmcv.Config):
+        raise TypeError('config must be a filename or Config object, '
+                        f'but got {type(config)}')
+    config.model.pretrained = None
+    config.test_cfg.metrics = None
+    if checkpoint is not None:
+        config.model.generator.spynet_pretrained = None
+    model = build_model(config.model, test_cfg=config.test_cfg)
+    if checkpoint is not None:
+        load_weights(model, checkpoint, map_location='cpu')
+
+    model.cfg = config  # save the config in the model for convenience
+    model.to(device)
+    model.eval()
+    return model
+
 
 def pad_sequence(data, window_size):
     padding = window_size // 2
@@ -23,12 +92,82 @@ def pad_sequence(data, window_size):
     return data
 
 
+def load_sequence(cfg, root_dir, start_idx=0, return_gt=False):
+    """Load a video directory with the demo/test pipeline of a config.
+
+    Args:
+        cfg (:obj:`mmcv.Config`): The model config (``model.cfg``).
+        root_dir (str): Directory of the input video, containing 'color' and
+            'depth' sub-folders.
+        start_idx (int): The index corresponds to the first frame in the
+            sequence. Default: 0.
+        return_gt (bool): Whether to also return the ground-truth depth of
+            the 'depth' sub-folder. Default: False.
+
+    Returns:
+        tuple[Tensor]: lqs with shape (1, t, c, h/s, w/s) and guides with
+            shape (1, t, 3, h, w) (and gt with shape (1, t, 1, h, w) if
+            ``return_gt``), all in cpu.
+    """
+    # build the data pipeline
+    if cfg.get('demo_pipeline', None):
+        test_pipeline = cfg.demo_pipeline
+    elif cfg.get('test_pipeline', None):
+        test_pipeline = cfg.test_pipeline
+    else:
+        test_pipeline = cfg.val_pipeline
+
+    # specify start_idx on a copy, the config may be shared between threads
+    test_pipeline = copy.deepcopy(test_pipeline)
+    test_pipeline[0]['start_idx'] = start_idx
+
+    # prepare data
+    sequence_length = len(glob.glob(osp.join(root_dir, 'color', '*')))
+    gt_folder = [osp.join(root_dir, 'depth', f) for f in sorted(os.listdir(osp.join(root_dir, 'depth')))]
+    guide_folder = [osp.join(root_dir, 'color', f) for f in sorted(os.listdir(osp.join(root_dir, 'color')))]
+    data = dict(
+        guide_path=guide_folder,
+        gt_path=gt_folder,
+        sequence_length=sequence_length)
+
+    # compose the pipeline
+    test_pipeline = Compose(test_pipeline)
+    data = test_pipeline(data)
+    lqs = data['lq'].unsqueeze(0)  # in cpu
+    guides = data['guide'].unsqueeze(0)
+    if return_gt:
+        return lqs, guides, data['gt'].unsqueeze(0)
+    return lqs, guides
+
+
+def model_forward(model, lq, guide, tile_cfg=None):
+    """Run the restorer in test mode, optionally tile by tile.
+
+    Args:
+        model (nn.Module): The loaded model.
+        lq (Tensor): LQ sequence with shape (n, t, c, h/s, w/s).
+        guide (Tensor): Guide sequence with shape (n, t, 3, h, w).
+        tile_cfg (dict | None): Arguments of :func:`tiled_forward`
+            (tile_size, tile_halo, memory_budget). None disables tiling.
+
+    Returns:
+        Tensor: The predicted restoration result in cpu.
+    """
+    if tile_cfg is None:
+        return model(lq=lq, guide=guide, test_mode=True)['output'].cpu()
+    return tiled_forward(model.generator, lq, guide, **tile_cfg).cpu()
+
+
 def video_inference(model,
                                 root_dir,
                                 window_size,
                                 start_idx,
                                 filename_tmpl,
-                                max_seq_len=None):
+                                max_seq_len=None,
+                                writer=None,
+                                tile_cfg=None,
+                                memory_budget=None,
+                                keyframe_cfg=None):
     """Inference image with the model.
 
     Args:
@@ -44,39 +183,31 @@ def video_inference(model,
             processes. If the sequence length is larger than this number,
             the sequence is split into multiple segments. If it is None,
             the entire sequence is processed at once.
+        writer (:obj:`ResultWriter` | None): If given, every finished segment
+            is handed to the writer right away, so that writing overlaps with
+            the inference of the next segment. Default: None.
+        tile_cfg (dict | None): If given, frames are processed in spatial
+            tiles, see :func:`tiled_forward`. Default: None.
+        memory_budget (int | None): Device memory budget in bytes of the
+            recurrent framework. If given, :func:`plan_execution` chooses
+            between full, offloaded, chunked and tiled execution, replacing
+            ``max_seq_len`` and ``tile_cfg``; the plan and the measured peak
+            are logged. Default: None.
+        keyframe_cfg (dict | None): If given, the recurrent framework runs
+            only on keyframes and the other frames are interpolated, see
+            :func:`keyframe_inference` (interval, mode, threshold). Cannot
+            be combined with ``memory_budget``. Default: None.
 
     Returns:
         Tensor: The predicted restoration result.
     """
 
+    if keyframe_cfg is not None and memory_budget is not None:
+        raise ValueError('keyframe_cfg and memory_budget cannot be combined, '
+                         'use max_seq_len or tile_cfg to bound the memory')
     device = next(model.parameters()).device  # model device
 
-    # build the data pipeline
-    if model.cfg.get('demo_pipeline', None):
-        test_pipeline = model.cfg.demo_pipeline
-    elif model.cfg.get('test_pipeline', None):
-        test_pipeline = model.cfg.test_pipeline
-    else:
-        test_pipeline = model.cfg.val_pipeline
-
-    # specify start_idx and filename_tmpl
-    test_pipeline[0]['start_idx'] = start_idx
-
-    # prepare data
-    sequence_length = len(glob.glob(osp.join(root_dir, 'color', '*')))
-    root_dir_split = re.split(r'[\\/]', root_dir)
-    gt_folder = [osp.join(root_dir, 'depth', f) for f in sorted(os.listdir(osp.join(root_dir, 'depth')))]
-    guide_folder = [osp.join(root_dir, 'color', f) for f in sorted(os.listdir(osp.join(root_dir, 'color')))]
-    data = dict(
-        guide_path=guide_folder,
-        gt_path=gt_folder,
-        sequence_length=sequence_length)
-
-    # compose the pipeline
-    test_pipeline = Compose(test_pipeline)
-    data = test_pipeline(data)
-    lqs = data['lq'].unsqueeze(0)  # in cpu
-    guides = data['guide'].unsqueeze(0)
+    lqs, guides = load_sequence(model.cfg, root_dir, start_idx)
     # forward the model
     with torch.no_grad():
         if window_size > 0:  # sliding window framework
@@ -86,19 +217,91 @@ def video_inference(model,
             for i in range(0, lqs.size(1) - 2 * (window_size // 2)):
                 lq_i = lqs[:, i:i + window_size].to(device)
                 guide_i = guides[:, i:i + window_size].to(device)
-                result.append(model(lq=lq_i, guide=guide_i, test_mode=True)['output'].cpu())
+                result.append(model_forward(model, lq_i, guide_i, tile_cfg))
+                if writer is not None:
+                    writer.write(i, result[-1].unsqueeze(1))
             result = torch.stack(result, dim=1)
-        else:  # recurrent framework
-            if max_seq_len is None:
-                result = model(
-                    lq=lqs.to(device), guide=guides.to(device), test_mode=True)['output'].cpu()
-            else:
-                result = []
-                for i in range(0, lqs.size(1), max_seq_len):
-                    result.append(
-                        model(
-                            lq=lqs[:, i:i + max_seq_len].to(device),
-                            guide=guides[:, i:i + max_seq_len].to(device),
-                            test_mode=True)['output'].cpu())
-                result = torch.cat(result, dim=1)
+        elif keyframe_cfg is not None:  # recurrent framework on keyframes
+            result, _ = keyframe_inference(model, lqs, guides, device,
+                                           keyframe_cfg, max_seq_len, tile_cfg)
+            if writer is not None:
+                writer.write(0, result)
+        elif memory_budget is None:  # recurrent framework
+            result = _recurrent_inference(model, lqs, guides, device,
+                                          max_seq_len, writer, tile_cfg)
+        else:  # recurrent framework within a memory budget
+            n, t, _, h, w = guides.size()
+            plan = plan_execution(
+                model.generator, t, h, w, memory_budget, n=n,
+                offload=device.type == 'cuda')
+            tile_cfg = None
+            if plan['mode'] == 'tiled':
+                tile_cfg = dict(
+                    tile_size=plan['tile_size'], tile_halo=plan['tile_halo'])
+            with memory_budget_scope(model.generator, memory_budget, device,
+                                     plan):
+                result = _recurrent_inference(model, lqs, guides, device,
+                                              plan['chunk_len'], writer,
+                                              tile_cfg)
     return result
+
+
+def _recurrent_inference(model, lqs, guides, device, max_seq_len, writer,
+                         tile_cfg):
+    """Recurrent inference of a whole sequence, segment by segment."""
+    if max_seq_len is None:
+        result = model_forward(model, lqs.to(device), guides.to(device),
+                               tile_cfg)
+        if writer is not None:
+            writer.write(0, result)
+    else:
+        result = []
+        for i in range(0, lqs.size(1), max_seq_len):
+            result.append(
+                model_forward(
+                    model,
+                    lqs[:, i:i + max_seq_len].to(device),
+                    guides[:, i:i + max_seq_len].to(device),
+                    tile_cfg))
+            if writer is not None:
+                writer.write(i, result[-1])
+        result = torch.cat(result, dim=1)
+    return result
+
+
+def keyframe_inference(model,
+                       lqs,
+                       guides,
+                       device,
+                       keyframe_cfg,
+                       max_seq_len=None,
+                       tile_cfg=None):
+    """Run the model on keyframes and interpolate the other frames.
+
+    The keyframes are chosen by :func:`select_keyframes` and processed as one
+    (shorter) recurrent sequence; the in-between frames warp the outputs of
+    their neighbouring keyframes and fuse them with their own dToF input,
+    see :func:`interpolate_frames`.
+
+    Args:
+        model (nn.Module): The loaded model.
+        lqs (Tensor): LQ sequence with shape (n, t, c, h/s, w/s).
+        guides (Tensor): Guide sequence with shape (n, t, 3, h, w).
+        device (torch.device): Device of the model.
+        keyframe_cfg (dict): Arguments of :func:`select_keyframes`
+            (interval, mode, threshold).
+        max_seq_len (int | None): Maximum number of keyframes processed at
+            once. Default: None.
+        tile_cfg (dict | None): See :func:`model_forward`. Default: None.
+
+    Returns:
+        tuple: The predicted result in cpu and the keyframe indices.
+    """
+    depths = lq_depth(model.generator, lqs)
+    keyframes = select_keyframes(guides, depths, **keyframe_cfg)
+    key_depths = _recurrent_inference(model, lqs[:, keyframes],
+                                      guides[:, keyframes], device,
+                                      max_seq_len, None, tile_cfg)
+    result = interpolate_frames(model.generator, key_depths, guides, depths,
+                                keyframes, device)
+    return result, keyframes
@@ -0,0 +1,145 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+import torch
+import torch.nn.functional as F
+
+from model.common import flow_warp
+
+KEYFRAME_MODES = ('interval', 'guide', 'dtof')
+
+
+def lq_depth(generator, lqs):
+    """Depth of the dToF input, normalized like the generator outputs.
+
+    Args:
+        generator (nn.Module): A DVSR or HVSR generator.
+        lqs (Tensor): Input sequence with shape (n, t, c, h/s, w/s).
+
+    Returns:
+        Tensor: Depth with shape (n, t, 1, h/s, w/s), 0 where invalid.
+    """
+    if hasattr(generator, 'mpeaks'):
+        # first histogram peak, normalized as in HVSR.forward
+        return lqs[:, :, :1] / (generator.temp_res - 1)
+    return lqs
+
+
+def select_keyframes(guides, depths, interval, mode='interval',
+                     threshold=0.05):
+    """Indices of the frames that run the full network.
+
+    - 'interval': every ``interval``-th frame.
+    - 'guide' / 'dtof': a frame becomes a keyframe when the mean absolute
+      change of its guide (RGB in [0, 1]) / dToF depth since the last
+      keyframe exceeds ``threshold``, or ``interval`` frames after it.
+
+    The first and the last frames are always keyframes, so every other frame
+    lies between two of them.
+
+    Args:
+        guides (Tensor): Guide sequence with shape (n, t, 3, h, w).
+        depths (Tensor): dToF depth with shape (n, t, 1, h/s, w/s), see
+            :func:`lq_depth`.
+        interval (int): Keyframe interval, the longest one in the change
+            detection modes.
+        mode (str): 'interval', 'guide' or 'dtof'. Default: 'interval'.
+        threshold (float): Change threshold of the detection modes.
+            Default: 0.05.
+
+    Returns:
+        list[int]: Sorted keyframe indices.
+    """
+    if mode not in KEYFRAME_MODES:
+        raise ValueError(
+            f'mode must be one of {KEYFRAME_MODES}, but got {mode}')
+    if interval < 1:
+        raise ValueError(f'interval must be positive, but got {interval}')
+    t = guides.size(1)
+    if mode == 'interval':
+        keyframes = list(range(0, t, interval))
+    else:
+        frames = guides if mode == 'guide' else depths
+        keyframes = [0]
+        for i in range(1, t):
+            last = keyframes[-1]
+            change = (frames[:, i] - frames[:, last]).abs().mean().item()
+            if i - last >= interval or change > threshold:
+                keyframes.append(i)
+    if keyframes[-1] != t - 1:
+        keyframes.append(t - 1)
+    return keyframes
+
+
+def fuse_lq(depth, lq, scale):
+    """Correct a depth map with the dToF measurement of its frame.
+
+    The difference between the valid dToF blocks and the block averages of
+    ``depth`` is upsampled bilinearly (normalized by the valid blocks) and
+    added to ``depth``, so the fine structure comes from ``depth`` and the
+    block-level values from the measurement.
+
+    Args:
+        depth (Tensor): Depth with shape (n, 1, h, w).
+        lq (Tensor): dToF depth with shape (n, 1, h/s, w/s), 0 where invalid.
+        scale (int): dToF block size s.
+
+    Returns:
+        Tensor: Corrected depth with shape (n, 1, h, w).
+    """
+    valid = (lq > 0).to(depth.dtype)
+    residual = (lq - F.avg_pool2d(depth, scale)) * valid
+
+    def upsample(x):
+        return F.interpolate(
+            x, scale_factor=scale, mode='bilinear', align_corners=False)
+
+    return depth + upsample(residual) / upsample(valid).clamp(min=1e-6)
+
+
+def interpolate_frames(generator, key_depths, guides, depths, keyframes,
+                       device):
+    """Depth of all frames from the depth of the keyframes.
+
+    Every in-between frame warps the depth of its previous and next keyframe
+    with SPyNet flows of the guides. The two are blended with weights linear
+    in time (and the share of the warp inside the image), then corrected with
+    the frame's own dToF measurement by :func:`fuse_lq`.
+
+    Args:
+        generator (nn.Module): A DVSR or HVSR generator (for its SPyNet).
+        key_depths (Tensor): Depth of the keyframes with shape
+            (n, k, 1, h, w).
+        guides (Tensor): Guide sequence with shape (n, t, 3, h, w).
+        depths (Tensor): dToF depth with shape (n, t, 1, h/s, w/s).
+        keyframes (list[int]): Keyframe indices, see
+            :func:`select_keyframes`.
+        device (torch.device): Device of the computation.
+
+    Returns:
+        Tensor: Depth of all frames with shape (n, t, 1, h, w) in cpu.
+    """
+    n, t = guides.shape[:2]
+    spynet = generator.spynet['hg_1']
+    result = key_depths.new_zeros(n, t, *key_depths.shape[2:]).cpu()
+    result[:, keyframes] = key_depths.cpu()
+    for j, (a, b) in enumerate(zip(keyframes[:-1], keyframes[1:])):
+        m = b - a - 1
+        if m == 0:
+            continue
+        # the m in-between frames of all samples form one batch
+        mid = guides[:, a + 1:b].to(device).flatten(0, 1).float()
+        weight = torch.arange(1, m + 1, device=device) / (m + 1)
+        weight = weight.repeat(n).view(-1, 1, 1, 1)
+        num = den = 0
+        for k, key, w in ((a, key_depths[:, j], 1 - weight),
+                          (b, key_depths[:, j + 1], weight)):
+            key = key.to(device).float().repeat_interleave(m, dim=0)
+            supp = guides[:, k].to(device).float().repeat_interleave(m, dim=0)
+            flow = spynet(mid, supp).permute(0, 2, 3, 1)
+            inside = flow_warp(torch.ones_like(key), flow) * w
+            num = num + flow_warp(key, flow) * inside
+            den = den + inside
+        blend = num / den.clamp(min=1e-6)
+        lq = depths[:, a + 1:b].to(device).flatten(0, 1).float()
+        depth = fuse_lq(blend, lq, generator.scale)
+        result[:, a + 1:b] = depth.view(n, m, *depth.shape[1:]).cpu()
+    return result
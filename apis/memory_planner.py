@@ -0,0 +1,144 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+from contextlib import contextmanager
+
+import torch
+from mmcv.utils import print_log
+
+from model.common import estimate_activation_bytes
+from .tiled_inference import auto_tile_size
+
+PLAN_MODES = ('full', 'offload', 'chunked', 'tiled')
+
+
+def plan_execution(generator,
+                   t,
+                   h,
+                   w,
+                   memory_budget,
+                   n=1,
+                   offload=True,
+                   tile_halo=None,
+                   min_chunk_len=8):
+    """Choose how to run a sequence of a DVSR/HVSR generator in a budget.
+
+    The modes are tried from the most to the least faithful one:
+
+    - 'full': all features stay in device memory.
+    - 'offload': the features are kept in host memory (``cpu_cache``).
+    - 'chunked': the sequence is split into independent segments of
+      ``chunk_len`` frames (each of them possibly offloaded).
+    - 'tiled': all frames are processed in spatial tiles, see
+      :func:`tiled_forward`.
+
+    The footprints come from :func:`estimate_activation_bytes`, which
+    follows the current generator options (mid_channels, streaming, flow
+    resolution and storage dtypes).
+
+    Args:
+        generator (nn.Module): A DVSR or HVSR generator.
+        t (int): Number of frames.
+        h (int): Height of the guide.
+        w (int): Width of the guide.
+        memory_budget (int): Memory budget in bytes.
+        n (int): Batch size. Default: 1.
+        offload (bool): Whether offloading to host memory is possible, i.e.
+            the generator runs on CUDA. Default: True.
+        tile_halo (int | None): Halo of the tiles in pixels.
+            Default: 4 * scale.
+        min_chunk_len (int): Shortest segment worth the loss of temporal
+            context; below it, tiling is preferred. Default: 8.
+
+    Returns:
+        dict: 'mode', 'predicted_peak' (bytes), 'chunk_len' and 'tile_size'
+            (None unless chunked or tiled) and 'tile_halo'.
+    """
+    if tile_halo is None:
+        tile_halo = 4 * generator.scale
+
+    def peak(num_frames, height=h, width=w):
+        full = estimate_activation_bytes(generator, num_frames, height, width,
+                                         n=n)
+        if full <= memory_budget or not offload:
+            return full, False
+        return estimate_activation_bytes(
+            generator, num_frames, height, width, n=n, offload=True), True
+
+    plan = dict(chunk_len=None, tile_size=None, tile_halo=tile_halo)
+    predicted, offloaded = peak(t)
+    if predicted <= memory_budget:
+        plan.update(
+            mode='offload' if offloaded else 'full', predicted_peak=predicted)
+        return plan
+
+    # peak() grows with the number of frames, so bisect the chunk length
+    lo, hi, chunk_len = min_chunk_len, t - 1, None
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if peak(mid)[0] <= memory_budget:
+            chunk_len, lo = mid, mid + 1
+        else:
+            hi = mid - 1
+    if chunk_len is not None:
+        plan.update(
+            mode='chunked', chunk_len=chunk_len,
+            predicted_peak=peak(chunk_len)[0])
+        return plan
+
+    tile_size = auto_tile_size(generator, t, h, w, tile_halo, memory_budget,
+                               n)
+    size = tile_size + 2 * tile_halo
+    plan.update(
+        mode='tiled',
+        tile_size=tile_size,
+        predicted_peak=peak(t, min(h, size), min(w, size))[0])
+    return plan
+
+
+def format_plan(plan):
+    """One-line description of a plan of :func:`plan_execution`."""
+    detail = ''
+    if plan['mode'] == 'chunked':
+        detail = f" of {plan['chunk_len']} frames"
+    elif plan['mode'] == 'tiled':
+        detail = f" of {plan['tile_size']} px (halo {plan['tile_halo']} px)"
+    return (f"memory plan: {plan['mode']}{detail}, predicted peak "
+            f"{plan['predicted_peak'] / 2**30:.2f} GiB")
+
+
+@contextmanager
+def memory_budget_scope(generator, memory_budget, device, plan=None,
+                        logger=None):
+    """Run a block with ``generator.memory_budget`` set and log its peak.
+
+    Inside the block the generator chooses its ``cpu_cache`` from the budget.
+    On CUDA, the measured peak of the block is logged next to the predicted
+    peak of ``plan``; on other devices only the plan is logged.
+
+    Yields:
+        dict: Filled with 'measured_peak' (bytes, or None) on exit.
+    """
+    device = torch.device(device)
+    stats = dict(measured_peak=None)
+    if plan is not None:
+        print_log(format_plan(plan), logger)
+    previous = generator.memory_budget
+    generator.memory_budget = memory_budget
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+        torch.cuda.reset_peak_memory_stats(device)
+        start = torch.cuda.memory_allocated(device)
+    try:
+        yield stats
+    finally:
+        generator.memory_budget = previous
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+        stats['measured_peak'] = torch.cuda.max_memory_allocated(
+            device) - start
+        predicted = ''
+        if plan is not None:
+            predicted = (f" (predicted "
+                         f"{plan['predicted_peak'] / 2**30:.2f} GiB)")
+        print_log(
+            f"measured peak {stats['measured_peak'] / 2**30:.2f} GiB"
+            f'{predicted}', logger)
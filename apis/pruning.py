@@ -0,0 +1,200 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+import copy
+from collections import defaultdict
+from functools import partial
+
+import torch
+
+from model.builder import build_backbone
+from model.common import (ResidualBlockNoBN, ResidualBlocksWithInputConv,
+                          SecondOrderDeformableAlignment)
+
+# the deformable alignment splits its 2 * mid_channels input into 16 groups,
+# so every half of mid_channels / 8 channels keeps its own share
+PRUNE_GROUPS = 8
+
+
+def pruned_width(mid_channels, ratio, groups=PRUNE_GROUPS):
+    """Channel number left after pruning a share ``ratio`` of the channels.
+
+    The result is rounded to a multiple of ``groups`` (at least ``groups``).
+    """
+    if not 0 <= ratio < 1:
+        raise ValueError(f'ratio must be in [0, 1), but got {ratio}')
+    if mid_channels % groups:
+        raise ValueError(f'mid_channels must be a multiple of {groups}, '
+                         f'but got {mid_channels}')
+    width = int(round(mid_channels * (1 - ratio) / groups)) * groups
+    return max(groups, width)
+
+
+def channel_importance(generator, calib_inputs):
+    """Importance of the channels of a DVSR/HVSR generator on calibration data.
+
+    The mean absolute activation of every channel is recorded at the outputs
+    of the ``ResidualBlocksWithInputConv`` stacks (feature extraction,
+    propagation backbones, reconstruction, guide encoders) and of the
+    deformable alignments. All these tensors are sliced with one index set by
+    :func:`prune_generator`, since they meet at the concatenations of
+    ``propagate``, ``upsample`` and the stage-2 inputs, so their (normalized)
+    activations are summed into the 'shared' importance. The hidden channels
+    of every ``ResidualBlockNoBN`` are independent and get their own
+    importance: the mean activation after the first convolution times the L1
+    norm of the second convolution weights reading it.
+
+    Args:
+        generator (nn.Module): A DVSR or HVSR generator.
+        calib_inputs (list[tuple[Tensor]]): (lqs, guides) of the calibration
+            sequences, on the device of the generator.
+
+    Returns:
+        dict[str, Tensor]: Importance of the 'shared' channels and of the
+            hidden channels of every residual block (by module name), each
+            with shape (mid_channels, ).
+    """
+    sums = defaultdict(float)
+    counts = defaultdict(int)
+
+    def record(name, hidden, module, inputs, output):
+        output = output.detach().float()
+        if hidden:
+            output = output.clamp(min=0)
+        sums[name] = sums[name] + output.abs().mean(dim=(0, 2, 3)).cpu()
+        counts[name] += 1
+
+    hooks = []
+    for name, module in generator.named_modules():
+        if isinstance(module, (ResidualBlocksWithInputConv,
+                               SecondOrderDeformableAlignment)):
+            hooks.append(
+                module.register_forward_hook(partial(record, name, False)))
+        elif isinstance(module, ResidualBlockNoBN):
+            hooks.append(
+                module.conv1.register_forward_hook(
+                    partial(record, name, True)))
+    try:
+        with torch.no_grad():
+            for lqs, guides in calib_inputs:
+                generator(lqs, guides)
+    finally:
+        for hook in hooks:
+            hook.remove()
+
+    shared = 0
+    importance = {}
+    for name, total in sums.items():
+        mean = total / counts[name]
+        module = generator.get_submodule(name)
+        if isinstance(module, ResidualBlockNoBN):
+            weight = module.conv2.weight.detach().abs().sum(dim=(0, 2, 3))
+            importance[name] = mean * weight.cpu().float()
+        else:
+            shared = shared + mean / mean.sum().clamp(min=1e-12)
+    importance['shared'] = shared
+    return importance
+
+
+def select_channels(importance, width, groups=PRUNE_GROUPS):
+    """Indices of the channels kept by :func:`prune_generator`.
+
+    The 'shared' channels are kept group-wise: the most important
+    ``width / groups`` channels of every contiguous group of
+    ``mid_channels / groups`` channels, so that the channels of every
+    deformable group stay together. The hidden channels of the residual
+    blocks keep their ``width`` most important channels.
+
+    Args:
+        importance (dict[str, Tensor]): See :func:`channel_importance`.
+        width (int): Channels left, a multiple of ``groups``.
+        groups (int): Number of channel groups. Default: 8.
+
+    Returns:
+        dict[str, Tensor]: Sorted indices, with the keys of ``importance``.
+    """
+    if width % groups:
+        raise ValueError(
+            f'width must be a multiple of {groups}, but got {width}')
+    keep = {}
+    for name, score in importance.items():
+        if name == 'shared':
+            score = score.view(groups, -1)
+            idx = score.topk(width // groups, dim=1).indices
+            idx = idx + torch.arange(groups).view(-1, 1) * score.size(1)
+            keep[name] = idx.flatten().sort().values
+        else:
+            keep[name] = score.topk(width).indices.sort().values
+    return keep
+
+
+def _channel_index(keep, mid_channels, chunks, extra, extra_first,
+                   interleave):
+    if interleave:  # upsampling convolution before F.pixel_shuffle
+        return (keep.view(-1, 1) * chunks + torch.arange(chunks)).flatten()
+    offset = extra if extra_first else 0
+    index = [keep + offset + j * mid_channels for j in range(chunks)]
+    extras = torch.arange(extra)
+    if not extra_first:
+        extras = extras + chunks * mid_channels
+    index.insert(0 if extra_first else len(index), extras)
+    return torch.cat(index)
+
+
+def prune_generator(generator, gen_cfg, width, importance):
+    """Structured channel pruning of a DVSR/HVSR generator.
+
+    A generator with ``mid_channels=width`` is built and every parameter is
+    copied from ``generator``, sliced along the dimensions whose size
+    depends on ``mid_channels``. These hold ``k`` blocks of
+    ``mid_channels`` channels (the concatenated branch features in
+    ``propagate`` and ``upsample``) and possibly a few extra input channels
+    (dToF input, optical flows), and are sliced block by block with the same
+    index set. The hidden channels of the residual blocks use their own
+    index sets, and the upsampling convolutions of ``PixelShufflePack`` keep
+    all sub-pixel channels of a kept channel. SPyNet is not pruned.
+
+    Args:
+        generator (nn.Module): A DVSR or HVSR generator.
+        gen_cfg (dict): Its config.
+        width (int): Channels left, see :func:`pruned_width`.
+        importance (dict[str, Tensor]): See :func:`channel_importance`.
+
+    Returns:
+        nn.Module: The pruned generator, on the device of ``generator``.
+    """
+    mid_channels = generator.mid_channels
+    gen_cfg = copy.deepcopy(gen_cfg)
+    gen_cfg['mid_channels'] = width
+    gen_cfg['spynet_pretrained'] = None
+    pruned = build_backbone(gen_cfg)
+    if width == mid_channels:
+        pruned.load_state_dict(generator.state_dict())
+        return pruned.to(next(generator.parameters()).device)
+
+    keep = select_channels(importance, width)
+    state_dict = {}
+    new_shapes = {k: v.shape for k, v in pruned.state_dict().items()}
+    for name, param in generator.state_dict().items():
+        block, _, tail = name.rpartition('.')
+        block, _, conv = block.rpartition('.')
+        for dim, (size, new_size) in enumerate(
+                zip(param.shape, new_shapes[name])):
+            if size == new_size:
+                continue
+            chunks, rem = divmod(size - new_size, mid_channels - width)
+            if rem:
+                raise RuntimeError(f'cannot prune {name} with shape '
+                                   f'{tuple(param.shape)}')
+            hidden = block in keep and (
+                (conv == 'conv1' and dim == 0) or
+                (conv == 'conv2' and dim == 1 and tail == 'weight'))
+            index = _channel_index(
+                keep[block] if hidden else keep['shared'],
+                mid_channels,
+                chunks,
+                size - chunks * mid_channels,
+                extra_first='conv_offset.0.' not in name,
+                interleave=conv == 'upsample_conv' and dim == 0)
+            param = param.index_select(dim, index.to(param.device))
+        state_dict[name] = param
+    pruned.load_state_dict(state_dict)
+    return pruned.to(next(generator.parameters()).device)
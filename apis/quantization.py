@@ -0,0 +1,110 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+from functools import partial
+
+import torch
+
+from model.common import ResidualBlocksWithInputConv, SPyNetBasicModule
+
+QUANT_TARGETS = ('backbone', 'feat_extract', 'reconstruction', 'spynet')
+
+
+def quantizable_modules(generator, targets=QUANT_TARGETS):
+    """Names of the submodules of a generator that are quantized.
+
+    These are the ``ResidualBlocksWithInputConv`` stacks of the 'backbone',
+    'feat_extract' and 'reconstruction' groups and the SPyNet basic modules
+    ('spynet'), which hold most of the FLOPs. The deformable alignment (with
+    its offset convolutions), the guide encoders and the depth/confidence
+    heads are never quantized.
+
+    Args:
+        generator (nn.Module): A DVSR or HVSR generator.
+        targets (Sequence[str]): Groups to quantize, a subset of
+            ``QUANT_TARGETS``. Default: all.
+
+    Returns:
+        list[str]: Dotted names of the submodules.
+    """
+    for target in targets:
+        if target not in QUANT_TARGETS:
+            raise ValueError(
+                f'targets must be in {QUANT_TARGETS}, but got {target}')
+    names = []
+    for name, module in generator.named_modules():
+        group = name.split('.')[0]
+        if group not in targets:
+            continue
+        if isinstance(module, (ResidualBlocksWithInputConv,
+                               SPyNetBasicModule)):
+            names.append(name)
+    return names
+
+
+def _set_submodule(root, name, module):
+    parent, _, child = name.rpartition('.')
+    setattr(root.get_submodule(parent) if parent else root, child, module)
+
+
+def quantize_generator(generator,
+                       calib_inputs,
+                       targets=QUANT_TARGETS,
+                       backend='x86'):
+    """Static int8 post-training quantization of a generator for CPU.
+
+    Every module of :func:`quantizable_modules` is prepared with FX graph
+    mode quantization (per-channel int8 weights, int8 activations), observed
+    while the generator runs on the calibration sequences and converted.
+    The converted modules take and return float tensors, so the rest of the
+    generator, including the deformable alignment offsets and the output
+    heads, keeps running in float.
+
+    Args:
+        generator (nn.Module): A DVSR or HVSR generator; it is moved to CPU
+            and modified in place.
+        calib_inputs (list[tuple[Tensor]]): (lqs, guides) of the calibration
+            sequences.
+        targets (Sequence[str]): See :func:`quantizable_modules`.
+            Default: all.
+        backend (str): Quantized engine, 'x86' or 'fbgemm' (older PyTorch)
+            or 'qnnpack' (ARM). Default: 'x86'.
+
+    Returns:
+        nn.Module: The quantized generator.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    torch.backends.quantized.engine = backend
+    generator = generator.cpu().eval()
+    names = quantizable_modules(generator, targets)
+
+    # example inputs of every module, from a first float run
+    examples = {}
+
+    def record(name, module, inputs):
+        examples.setdefault(name, inputs)
+
+    hooks = [
+        generator.get_submodule(name).register_forward_pre_hook(
+            partial(record, name)) for name in names
+    ]
+    with torch.no_grad():
+        generator(*calib_inputs[0])
+    for hook in hooks:
+        hook.remove()
+    names = [name for name in names if name in examples]
+
+    qconfig_mapping = get_default_qconfig_mapping(backend)
+    for name in names:
+        _set_submodule(
+            generator, name,
+            prepare_fx(
+                generator.get_submodule(name), qconfig_mapping,
+                examples[name]))
+    with torch.no_grad():
+        for lqs, guides in calib_inputs:
+            generator(lqs, guides)
+    for name in names:
+        _set_submodule(generator, name,
+                       convert_fx(generator.get_submodule(name)))
+    return generator
@@ -0,0 +1,221 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+import json
+import os
+import os.path as osp
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+ENCODINGS = ('float32', 'float16', 'uint16_mm')
+LAYOUTS = ('frames', 'memmap')
+
+
+def encode_depth(depth, encoding='float32', depth_range=10.0):
+    """Encode network-unit depth (0-1) for storage.
+
+    Args:
+        depth (np.ndarray): Depth in network units.
+        encoding (str): 'float32', 'float16' or 'uint16_mm'. 'uint16_mm'
+            stores millimeters, i.e. ``depth * depth_range * 1000``.
+        depth_range (float): Metric depth (in meters) that corresponds to a
+            network output of 1. Default: 10.0.
+
+    Returns:
+        np.ndarray: Encoded depth.
+    """
+    if encoding == 'float32':
+        return depth.astype(np.float32, copy=False)
+    if encoding == 'float16':
+        return depth.astype(np.float16)
+    if encoding == 'uint16_mm':
+        mm = np.round(np.clip(depth, 0, None) * (depth_range * 1000.0))
+        return np.clip(mm, 0, np.iinfo(np.uint16).max).astype(np.uint16)
+    raise ValueError(f'encoding must be one of {ENCODINGS}, '
+                     f'but got {encoding}.')
+
+
+def decode_depth(data, encoding='float32', depth_range=10.0):
+    """Inverse of :func:`encode_depth`, returns float32 network units."""
+    if encoding == 'uint16_mm':
+        return data.astype(np.float32) / (depth_range * 1000.0)
+    return data.astype(np.float32)
+
+
+class ResultWriter:
+    """Write restored depth frames with a background thread pool.
+
+    Frames are handed over as soon as the model produces them (see the
+    ``writer`` argument of :func:`apis.video_inference`), so encoding and disk
+    I/O overlap with inference of the following segments. An ``index.json``
+    describing every frame is written on :meth:`close`.
+
+    Args:
+        output_dir (str): Directory to write results to.
+        filename_tmpl (str): Template of per-frame file names, used by the
+            'frames' layout. Default: '{:08d}.npy'.
+        start_idx (int): Index of the first frame. Default: 0.
+        layout (str): 'frames' writes one ``.npy`` per frame with shape
+            (n, c, h, w). 'memmap' writes a single memory-mapped ``.npy`` of
+            shape (t, h, w) per video. Default: 'frames'.
+        encoding (str): 'float32', 'float16' or 'uint16_mm'.
+            Default: 'float32'.
+        depth_range (float): Metric depth (in meters) of a network output of
+            1, only used by 'uint16_mm'. Default: 10.0.
+        num_frames (int | None): Number of frames of the video. Required by
+            the 'memmap' layout. Default: None.
+        memmap_name (str): File name of the memory-mapped array.
+            Default: 'depth.npy'.
+        num_workers (int): Number of writer threads. Default: 2.
+        max_pending (int): Maximum number of frames queued for writing before
+            :meth:`write` blocks. Default: 64.
+    """
+
+    def __init__(self,
+                 output_dir,
+                 filename_tmpl='{:08d}.npy',
+                 start_idx=0,
+                 layout='frames',
+                 encoding='float32',
+                 depth_range=10.0,
+                 num_frames=None,
+                 memmap_name='depth.npy',
+                 num_workers=2,
+                 max_pending=64):
+        if layout not in LAYOUTS:
+            raise ValueError(f'layout must be one of {LAYOUTS}, '
+                             f'but got {layout}.')
+        if encoding not in ENCODINGS:
+            raise ValueError(f'encoding must be one of {ENCODINGS}, '
+                             f'but got {encoding}.')
+        if layout == 'memmap' and num_frames is None:
+            raise ValueError('"num_frames" is required by the memmap layout.')
+
+        self.output_dir = output_dir
+        self.filename_tmpl = filename_tmpl
+        self.start_idx = start_idx
+        self.layout = layout
+        self.encoding = encoding
+        self.depth_range = depth_range
+        self.num_frames = num_frames
+        self.memmap_name = memmap_name
+        self.max_pending = max_pending
+
+        os.makedirs(output_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=num_workers)
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._memmap = None
+        self._frames = {}
+        self._closed = False
+
+    def _open_memmap(self, h, w):
+        with self._lock:
+            if self._memmap is None:
+                self._memmap = np.lib.format.open_memmap(
+                    osp.join(self.output_dir, self.memmap_name),
+                    mode='w+',
+                    dtype=encode_depth(np.zeros(1), self.encoding).dtype,
+                    shape=(self.num_frames, h, w))
+        return self._memmap
+
+    def _write_frame(self, idx, frame):
+        data = encode_depth(frame, self.encoding, self.depth_range)
+        if self.layout == 'frames':
+            filename = self.filename_tmpl.format(idx)
+            np.save(osp.join(self.output_dir, filename), data)
+            entry = dict(file=filename)
+        else:
+            if data.shape[0] * data.shape[1] != 1:
+                raise ValueError('The memmap layout expects a single-channel '
+                                 f'output, but got shape {data.shape}.')
+            memmap = self._open_memmap(*data.shape[2:])
+            memmap[idx - self.start_idx] = data[0, 0]
+            entry = dict(file=self.memmap_name, frame=idx - self.start_idx)
+        entry['shape'] = list(data.shape)
+        with self._lock:
+            self._frames[idx] = entry
+
+    def _wait(self, max_pending):
+        while len(self._pending) > max_pending:
+            self._pending.popleft().result()
+
+    def write(self, start, output):
+        """Queue a segment of restored frames.
+
+        Args:
+            start (int): Frame index (relative to ``start_idx``) of the first
+                frame in ``output``.
+            output (Tensor | np.ndarray): Frames with shape (n, t, c, h, w).
+        """
+        if self._closed:
+            raise RuntimeError('ResultWriter is already closed.')
+        if isinstance(output, torch.Tensor):
+            output = output.detach().cpu().numpy()
+        for i in range(output.shape[1]):
+            idx = self.start_idx + start + i
+            self._pending.append(
+                self._executor.submit(self._write_frame, idx, output[:, i]))
+            self._wait(self.max_pending)
+
+    def close(self):
+        """Wait for all queued frames and write ``index.json``.
+
+        Returns:
+            str: Path of the index file.
+        """
+        if self._closed:
+            return osp.join(self.output_dir, 'index.json')
+        self._wait(0)
+        self._executor.shutdown(wait=True)
+        self._closed = True
+        if self._memmap is not None:
+            self._memmap.flush()
+
+        index = dict(
+            layout=self.layout,
+            encoding=self.encoding,
+            dtype=str(encode_depth(np.zeros(1), self.encoding).dtype),
+            depth_range=self.depth_range,
+            start_idx=self.start_idx,
+            num_frames=len(self._frames),
+            frames={str(k): self._frames[k] for k in sorted(self._frames)})
+        index_path = osp.join(self.output_dir, 'index.json')
+        with open(index_path, 'w') as f:
+            json.dump(index, f, indent=1)
+        return index_path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._executor.shutdown(wait=False)
+            self._closed = True
+
+
+def load_result_frame(output_dir, idx, index=None):
+    """Read a single frame written by :class:`ResultWriter`.
+
+    Args:
+        output_dir (str): Directory containing ``index.json``.
+        idx (int): Absolute frame index.
+        index (dict | None): Already loaded index, to avoid re-reading it.
+
+    Returns:
+        np.ndarray: float32 depth in network units.
+    """
+    if index is None:
+        with open(osp.join(output_dir, 'index.json')) as f:
+            index = json.load(f)
+    entry = index['frames'][str(idx)]
+    path = osp.join(output_dir, entry['file'])
+    if index['layout'] == 'memmap':
+        data = np.load(path, mmap_mode='r')[entry['frame']]
+    else:
+        data = np.load(path)
+    return decode_depth(data, index['encoding'], index['depth_range'])
@@ -0,0 +1,507 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+import glob
+import http.client
+import io
+import json
+import os
+import os.path as osp
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import torch
+
+from .inference import init_model, load_sequence, model_forward
+from .result_writer import ResultWriter
+
+
+class _Segment:
+    """A piece of work for the model: one (lq, guide) pair of batch size 1."""
+
+    def __init__(self, model, lq, guide, start=0, writer=None,
+                 batchable=True):
+        self.model = model
+        self.lq = lq
+        self.guide = guide
+        self.start = start
+        self.writer = writer
+        self.batchable = batchable
+        self.request = [self]  # all segments of the request
+        self.future = Future()
+        self.submitted = time.perf_counter()
+
+    def batch_key(self):
+        return (self.model, tuple(self.lq.shape), tuple(self.guide.shape))
+
+
+class InferenceService:
+    """Keep DVSR/HVSR models warm and run queued requests in batches.
+
+    Every model is built and loaded once. Requests are split into segments of
+    at most ``max_seq_len`` frames (like :func:`video_inference`), queued, and
+    a single worker thread stacks up to ``max_batch`` queued segments of the
+    same model and shape along the batch dimension. Segments whose result
+    would depend on the rest of the batch run alone: those of models with
+    ``refine_mode`` other than 'always' (the stage-1 error is pooled over the
+    batch) and mirror-extended ones (the mirror check covers the whole
+    batch). Results of sequence requests are written with
+    :class:`ResultWriter` as soon as a segment finishes.
+
+    Args:
+        models (dict): Model name -> (config, checkpoint).
+        device (str | torch.device): Device of all models. Default: 'cuda:0'.
+        max_batch (int): Maximum number of segments per forward.
+            Default: 4.
+        batch_timeout (float): Seconds to wait for compatible segments after
+            the first one of a batch arrived. Default: 0.01.
+        max_seq_len (int | None): Default segment length of sequence
+            requests. Default: None (whole sequence).
+        tile_cfg (dict | None): Tiling of every forward, see
+            :func:`model_forward`. Default: None.
+        latency_window (int): Number of recent requests used for the latency
+            statistics. Default: 1000.
+    """
+
+    def __init__(self,
+                 models,
+                 device='cuda:0',
+                 max_batch=4,
+                 batch_timeout=0.01,
+                 max_seq_len=None,
+                 tile_cfg=None,
+                 latency_window=1000):
+        self.device = torch.device(device)
+        self.models = {
+            name: init_model(config, checkpoint, device=self.device)
+            for name, (config, checkpoint) in models.items()
+        }
+        self.max_batch = max_batch
+        self.batch_timeout = batch_timeout
+        self.max_seq_len = max_seq_len
+        self.tile_cfg = tile_cfg
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._latencies = deque(maxlen=latency_window)
+        self._counts = dict(requests=0, segments=0, batches=0, errors=0)
+        self._started = time.time()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    # ----------------------------------------------------------- requests
+    def _check_model(self, model):
+        if model not in self.models:
+            raise KeyError(f'unknown model {model}, '
+                           f'available: {sorted(self.models)}')
+
+    def _batchable(self, model, lq):
+        """Whether a segment can share a forward with other requests."""
+        generator = self.models[model].generator
+        if getattr(generator, 'refine_mode', 'always') != 'always':
+            return False
+        if lq.size(1) % 2 == 0:
+            lq_1, lq_2 = torch.chunk(lq, 2, dim=1)
+            return not torch.equal(lq_1, lq_2.flip(1))
+        return True
+
+    def _submit(self, model, lqs, guides, writer=None, max_seq_len=None):
+        max_seq_len = max_seq_len or lqs.size(1)
+        segments = [
+            _Segment(model, lqs[:, i:i + max_seq_len],
+                     guides[:, i:i + max_seq_len], i, writer,
+                     self._batchable(model, lqs[:, i:i + max_seq_len]))
+            for i in range(0, lqs.size(1), max_seq_len)
+        ]
+        for s in segments:
+            s.request = segments
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('the service is closed')
+            self._queue.extend(segments)
+            self._counts['requests'] += 1
+            self._cond.notify()
+        return segments
+
+    def infer_arrays(self, model, lq, guide, max_seq_len=None):
+        """Restore an in-memory sequence.
+
+        Args:
+            model (str): Model name.
+            lq (Tensor | np.ndarray): LQ sequence with shape (t, c, h/s, w/s)
+                or (1, t, c, h/s, w/s).
+            guide (Tensor | np.ndarray): Guide sequence with shape
+                (t, 3, h, w) or (1, t, 3, h, w).
+
+        Returns:
+            Tensor: Restored depth with shape (1, t, 1, h, w) in cpu.
+        """
+        self._check_model(model)
+        start = time.perf_counter()
+        lq, guide = [
+            torch.as_tensor(x).float()[None] if x.ndim == 4 else
+            torch.as_tensor(x).float() for x in (lq, guide)
+        ]
+        segments = self._submit(model, lq, guide, None, max_seq_len
+                                or self.max_seq_len)
+        result = torch.cat([s.future.result() for s in segments], dim=1)
+        self._latencies.append(time.perf_counter() - start)
+        return result
+
+    def infer_sequence(self,
+                       model,
+                       input_dir,
+                       output_dir,
+                       start_idx=0,
+                       filename_tmpl='{:08d}.npy',
+                       max_seq_len=None,
+                       **writer_cfg):
+        """Restore a sequence directory and write the results.
+
+        Args:
+            model (str): Model name.
+            input_dir (str): Directory with 'color' and 'depth' sub-folders.
+            output_dir (str): Directory of the results.
+            writer_cfg (dict): Other arguments of :class:`ResultWriter`
+                (layout, encoding, depth_range, num_workers).
+
+        Returns:
+            dict: Output directory, number of frames and latency in seconds.
+        """
+        self._check_model(model)
+        start = time.perf_counter()
+        lqs, guides = load_sequence(self.models[model].cfg, input_dir,
+                                    start_idx)
+        writer = ResultWriter(
+            output_dir,
+            filename_tmpl=filename_tmpl,
+            start_idx=start_idx,
+            num_frames=len(glob.glob(osp.join(input_dir, 'color', '*'))),
+            **writer_cfg)
+        with writer:
+            segments = self._submit(model, lqs, guides, writer, max_seq_len
+                                    or self.max_seq_len)
+            for s in segments:
+                s.future.result()
+        latency = time.perf_counter() - start
+        self._latencies.append(latency)
+        return dict(
+            output_dir=output_dir,
+            index=osp.join(output_dir, 'index.json'),
+            num_frames=lqs.size(1),
+            latency=latency)
+
+    # ------------------------------------------------------------- worker
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return None
+            batch = [self._queue.popleft()]
+            if not batch[0].batchable:
+                return batch
+            deadline = time.perf_counter() + self.batch_timeout
+            while len(batch) < self.max_batch:
+                match = [
+                    s for s in self._queue if s.batchable
+                    and s.batch_key() == batch[0].batch_key()
+                ]
+                if match:
+                    for s in match[:self.max_batch - len(batch)]:
+                        self._queue.remove(s)
+                        batch.append(s)
+                    continue
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 or self._closed:
+                    break
+                self._cond.wait(remaining)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                model = self.models[batch[0].model]
+                lq = torch.cat([s.lq for s in batch]).to(self.device)
+                guide = torch.cat([s.guide for s in batch]).to(self.device)
+                with torch.no_grad():
+                    output = model_forward(model, lq, guide, self.tile_cfg)
+            except Exception as e:  # report to the waiting requests
+                for s in batch:
+                    self._fail(s, e)
+            else:
+                for i, s in enumerate(batch):
+                    if s.future.done():  # its request failed meanwhile
+                        continue
+                    try:
+                        if s.writer is not None:
+                            s.writer.write(s.start, output[i:i + 1])
+                        s.future.set_result(output[i:i + 1])
+                    except Exception as e:  # only this request fails
+                        self._fail(s, e)
+            self._counts['segments'] += len(batch)
+            self._counts['batches'] += 1
+
+    def _fail(self, segment, error):
+        """Fail the request of a segment and drop its queued segments."""
+        if segment.future.done():
+            return
+        self._counts['errors'] += 1
+        with self._cond:
+            for s in segment.request:
+                if s in self._queue:
+                    self._queue.remove(s)
+                if not s.future.done():
+                    s.future.set_exception(error)
+
+    # -------------------------------------------------------------- stats
+    def health(self):
+        return dict(
+            status='closed' if self._closed else 'ok',
+            models=sorted(self.models),
+            device=str(self.device))
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1,
+                                 int(p / 100 * len(latencies)))]
+
+        return dict(
+            queue_depth=len(self._queue),
+            uptime=time.time() - self._started,
+            mean_batch_size=self._counts['segments'] /
+            max(self._counts['batches'], 1),
+            latency=dict(
+                count=len(latencies),
+                mean=sum(latencies) / len(latencies) if latencies else None,
+                p50=percentile(50),
+                p95=percentile(95),
+                max=latencies[-1] if latencies else None),
+            **self._counts)
+
+    def close(self):
+        """Finish the queued segments and stop the worker."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join()
+
+
+def _dump_arrays(**arrays):
+    buf = io.BytesIO()
+    np.savez(buf, **arrays)
+    return buf.getvalue()
+
+
+def _load_arrays(data):
+    with np.load(io.BytesIO(data)) as f:
+        return {k: f[k] for k in f.files}
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """HTTP front end of an :class:`InferenceService`.
+
+    GET  /health, /stats
+    POST /infer/sequence       JSON body with the arguments of
+                               :meth:`InferenceService.infer_sequence`
+    POST /infer/arrays?model=  ``np.savez`` body with 'lq' and 'guide',
+                               answered with an ``np.savez`` body of 'output'
+    """
+
+    service = None
+
+    def address_string(self):
+        # unix sockets have no (host, port) client address
+        return str(self.client_address) if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, code, body, content_type='application/json'):
+        if content_type == 'application/json':
+            body = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/health':
+            self._send(200, self.service.health())
+        elif path == '/stats':
+            self._send(200, self.service.stats())
+        else:
+            self._send(404, dict(error=f'unknown path {path}'))
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            if url.path == '/infer/sequence':
+                self._send(200, self.service.infer_sequence(**json.loads(body)))
+            elif url.path == '/infer/arrays':
+                query = parse_qs(url.query)
+                arrays = _load_arrays(body)
+                output = self.service.infer_arrays(
+                    query['model'][0], arrays['lq'], arrays['guide'],
+                    int(query['max_seq_len'][0])
+                    if 'max_seq_len' in query else None)
+                self._send(200, _dump_arrays(output=output.numpy()),
+                           'application/octet-stream')
+            else:
+                self._send(404, dict(error=f'unknown path {url.path}'))
+        except (KeyError, TypeError, ValueError) as e:
+            self._send(400, dict(error=repr(e)))
+        except Exception as e:
+            self._send(500, dict(error=repr(e)))
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn,
+                      socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(service, host='127.0.0.1', port=8000, unix_socket=None):
+    """Serve an :class:`InferenceService` until interrupted.
+
+    Args:
+        service (:obj:`InferenceService`): The service.
+        host (str): Host of the TCP server. Default: '127.0.0.1'.
+        port (int): Port of the TCP server. Default: 8000.
+        unix_socket (str | None): Serve on this unix socket instead of TCP.
+            Default: None.
+    """
+    handler = type('Handler', (_RequestHandler, ), dict(service=service))
+    if unix_socket is not None:
+        if osp.exists(unix_socket):
+            os.remove(unix_socket)
+        server = _UnixHTTPServer(unix_socket, handler)
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if unix_socket is not None and osp.exists(unix_socket):
+            os.remove(unix_socket)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+class InferenceClient:
+    """Client of a server started with :func:`serve`.
+
+    Args:
+        host (str): Server host. Default: '127.0.0.1'.
+        port (int): Server port. Default: 8000.
+        unix_socket (str | None): Connect to this unix socket instead.
+            Default: None.
+        timeout (float | None): Socket timeout in seconds. Default: None.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8000, unix_socket=None,
+                 timeout=None):
+        self.host = host
+        self.port = port
+        self.unix_socket = unix_socket
+        self.timeout = timeout
+
+    def _request(self, method, path, body=None, content_type=None):
+        if self.unix_socket is not None:
+            conn = _UnixHTTPConnection(self.unix_socket, self.timeout)
+        else:
+            conn = http.client.HTTPConnection(
+                self.host, self.port, timeout=self.timeout)
+        try:
+            headers = {} if content_type is None else {
+                'Content-Type': content_type
+            }
+            conn.request(method, path, body=body, headers=headers)
+            resp = conn.getresponse()
+            data = resp.read()
+            if resp.status != 200:
+                raise RuntimeError(
+                    f'{method} {path} failed ({resp.status}): '
+                    f'{data.decode(errors="replace")}')
+            return data, resp.getheader('Content-Type')
+        finally:
+            conn.close()
+
+    def health(self):
+        return json.loads(self._request('GET', '/health')[0])
+
+    def stats(self):
+        return json.loads(self._request('GET', '/stats')[0])
+
+    def infer_sequence(self, model, input_dir, output_dir, **kwargs):
+        body = json.dumps(
+            dict(model=model, input_dir=input_dir, output_dir=output_dir,
+                 **kwargs)).encode()
+        return json.loads(
+            self._request('POST', '/infer/sequence', body,
+                          'application/json')[0])
+
+    def infer_arrays(self, model, lq, guide, max_seq_len=None):
+        path = f'/infer/arrays?model={model}'
+        if max_seq_len is not None:
+            path += f'&max_seq_len={max_seq_len}'
+        body = _dump_arrays(lq=np.asarray(lq), guide=np.asarray(guide))
+        data = self._request('POST', path, body, 'application/octet-stream')[0]
+        return _load_arrays(data)['output']
+
+
+class LocalInferenceClient:
+    """In-process stand-in for :class:`InferenceClient`.
+
+    Same interface, but calls an :class:`InferenceService` directly (with
+    the same serialization of arrays), so that code using the client can be
+    tested without a socket.
+    """
+
+    def __init__(self, service):
+        self.service = service
+
+    def health(self):
+        return json.loads(json.dumps(self.service.health()))
+
+    def stats(self):
+        return json.loads(json.dumps(self.service.stats()))
+
+    def infer_sequence(self, model, input_dir, output_dir, **kwargs):
+        return self.service.infer_sequence(model, input_dir, output_dir,
+                                           **kwargs)
+
+    def infer_arrays(self, model, lq, guide, max_seq_len=None):
+        arrays = _load_arrays(
+            _dump_arrays(lq=np.asarray(lq), guide=np.asarray(guide)))
+        output = self.service.infer_arrays(model, arrays['lq'],
+                                           arrays['guide'], max_seq_len)
+        return _load_arrays(_dump_arrays(output=output.numpy()))['output']
@@ -0,0 +1,179 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+import math
+
+import torch
+
+from model.common import estimate_activation_bytes
+
+
+def _tile_spans(size, tile, halo):
+    """Split [0, size) into cores of at most ``tile`` pixels, extended by
+    ``halo`` pixels on every side that has a neighbour.
+
+    Returns:
+        list[tuple[int]]: (start, end, core_start, core_end) of every tile.
+    """
+    num_tiles = max(1, math.ceil(size / tile))
+    spans = []
+    for i in range(num_tiles):
+        core_start = i * tile
+        core_end = min(size, core_start + tile)
+        spans.append((max(0, core_start - halo), min(size, core_end + halo),
+                      core_start, core_end))
+    return spans
+
+
+def _ramp(start, end, core_start, core_end, size, halo, device):
+    """1D blending weights of a tile span.
+
+    Adjacent tiles overlap by 2 * halo pixels around their common core border,
+    where the weights ramp linearly and sum up to one.
+    """
+    x = torch.arange(start, end, device=device, dtype=torch.float32) + 0.5
+    weight = torch.ones_like(x)
+    if halo > 0:
+        if core_start > 0:
+            weight = torch.minimum(
+                weight, (x - (core_start - halo)) / (2 * halo))
+        if core_end < size:
+            weight = torch.minimum(
+                weight, ((core_end + halo) - x) / (2 * halo))
+    return weight.clamp(min=1e-3)
+
+
+def auto_tile_size(generator, t, h, w, tile_halo, memory_budget, n=1):
+    """Pick the largest block-aligned tile whose estimated footprint fits.
+
+    Args:
+        generator (nn.Module): A DVSR or HVSR generator.
+        t (int): Number of frames processed at once.
+        h (int): Height of the guide.
+        w (int): Width of the guide.
+        tile_halo (int): Halo (overlap) in pixels on each tile side.
+        memory_budget (int): Memory budget in bytes.
+        n (int): Batch size. Default: 1.
+
+    Returns:
+        int | None: Tile size in pixels (a multiple of ``generator.scale``),
+            or None if the full frame fits into the budget.
+    """
+    scale = generator.scale
+    if estimate_activation_bytes(generator, t, h, w, n=n) <= memory_budget:
+        return None
+    tile = (max(h, w) // scale) * scale
+    while tile > scale:
+        tile -= scale
+        size = tile + 2 * tile_halo
+        if estimate_activation_bytes(
+                generator, t, min(h, size), min(w, size),
+                n=n) <= memory_budget:
+            return tile
+    raise RuntimeError(
+        f'A single {scale}x{scale} tile with a halo of {tile_halo} pixels '
+        f'does not fit into the memory budget of {memory_budget} bytes. '
+        'Reduce the sequence length (max_seq_len) or the halo.')
+
+
+def tiled_forward(generator,
+                  lqs,
+                  guides,
+                  tile_size=None,
+                  tile_halo=None,
+                  memory_budget=None):
+    """Run a DVSR/HVSR generator on overlapping spatial tiles.
+
+    Every tile runs the full spatio-temporal network on all frames. Tiles are
+    aligned to the dToF blocks (multiples of ``generator.scale``), extended by
+    a halo and linearly blended inside the overlap.
+
+    Args:
+        generator (nn.Module): A DVSR or HVSR generator.
+        lqs (Tensor): LQ sequence with shape (n, t, c, h/s, w/s).
+        guides (Tensor): Guide sequence with shape (n, t, 3, h, w).
+        tile_size (int | None): Core tile size in pixels. If None, it is
+            chosen from ``memory_budget``. Default: None.
+        tile_halo (int | None): Halo in pixels added on every side of a tile.
+            Default: 4 * scale.
+        memory_budget (int | None): Memory budget in bytes used to choose the
+            tile size. Defaults to the free memory of the current CUDA device.
+
+    Returns:
+        Tensor: Blended output with shape (n, t, 1, h, w).
+    """
+    scale = generator.scale
+    n, t, _, h, w = guides.size()
+    if tile_halo is None:
+        tile_halo = 4 * scale
+    if tile_halo % scale != 0:
+        raise ValueError(f'tile_halo ({tile_halo}) must be a multiple of the '
+                         f'dToF scale ({scale}).')
+    if tile_size is None:
+        if memory_budget is None:
+            if not guides.is_cuda:
+                raise ValueError('"memory_budget" is required to choose the '
+                                 'tile size on cpu.')
+            memory_budget = int(0.9 * torch.cuda.mem_get_info(
+                guides.device)[0])
+        tile_size = auto_tile_size(generator, t, h, w, tile_halo,
+                                   memory_budget, n)
+        if tile_size is None:
+            return generator(lqs, guides)[0]
+    if tile_size % scale != 0:
+        raise ValueError(f'tile_size ({tile_size}) must be a multiple of the '
+                         f'dToF scale ({scale}).')
+
+    output = None
+    weights = guides.new_zeros(1, 1, 1, h, w)
+    for y0, y1, cy0, cy1 in _tile_spans(h, tile_size, tile_halo):
+        wy = _ramp(y0, y1, cy0, cy1, h, tile_halo, guides.device)
+        for x0, x1, cx0, cx1 in _tile_spans(w, tile_size, tile_halo):
+            wx = _ramp(x0, x1, cx0, cx1, w, tile_halo, guides.device)
+            if hasattr(generator, 'pos_window'):
+                generator.pos_window = dict(origin=(y0, x0), frame_size=(h, w))
+            try:
+                out = generator(
+                    lqs[..., y0 // scale:y1 // scale, x0 // scale:x1 // scale],
+                    guides[..., y0:y1, x0:x1])[0]
+            finally:
+                if hasattr(generator, 'pos_window'):
+                    generator.pos_window = None
+            if output is None:
+                output = out.new_zeros(n, t, out.size(2), h, w)
+            weight = (wy[:, None] * wx[None, :]).to(out.dtype)
+            output[..., y0:y1, x0:x1] += out * weight
+            weights[..., y0:y1, x0:x1] += weight
+    return output / weights
+
+
+def tiled_equivalence_report(generator,
+                             lqs,
+                             guides,
+                             tile_size,
+                             tile_halo=None,
+                             atol=1e-3):
+    """Compare tiled against untiled inference on a frame that fits.
+
+    Args:
+        generator (nn.Module): A DVSR or HVSR generator.
+        lqs (Tensor): LQ sequence with shape (n, t, c, h/s, w/s).
+        guides (Tensor): Guide sequence with shape (n, t, 3, h, w).
+        tile_size (int): Core tile size in pixels.
+        tile_halo (int | None): Halo in pixels. Default: 4 * scale.
+        atol (float): Absolute tolerance (in network depth units) under which
+            a pixel counts as equivalent. Default: 1e-3.
+
+    Returns:
+        dict: 'error_map' (per-pixel absolute difference with shape
+            (n, t, 1, h, w)), 'max_abs_err', 'mean_abs_err', 'rmse' and
+            'within_atol' (fraction of pixels within ``atol``).
+    """
+    with torch.no_grad():
+        reference = generator(lqs, guides)[0]
+        tiled = tiled_forward(generator, lqs, guides, tile_size, tile_halo)
+    error_map = (tiled - reference).abs()
+    return dict(
+        error_map=error_map.cpu(),
+        max_abs_err=error_map.max().item(),
+        mean_abs_err=error_map.mean().item(),
+        rmse=error_map.pow(2).mean().sqrt().item(),
+        within_atol=(error_map <= atol).float().mean().item())
@@ -291,7 +291,7 @@ def _non_dist_train(model,
     model = MMDataParallel(model, device_ids=range(cfg.gpus))
 
     # build runner
-    optimizer = build_optimizers(model, cfg.optimizers)
+    optimizer = build_optimizer(model, cfg.optimizers)
     runner = IterBasedRunner(
         model,
         optimizer=optimizer,
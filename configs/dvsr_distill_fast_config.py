@@ -0,0 +1,20 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# Reduced DVSR (48 channels, 5 blocks) distilled from the full DVSR. Compare
+# the speed and accuracy of the tiers with tools/benchmark_distill.py.
+_base_ = ['./dvsr_config.py']
+
+exp_name = 'dvsr_distill_fast_tartan'
+
+model = dict(
+    type='DistillRestorer',
+    generator=dict(mid_channels=48, num_blocks=5, num_prop_iters=2),
+    teacher=dict(
+        type='DVSR',
+        mid_channels=64,
+        num_blocks=7,
+        scale=16,
+        is_low_res_input=True),
+    teacher_pretrained='chkpts/dvsr_tartan.pth',
+    distill_weights=dict(output=1.0, d_depth=0.5, rgb_depth=0.5),
+    gt_weight=1.0)
+work_dir = f'./work_dirs/{exp_name}'
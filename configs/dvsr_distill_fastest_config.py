@@ -0,0 +1,9 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# Reduced DVSR (32 channels, 3 blocks, a single backward/forward propagation
+# iteration) distilled from the full DVSR.
+_base_ = ['./dvsr_distill_fast_config.py']
+
+exp_name = 'dvsr_distill_fastest_tartan'
+
+model = dict(generator=dict(mid_channels=32, num_blocks=3, num_prop_iters=1))
+work_dir = f'./work_dirs/{exp_name}'
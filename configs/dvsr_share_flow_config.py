@@ -0,0 +1,9 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# DVSR with a single SPyNet whose flows are shared by both stages. Convert
+# existing checkpoints with tools/convert_share_flow.py.
+_base_ = ['./dvsr_config.py']
+
+exp_name = 'dvsr_share_flow_tartan'
+
+model = dict(generator=dict(share_flow=True))
+work_dir = f'./work_dirs/{exp_name}'
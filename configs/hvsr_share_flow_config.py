@@ -0,0 +1,9 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# HVSR with a single SPyNet whose flows are shared by both stages. Convert
+# existing checkpoints with tools/convert_share_flow.py.
+_base_ = ['./hvsr_config.py']
+
+exp_name = 'hvsr_share_flow_tartan'
+
+model = dict(generator=dict(share_flow=True))
+work_dir = f'./work_dirs/{exp_name}'
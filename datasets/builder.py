@@ -13,7 +13,6 @@ from mmcv.utils import build_from_cfg
 from packaging import version
 from torch.utils.data import ConcatDataset, DataLoader
 from torch.utils.data import DistributedSampler as _DistributedSampler
-from mmseg.core.utils import sync_random_seed
 from .registry import DATASETS
 
 if platform.system() != 'Windows':
@@ -179,6 +178,7 @@ class DistributedSampler(_DistributedSampler):
         # in the same order based on the same seed. Then different ranks
         # could use different indices to select non-overlapped data from the
         # same data list.
+        from mmseg.core.utils import sync_random_seed  # training only
         self.seed = sync_random_seed(seed)
 
         # to avoid padding bug when meeting too small dataset
@@ -8,12 +8,8 @@ import sys
 import mmcv
 import numpy as np
 from mmcv.utils import print_log
-from mmseg.datasets import CustomDataset
 from .registry import DATASETS
 from .pipelines import Compose
-from mmseg.utils import get_root_logger
-from terminaltables import AsciiTable
-from tqdm import tqdm
 import torch
 from torch.utils.data import Dataset
 import os
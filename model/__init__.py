@@ -8,8 +8,10 @@ from .common import *
 from .losses import *
 from .registry import BACKBONES, COMPONENTS, LOSSES, MODELS
 from .basic_restorer import BasicRestorer
+from .distill_restorer import DistillRestorer
 
 __all__ = [
-    'BaseModel', 'BasicRestorer', 'build', 'build_backbone', 'build_component',
-    'build_loss', 'build_model', 'BACKBONES', 'COMPONENTS', 'LOSSES', 'MODELS'
+    'BaseModel', 'BasicRestorer', 'DistillRestorer', 'build', 'build_backbone',
+    'build_component', 'build_loss', 'build_model', 'BACKBONES', 'COMPONENTS',
+    'LOSSES', 'MODELS'
 ]
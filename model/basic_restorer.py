@@ -4,6 +4,7 @@ import numpy as np
 import os.path as osp
 
 import mmcv
+import torch
 from mmcv.runner import auto_fp16
 
 from .base import BaseModel
@@ -82,11 +83,7 @@ class BasicRestorer(BaseModel):
         """
         losses = dict()
         output, intermed = self.generator(lq, guide)
-        loss_pix = self.pixel_loss(output, gt)
-        if self.current_iters <= 50000:
-            loss_pix += 0.1 * self.pixel_loss(intermed['d_depth'], gt)
-            loss_pix += 0.1 * self.pixel_loss(intermed['rgb_depth'], gt)
-        losses['loss_pix'] = loss_pix
+        losses['loss_pix'] = self.gt_loss(output, intermed, gt)
         outputs = dict(
             losses=losses,
             num_samples=len(gt.data),
@@ -94,6 +91,16 @@ class BasicRestorer(BaseModel):
         self.current_iters += 1
         return outputs
 
+    def gt_loss(self, output, intermed, gt):
+        """Pixel loss of the output and, for the first 50k iterations, of the
+        stage-1 ('rgb_depth') and stage-2 ('d_depth') depths against the
+        ground truth."""
+        loss_pix = self.pixel_loss(output, gt)
+        if self.current_iters <= 50000:
+            loss_pix += 0.1 * self.pixel_loss(intermed['d_depth'], gt)
+            loss_pix += 0.1 * self.pixel_loss(intermed['rgb_depth'], gt)
+        return loss_pix
+
     def evaluate(self, output, gt):
         """Evaluation function.
 
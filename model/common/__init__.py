@@ -1,10 +1,19 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates.
+from .buffers import ConcatBuffer
 from .conv import *  # noqa: F401, F403
 from .downsample import pixel_unshuffle
-from .flow_warp import flow_warp, SPyNetBasicModule, SPyNet
+from .feature_store import FEATURE_TIERS, FeatureList, FeatureStore
+from .flow_warp import (flow_warp, flow_warp_batched, SPyNetBasicModule,
+                        SPyNet)
+from .guide_cache import GuideCache
+from .memory import estimate_activation_bytes, reconstruction_chunk
+from .precision import STORAGE_DTYPES, fp32_region, from_storage, to_storage
 from .model_utils import (extract_around_bbox, extract_bbox_patch, scale_bbox,
                           set_requires_grad)
-from .second_order_deform import SecondOrderDeformableAlignment
+from .second_order_deform import (DEFORM_BACKENDS,
+                                  SecondOrderDeformableAlignment,
+                                  grid_sample_deform_conv2d,
+                                  set_deform_backend)
 from .upsample import PixelShufflePack
 
 __all__ = [
@@ -13,4 +22,10 @@ __all__ = [
     'extract_around_bbox', 'set_requires_grad', 'scale_bbox',
     'flow_warp', 'pixel_unshuffle', 'SecondOrderDeformableAlignment',
     'SPyNet', 'SPyNetBasicModule', 'ResidualBlocksWithInputConv',
+    'ResidualBlockNoBN',
+    'estimate_activation_bytes', 'fp32_region', 'DEFORM_BACKENDS',
+    'grid_sample_deform_conv2d', 'set_deform_backend', 'ConcatBuffer',
+    'flow_warp_batched', 'FEATURE_TIERS', 'FeatureList', 'FeatureStore',
+    'STORAGE_DTYPES', 'from_storage', 'to_storage', 'reconstruction_chunk',
+    'GuideCache',
 ]
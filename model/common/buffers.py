@@ -0,0 +1,46 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+from functools import reduce
+
+import torch
+
+
+class ConcatBuffer:
+    """A reusable output tensor for ``torch.cat(tensors, dim=1)``.
+
+    The buffer is allocated once and refilled on every call, so it must only
+    be used without autograd, and its content is only valid until the next
+    call. Its dtype and memory format follow the rules of ``torch.cat``, so
+    the consumers of the buffer see exactly the tensor ``torch.cat`` would
+    have produced.
+    """
+
+    def __init__(self):
+        self.buffer = None
+
+    def cat(self, tensors):
+        first = tensors[0]
+        shape = list(first.shape)
+        shape[1] = sum(t.size(1) for t in tensors)
+        dtype = reduce(torch.promote_types, [t.dtype for t in tensors])
+        # like torch.cat: channels_last only if all inputs are channels_last
+        memory_format = torch.contiguous_format
+        if all(t.dim() == 4 and not t.is_contiguous()
+               and t.is_contiguous(memory_format=torch.channels_last)
+               for t in tensors):
+            memory_format = torch.channels_last
+        buf = self.buffer
+        if (buf is None or list(buf.shape) != shape or buf.dtype != dtype
+                or buf.device != first.device
+                or not buf.is_contiguous(memory_format=memory_format)):
+            buf = torch.empty(
+                shape,
+                dtype=dtype,
+                device=first.device,
+                memory_format=memory_format)
+            self.buffer = buf
+
+        start = 0
+        for t in tensors:
+            buf[:, start:start + t.size(1)].copy_(t)
+            start += t.size(1)
+        return buf
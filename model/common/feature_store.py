@@ -0,0 +1,326 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+FEATURE_TIERS = ('device', 'host', 'disk')
+
+
+def _is_channels_last(tensor):
+    return (tensor.dim() == 4 and not tensor.is_contiguous()
+            and tensor.is_contiguous(memory_format=torch.channels_last))
+
+
+class DeviceTier:
+    """Keep the features where they were computed."""
+
+    def __init__(self):
+        self.data = {}
+
+    def write(self, slot, tensor):
+        self.data[slot] = tensor
+
+    def read(self, slot, device):
+        return self.data[slot]
+
+    def free(self, slot):
+        self.data.pop(slot, None)
+
+    def close(self):
+        self.data.clear()
+
+
+class HostTier(DeviceTier):
+    """Keep the features in host memory (pinned if they come from CUDA)."""
+
+    def write(self, slot, tensor):
+        tensor = tensor.detach()
+        if tensor.is_cuda:
+            host = torch.empty_like(tensor, device='cpu', pin_memory=True)
+            host.copy_(tensor)
+            tensor = host
+        self.data[slot] = tensor
+
+    def read(self, slot, device):
+        return self.data[slot].to(device, non_blocking=True)
+
+
+class DiskTier:
+    """Keep the features in a memory-mapped file with one row per slot.
+
+    The file is created on the first write, from the shape and dtype of that
+    feature; all features of a branch share them.
+
+    Args:
+        path (str): File path.
+        capacity (int): Number of rows (slots) of the file.
+    """
+
+    def __init__(self, path, capacity):
+        self.path = path
+        self.capacity = capacity
+        self.array = None
+
+    def write(self, slot, tensor):
+        tensor = tensor.detach().cpu()
+        if self.array is None:
+            self.dtype = tensor.dtype
+            self.channels_last = _is_channels_last(tensor)
+            self.array = np.memmap(
+                self.path,
+                dtype=self._numpy(tensor).dtype,
+                mode='w+',
+                shape=(self.capacity, ) + tuple(tensor.shape))
+        self.array[slot] = self._numpy(tensor)
+
+    def read(self, slot, device):
+        tensor = torch.from_numpy(np.array(self.array[slot]))
+        if self.dtype == torch.bfloat16:
+            tensor = tensor.view(torch.bfloat16)
+        if self.channels_last:
+            tensor = tensor.contiguous(memory_format=torch.channels_last)
+        return tensor.to(device)
+
+    def free(self, slot):
+        pass
+
+    def close(self):
+        if self.array is not None:
+            self.array.flush()
+            self.array = None
+
+    @staticmethod
+    def _numpy(tensor):
+        # numpy has no bfloat16, store the raw 16 bits
+        if tensor.dtype == torch.bfloat16:
+            tensor = tensor.view(torch.int16)
+        return tensor.numpy()
+
+
+class FeatureList:
+    """A list of per-frame features kept in a storage tier.
+
+    It supports the list operations of the generators (``append``, indexing,
+    item assignment, ``pop``, ``reverse`` and ``len``); ``None`` entries are
+    placeholders of released features. Reads return tensors on ``device``.
+
+    All tier operations run in order on ``executor`` (if given), so writes
+    do not block the caller and the reads declared with :meth:`schedule`
+    are loaded ahead in the background.
+
+    Args:
+        tier: Storage tier (:class:`DeviceTier`, :class:`HostTier` or
+            :class:`DiskTier`).
+        device (torch.device): Device of the tensors returned by reads.
+        executor (ThreadPoolExecutor | None): Single worker running the tier
+            operations. Default: None (synchronous).
+        prefetch (int): Number of scheduled reads loaded ahead. Default: 2.
+        keep_recent (int): Number of the last written features also kept on
+            ``device``, e.g. for the second-order neighbour. Default: 2.
+    """
+
+    def __init__(self, tier, device, executor=None, prefetch=2,
+                 keep_recent=2):
+        self.tier = tier
+        self.device = device
+        self.executor = executor
+        self.prefetch = prefetch
+        self.keep_recent = keep_recent if executor is not None else 0
+        self.slots = []
+        self._free_slots = []
+        self._num_slots = 0
+        self._recent = {}
+        self._pending = {}
+        self._writes = {}
+        self._order = []
+        self._cursor = 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __iter__(self):
+        for index in range(len(self.slots)):
+            yield self[index]
+
+    def __getitem__(self, index):
+        tensor = self._load(self.slots[index])
+        self._advance(index)
+        return tensor
+
+    def __setitem__(self, index, tensor):
+        old = self.slots[index]
+        self.slots[index] = self._store(tensor)
+        if old is not None:
+            self._release(old)
+
+    def append(self, tensor):
+        self.slots.append(self._store(tensor))
+
+    def pop(self, index=-1):
+        slot = self.slots.pop(index)
+        tensor = self._load(slot)
+        if slot is not None:
+            self._release(slot)
+        self._advance(index)
+        return tensor
+
+    def reverse(self):
+        self.slots.reverse()
+
+    def schedule(self, order):
+        """Declare the indices that will be read next, in this order."""
+        self._order = list(order)
+        self._cursor = 0
+        self._prefetch()
+
+    def close(self):
+        for slot in self.slots:
+            if slot is not None:
+                self._release(slot)
+        self.slots = []
+        self._run(self.tier.close)
+        for future in self._writes.values():
+            future.result()
+        self._writes.clear()
+
+    def _run(self, fn, *args):
+        if self.executor is None:
+            return fn(*args)
+        return self.executor.submit(fn, *args)
+
+    def _store(self, tensor):
+        if tensor is None:
+            return None
+        if self._free_slots:
+            slot = self._free_slots.pop()
+        else:
+            slot = self._num_slots
+            self._num_slots += 1
+        if self.keep_recent:
+            self._recent[slot] = tensor
+            while len(self._recent) > self.keep_recent:
+                del self._recent[next(iter(self._recent))]
+        write = self._run(self.tier.write, slot, tensor)
+        if write is not None:
+            # surface the errors of the background writes
+            previous = self._writes.pop(slot, None)
+            if previous is not None:
+                previous.result()
+            self._writes[slot] = write
+        return slot
+
+    def _release(self, slot):
+        self._recent.pop(slot, None)
+        self._pending.pop(slot, None)
+        self._run(self.tier.free, slot)
+        self._free_slots.append(slot)
+
+    def _load(self, slot):
+        if slot is None:
+            return None
+        if slot in self._recent:
+            return self._recent[slot]
+        if self.executor is None:
+            return self.tier.read(slot, self.device)
+        future = self._pending.pop(slot, None)
+        if future is None:
+            future = self.executor.submit(self.tier.read, slot, self.device)
+        return future.result()
+
+    def _advance(self, index):
+        if (self._cursor < len(self._order)
+                and self._order[self._cursor] == index):
+            self._cursor += 1
+            self._prefetch()
+
+    def _prefetch(self):
+        if self.executor is None:
+            return
+        for index in self._order[self._cursor:self._cursor + self.prefetch]:
+            if not -len(self.slots) <= index < len(self.slots):
+                continue
+            slot = self.slots[index]
+            if slot is None or slot in self._recent or slot in self._pending:
+                continue
+            self._pending[slot] = self.executor.submit(
+                self.tier.read, slot, self.device)
+
+
+class FeatureStore(dict):
+    """The ``feats`` dict of DVSR/HVSR with every branch in a FeatureList.
+
+    Assigning a list to a branch name stores its features in the tier, so
+    the generators use the store like the plain dict of lists. The 'host'
+    and 'disk' tiers keep at most ``prefetch + keep_recent`` features of a
+    branch on the compute device; with 'disk' the host memory is bounded as
+    well.
+
+    Args:
+        tier (str): 'device', 'host' or 'disk'.
+        capacity (int): Maximum number of frames of a branch.
+        device (torch.device): Device of the tensors returned by reads.
+        root (str | None): Directory of the memory-mapped files of the 'disk'
+            tier. Default: None (system temporary directory).
+        prefetch (int): Number of features of a branch loaded ahead.
+            Default: 2.
+    """
+
+    def __init__(self, tier, capacity, device, root=None, prefetch=2):
+        super().__init__()
+        if tier not in FEATURE_TIERS:
+            raise ValueError(
+                f'tier must be one of {FEATURE_TIERS}, but got {tier}')
+        if tier != 'device' and torch.is_grad_enabled():
+            raise RuntimeError(
+                f"the '{tier}' tier detaches the features, it is only "
+                'supported without autograd')
+        self.tier = tier
+        self.capacity = capacity
+        self.device = device
+        self.prefetch = prefetch
+        self.executor = None
+        self.dir = None
+        if tier != 'device':
+            self.executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='feature_store')
+        if tier == 'disk':
+            self.dir = tempfile.mkdtemp(prefix='dvsr_feats_', dir=root)
+
+    @property
+    def offload(self):
+        """Whether the features leave the compute device."""
+        return self.tier != 'device'
+
+    def __setitem__(self, name, features):
+        if name in self:
+            self[name].close()
+        if self.tier == 'device':
+            tier = DeviceTier()
+        elif self.tier == 'host':
+            tier = HostTier()
+        else:
+            tier = DiskTier(f'{self.dir}/{name}.dat', self.capacity)
+        feature_list = FeatureList(
+            tier, self.device, self.executor, prefetch=self.prefetch)
+        for feature in features:
+            feature_list.append(feature)
+        super().__setitem__(name, feature_list)
+
+    def schedule(self, name, order):
+        """Declare the read order of a branch for the background prefetch."""
+        self[name].schedule(order)
+
+    def close(self):
+        """Release all features and remove the files of the 'disk' tier."""
+        for feature_list in self.values():
+            feature_list.close()
+        self.clear()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        if self.dir is not None:
+            shutil.rmtree(self.dir, ignore_errors=True)
+            self.dir = None
@@ -3,9 +3,42 @@ import torch
 from torch import nn
 import torch.nn.functional as F
 from mmcv.cnn import ConvModule
-from mmseg.utils import get_root_logger
 from mmcv.runner import load_checkpoint
 
+from .precision import fp32_region
+
+_BASE_GRIDS = {}
+
+
+def is_compiling():
+    """Whether the code is being captured by ``torch.compile``."""
+    compiler = getattr(torch, 'compiler', None)
+    return bool(
+        getattr(compiler, 'is_compiling', None) and compiler.is_compiling())
+
+
+def _base_grid(h, w, device, dtype):
+    """Pixel coordinates (x, y) with shape (h, w, 2), cached per size.
+
+    The grid is kept in pixels (not normalized to [-1, 1]) so that
+    :func:`flow_warp` computes exactly the same sampling positions as with a
+    freshly built grid.
+    """
+    key = (h, w, device, dtype)
+    grid = _BASE_GRIDS.get(key)
+    if grid is None or torch.jit.is_tracing() or is_compiling():
+        # create mesh grid
+        grid_y, grid_x = torch.meshgrid(
+            torch.arange(0, h, device=device), torch.arange(0, w, device=device))
+        grid = torch.stack((grid_x, grid_y), 2).to(dtype)
+        if torch.jit.is_tracing() or is_compiling():
+            return grid
+        if len(_BASE_GRIDS) >= 16:
+            _BASE_GRIDS.clear()
+        _BASE_GRIDS[key] = grid
+    return grid
+
+
 def flow_warp(x,
               flow,
               interpolation='bilinear',
@@ -30,24 +63,47 @@ def flow_warp(x,
     if x.size()[-2:] != flow.size()[1:3]:
         raise ValueError(f'The spatial sizes of input ({x.size()[-2:]}) and '
                          f'flow ({flow.size()[1:3]}) are not the same.')
+    # bf16/fp16 features are warped in float32, other dtypes as they are
+    out_dtype = x.dtype
+    if x.dtype in (torch.float16, torch.bfloat16):
+        x = x.float()
+    flow = flow.type_as(x)
     _, _, h, w = x.size()
-    # create mesh grid
-    grid_y, grid_x = torch.meshgrid(torch.arange(0, h), torch.arange(0, w))
-    grid = torch.stack((grid_x, grid_y), 2).type_as(x)  # (h, w, 2)
-    grid.requires_grad = False
+    grid = _base_grid(h, w, x.device, x.dtype)  # (h, w, 2)
 
     grid_flow = grid + flow
     # scale grid_flow to [-1,1]
     grid_flow_x = 2.0 * grid_flow[:, :, :, 0] / max(w - 1, 1) - 1.0
     grid_flow_y = 2.0 * grid_flow[:, :, :, 1] / max(h - 1, 1) - 1.0
     grid_flow = torch.stack((grid_flow_x, grid_flow_y), dim=3)
-    output = F.grid_sample(
-        x,
-        grid_flow,
-        mode=interpolation,
-        padding_mode=padding_mode,
-        align_corners=align_corners)
-    return output
+    with fp32_region(x):
+        output = F.grid_sample(
+            x,
+            grid_flow,
+            mode=interpolation,
+            padding_mode=padding_mode,
+            align_corners=align_corners)
+    return output.to(out_dtype)
+
+
+def flow_warp_batched(xs, flows, **kwargs):
+    """Warp several tensors of the same shape with a single ``grid_sample``.
+
+    Equivalent to ``[flow_warp(x, flow) for x, flow in zip(xs, flows)]``;
+    every sample is warped independently, so the results are identical.
+
+    Args:
+        xs (list[Tensor]): Tensors with size (n, c, h, w).
+        flows (list[Tensor]): Flows with size (n, h, w, 2).
+        kwargs (dict): Other arguments of :func:`flow_warp`.
+
+    Returns:
+        list[Tensor]: Warped tensors.
+    """
+    if len(xs) == 1 or len({(x.shape, x.dtype) for x in xs}) > 1:
+        return [flow_warp(x, flow, **kwargs) for x, flow in zip(xs, flows)]
+    out = flow_warp(torch.cat(xs, dim=0), torch.cat(flows, dim=0), **kwargs)
+    return list(torch.split(out, xs[0].size(0), dim=0))
 
 
 class SPyNet(nn.Module):
@@ -71,6 +127,7 @@ class SPyNet(nn.Module):
             [SPyNetBasicModule() for _ in range(6)])
 
         if isinstance(pretrained, str):
+            from mmseg.utils import get_root_logger
             logger = get_root_logger()
             load_checkpoint(self, pretrained, strict=True, logger=logger)
         elif pretrained is not None:
@@ -84,45 +141,46 @@ class SPyNet(nn.Module):
             'std',
             torch.Tensor([0.229, 0.224, 0.225]).view(1, 3, 1, 1))
 
-    def compute_flow(self, ref, supp):
-        """Compute flow from ref to supp.
-
-        Note that in this function, the images are already resized to a
-        multiple of 32.
+    def build_pyramid(self, img):
+        """Normalize an image and build its 6-level pyramid.
 
         Args:
-            ref (Tensor): Reference image with shape of (n, 3, h, w).
-            supp (Tensor): Supporting image with shape of (n, 3, h, w).
+            img (Tensor): Image with shape of (n, 3, h, w), h and w being a
+                multiple of 32.
 
         Returns:
-            Tensor: Estimated optical flow: (n, 2, h, w).
+            list[Tensor]: The pyramid, from the coarsest (1/32) to the full
+                resolution.
         """
-        n, _, h, w = ref.size()
-
-        # normalize the input images
-        ref = [(ref - self.mean) / self.std]
-        supp = [(supp - self.mean) / self.std]
-
-        # generate downsampled frames
+        pyramid = [(img - self.mean) / self.std]
         for level in range(5):
-            ref.append(
+            pyramid.append(
                 F.avg_pool2d(
-                    input=ref[-1],
+                    input=pyramid[-1],
                     kernel_size=2,
                     stride=2,
                     count_include_pad=False))
-            supp.append(
-                F.avg_pool2d(
-                    input=supp[-1],
-                    kernel_size=2,
-                    stride=2,
-                    count_include_pad=False))
-        ref = ref[::-1]
-        supp = supp[::-1]
+        return pyramid[::-1]
+
+    def flow_from_pyramids(self, ref, supp, skip_levels=0):
+        """Compute flow from ref to supp given their pyramids.
+
+        Args:
+            ref (list[Tensor]): Pyramid of the reference images, see
+                :meth:`build_pyramid`.
+            supp (list[Tensor]): Pyramid of the supporting images.
+            skip_levels (int): Number of the finest pyramid levels that are
+                not computed. Default: 0.
+
+        Returns:
+            Tensor: Estimated optical flow: (n, 2, h / 2**skip_levels,
+                w / 2**skip_levels), in pixels of that resolution.
+        """
+        n, _, h, w = ref[-1].size()
 
         # flow computation
         flow = ref[0].new_zeros(n, 2, h // 32, w // 32)
-        for level in range(len(ref)):
+        for level in range(len(ref) - skip_levels):
             if level == 0:
                 flow_up = flow
             else:
@@ -144,44 +202,189 @@ class SPyNet(nn.Module):
 
         return flow
 
-    def forward(self, ref, supp):
-        """Forward function of SPyNet.
+    def compute_flow(self, ref, supp, skip_levels=0):
+        """Compute flow from ref to supp.
 
-        This function computes the optical flow from ref to supp.
+        Note that in this function, the images are already resized to a
+        multiple of 32.
 
         Args:
             ref (Tensor): Reference image with shape of (n, 3, h, w).
             supp (Tensor): Supporting image with shape of (n, 3, h, w).
+            skip_levels (int): Number of the finest pyramid levels that are
+                not computed. Default: 0.
 
         Returns:
-            Tensor: Estimated optical flow: (n, 2, h, w).
+            Tensor: Estimated optical flow: (n, 2, h / 2**skip_levels,
+                w / 2**skip_levels), in pixels of that resolution.
         """
+        return self.flow_from_pyramids(
+            self.build_pyramid(ref), self.build_pyramid(supp), skip_levels)
 
-        # upsize to a multiple of 32
-        h, w = ref.shape[2:4]
+    @staticmethod
+    def _resize_input(img):
+        """Upsize an image to a multiple of 32."""
+        h, w = img.shape[2:4]
         w_up = w if (w % 32) == 0 else 32 * (w // 32 + 1)
         h_up = h if (h % 32) == 0 else 32 * (h // 32 + 1)
-        ref = F.interpolate(
-            input=ref, size=(h_up, w_up), mode='bilinear', align_corners=False)
-        supp = F.interpolate(
-            input=supp,
-            size=(h_up, w_up),
-            mode='bilinear',
-            align_corners=False)
-
-        # compute flow, and resize back to the original resolution
+        return F.interpolate(
+            input=img, size=(h_up, w_up), mode='bilinear', align_corners=False)
+
+    @staticmethod
+    def _resize_flow(flow, size, skip_levels=0):
+        """Resize a flow of the upsized input back to the input size."""
+        h, w = size
+        h_up, w_up = flow.shape[2:4]
+        h_out, w_out = h // 2**skip_levels, w // 2**skip_levels
         flow = F.interpolate(
-            input=self.compute_flow(ref, supp),
-            size=(h, w),
-            mode='bilinear',
+            input=flow, size=(h_out, w_out), mode='bilinear',
             align_corners=False)
 
         # adjust the flow values
-        flow[:, 0, :, :] *= float(w) / float(w_up)
-        flow[:, 1, :, :] *= float(h) / float(h_up)
-
+        flow[:, 0, :, :] *= float(w_out) / float(w_up)
+        flow[:, 1, :, :] *= float(h_out) / float(h_up)
         return flow
 
+    def forward(self, ref, supp, skip_levels=0):
+        """Forward function of SPyNet.
+
+        This function computes the optical flow from ref to supp.
+
+        Args:
+            ref (Tensor): Reference image with shape of (n, 3, h, w).
+            supp (Tensor): Supporting image with shape of (n, 3, h, w).
+            skip_levels (int): Stop the pyramid this many levels early and
+                return the flow at (h / 2**skip_levels, w / 2**skip_levels),
+                in pixels of that resolution. Default: 0.
+
+        Returns:
+            Tensor: Estimated optical flow: (n, 2, h, w).
+        """
+
+        # upsize to a multiple of 32, compute flow, and resize back to the
+        # original resolution
+        flow = self.compute_flow(
+            self._resize_input(ref), self._resize_input(supp), skip_levels)
+        return self._resize_flow(flow, ref.shape[2:4], skip_levels)
+
+    @staticmethod
+    def static_pairs(frames, threshold, factor=8):
+        """Find the pairs of neighbouring frames that are (nearly) static.
+
+        Args:
+            frames (Tensor): Sequence with shape of (n, t, 3, h, w).
+            threshold (float): A pair is static when the mean absolute
+                difference of its frames, average-pooled by ``factor``, is
+                below it (in the units of ``frames``).
+            factor (int): Downsampling factor of the comparison. Default: 8.
+
+        Returns:
+            Tensor: Boolean mask of the static pairs with shape (n, t - 1).
+        """
+        n, t, c, h, w = frames.size()
+        small = F.adaptive_avg_pool2d(
+            frames.reshape(-1, c, h, w),
+            (max(1, h // factor), max(1, w // factor))).view(n, t, -1)
+        return (small[:, 1:] - small[:, :-1]).abs().mean(dim=2) < threshold
+
+    def compute_flow_sequence(self,
+                              frames,
+                              skip_levels=0,
+                              with_forward=True,
+                              per_pair=False,
+                              static=None):
+        """Flows between all neighbouring frames of a sequence.
+
+        Every frame is resized, normalized and pyramided once, instead of
+        once per pair and direction. The flows are identical to calling
+        :meth:`forward` on the pairs: all pairs of one direction are batched
+        together (or, with ``per_pair``, every pair is computed on its own),
+        like the generators did before. With ``per_pair`` only the pyramids
+        of two neighbouring frames are kept.
+
+        Args:
+            frames (Tensor): Sequence with shape of (n, t, 3, h, w).
+            skip_levels (int): See :meth:`forward`. Default: 0.
+            with_forward (bool): Also compute the flows from every frame to
+                its previous frame. Default: True.
+            per_pair (bool): Compute one pair at a time, which needs less
+                memory. Default: False.
+            static (Tensor | None): Boolean mask with shape (n, t - 1) of the
+                pairs whose flows are zero without running SPyNet, e.g. from
+                :meth:`static_pairs`. Default: None.
+
+        Returns:
+            tuple[Tensor]: Flows from every frame to the next one
+                (backward-time propagation) and, if ``with_forward``, from
+                every frame to the previous one (otherwise None), each with
+                shape (n, t - 1, 2, h / 2**skip_levels, w / 2**skip_levels).
+        """
+        n, t, c, h, w = frames.size()
+        flow_shape = (2, h // 2**skip_levels, w // 2**skip_levels)
+
+        def pyramid_of(img):
+            return self.build_pyramid(self._resize_input(img))
+
+        def flow_of(ref, supp):
+            return self._resize_flow(
+                self.flow_from_pyramids(ref, supp, skip_levels), (h, w),
+                skip_levels)
+
+        if per_pair:
+            # keep the pyramids of two neighbouring frames only
+            flows_backward, flows_forward = [], []
+            pyramid_1 = pyramid_of(frames[:, 0])
+            for i in range(t - 1):
+                if static is not None and static[:, i].all():
+                    zeros = frames.new_zeros(n, *flow_shape)
+                    flows_backward.append(zeros)
+                    if with_forward:
+                        flows_forward.append(zeros)
+                    pyramid_1 = None
+                    continue
+                if pyramid_1 is None:
+                    pyramid_1 = pyramid_of(frames[:, i])
+                pyramid_2 = pyramid_of(frames[:, i + 1])
+                flows_backward.append(flow_of(pyramid_1, pyramid_2))
+                if with_forward:
+                    flows_forward.append(flow_of(pyramid_2, pyramid_1))
+                if static is not None:
+                    moving = (~static[:, i]).view(n, 1, 1, 1)
+                    flows_backward[-1] = flows_backward[-1] * moving
+                    if with_forward:
+                        flows_forward[-1] = flows_forward[-1] * moving
+                pyramid_1 = pyramid_2
+            flows_backward = torch.stack(flows_backward, dim=1)
+            flows_forward = (
+                torch.stack(flows_forward, dim=1) if with_forward else None)
+            return flows_backward, flows_forward
+
+        pyramid = pyramid_of(frames.reshape(-1, c, h, w))
+        pyramid = [p.view(n, t, *p.shape[1:]) for p in pyramid]
+        pyramid_1 = [p[:, :-1].reshape(-1, *p.shape[2:]) for p in pyramid]
+        pyramid_2 = [p[:, 1:].reshape(-1, *p.shape[2:]) for p in pyramid]
+        moving = None
+        if static is not None:
+            # only the moving pairs go through SPyNet
+            moving = (~static).flatten().nonzero().squeeze(1)
+            pyramid_1 = [p[moving] for p in pyramid_1]
+            pyramid_2 = [p[moving] for p in pyramid_2]
+
+        def flow_of_pairs(ref, supp):
+            if moving is None:
+                flows = flow_of(ref, supp)
+            else:
+                flows = frames.new_zeros(n * (t - 1), *flow_shape)
+                if moving.numel() > 0:
+                    flows[moving] = flow_of(ref, supp)
+            return flows.view(n, t - 1, *flows.shape[1:])
+
+        flows_backward = flow_of_pairs(pyramid_1, pyramid_2)
+        flows_forward = None
+        if with_forward:
+            flows_forward = flow_of_pairs(pyramid_2, pyramid_1)
+        return flows_backward, flows_forward
+
 
 class SPyNetBasicModule(nn.Module):
     """Basic Module for SPyNet.
@@ -0,0 +1,167 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+import hashlib
+import os
+import os.path as osp
+import time
+import weakref
+from collections import OrderedDict
+
+import torch
+
+
+def _tensor_digest(tensor):
+    """Hash of the content, dtype and shape of a tensor."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f'{tensor.dtype}{tuple(tensor.shape)}'.encode())
+    tensor = tensor.detach().cpu().contiguous()
+    if tensor.dtype == torch.bfloat16:
+        tensor = tensor.view(torch.int16)
+    digest.update(tensor.numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _to(value, device):
+    if isinstance(value, (tuple, list)):
+        return type(value)(_to(v, device) for v in value)
+    return None if value is None else value.to(device)
+
+
+def _nbytes(value):
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(v) for v in value)
+    return 0 if value is None else value.numel() * value.element_size()
+
+
+class GuideCache:
+    """Cache of the intermediates of DVSR/HVSR that only depend on the guides.
+
+    The SPyNet flows and the stage-1 guide features (``conv_guide_init
+    ['hg_1']``) are stored under a key made of a content hash of the guides,
+    a hash of the weights of the module computing them and the generator
+    options they depend on, so runs of the same video with other dToF inputs
+    (e.g. simulator sweeps) reuse them. Entries are kept in host memory or,
+    with ``root``, in files that later processes reuse as well.
+
+    The cache is bypassed with autograd enabled.
+
+    Args:
+        root (str | None): Directory of the cache files. Default: None
+            (host memory only).
+        max_bytes (int | None): Size limit of the in-memory entries, the
+            least recently used ones are dropped first. Default: None
+            (unlimited).
+    """
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self._digests = {}
+        if root is not None:
+            os.makedirs(root, exist_ok=True)
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Reset 'hits', 'misses' and 'seconds_saved' of :attr:`stats`."""
+        self.stats = dict(hits=0, misses=0, seconds_saved=0.0)
+
+    @property
+    def hit_rate(self):
+        lookups = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / lookups if lookups else 0.0
+
+    def digest(self, tensor):
+        """Content hash of a tensor, memoized while it is not modified."""
+        ref, version, digest = self._digests.get(id(tensor), (None, ) * 3)
+        if ref is None or ref() is not tensor or version != tensor._version:
+            digest = _tensor_digest(tensor)
+            if len(self._digests) >= 64:
+                self._digests = {
+                    k: v for k, v in self._digests.items()
+                    if v[0]() is not None
+                }
+            self._digests[id(tensor)] = (weakref.ref(tensor),
+                                         tensor._version, digest)
+        return digest
+
+    def module_digest(self, module):
+        """Hash of the parameters and buffers of a module."""
+        tensors = list(module.named_parameters()) + list(module.named_buffers())
+        return self.key(*(f'{name}:{self.digest(tensor)}'
+                          for name, tensor in tensors))
+
+    @staticmethod
+    def key(*parts):
+        """Cache key of a list of parts (converted with ``str``)."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update('|'.join(str(part) for part in parts).encode())
+        return digest.hexdigest()
+
+    def fetch(self, key, compute, device):
+        """Return the cached value of ``key`` or compute and cache it.
+
+        Args:
+            key (str): Cache key.
+            compute (callable): Computes the value: a tensor or a tuple of
+                tensors (or None).
+            device (torch.device): Device of the returned tensors.
+        """
+        if torch.is_grad_enabled():
+            return compute()
+        start = time.perf_counter()
+        entry = self._get(key)
+        if entry is not None:
+            value = _to(entry['value'], device)
+            _synchronize(device)
+            self.stats['hits'] += 1
+            self.stats['seconds_saved'] += entry['seconds'] - (
+                time.perf_counter() - start)
+            return value
+        self.stats['misses'] += 1
+        start = time.perf_counter()
+        value = compute()
+        _synchronize(device)
+        seconds = time.perf_counter() - start
+        self._put(key, dict(value=_to(value, 'cpu'), seconds=seconds))
+        return value
+
+    def clear(self):
+        """Drop the in-memory entries (the files are kept)."""
+        self.entries.clear()
+        self.nbytes = 0
+        self._digests.clear()
+
+    def _path(self, key):
+        return osp.join(self.root, f'{key}.pth')
+
+    def _get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        if self.root is not None and osp.exists(self._path(key)):
+            entry = torch.load(self._path(key), map_location='cpu')
+            self._remember(key, entry)
+            return entry
+        return None
+
+    def _put(self, key, entry):
+        if self.root is not None:
+            # write to a temporary name first, readers never see partial files
+            tmp = f'{self._path(key)}.{os.getpid()}.tmp'
+            torch.save(entry, tmp)
+            os.replace(tmp, self._path(key))
+        self._remember(key, entry)
+
+    def _remember(self, key, entry):
+        self.entries[key] = entry
+        self.nbytes += _nbytes(entry['value'])
+        while (self.max_bytes is not None and self.nbytes > self.max_bytes
+               and len(self.entries) > 1):
+            _, old = self.entries.popitem(last=False)
+            self.nbytes -= _nbytes(old['value'])
+
+
+def _synchronize(device):
+    if torch.device(device).type == 'cuda':
+        torch.cuda.synchronize(device)
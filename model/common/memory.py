@@ -0,0 +1,90 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+
+
+def estimate_activation_bytes(generator, t, h, w, n=1, offload=False,
+                              dtype_bytes=4):
+    """Estimate the peak activation memory of a DVSR/HVSR forward pass.
+
+    The estimate is a coarse, deliberately conservative model of what
+    ``hg_forward`` keeps alive: the guides and stage inputs, the per-frame
+    features of the five branches (spatial, backward_1, forward_1, backward_2,
+    forward_2) at 1/4 resolution, the optical flows and the transient tensors
+    of the batched guide encoder and SPyNet. It follows the generator options
+    that change these terms: ``num_prop_iters`` (two branches per iteration),
+    ``stream_reconstruction`` (no list for the last forward branch),
+    ``flow_resolution`` (flows and SPyNet at 1/4 resolution unless 'full')
+    and the 16-bit ``feature_dtype``/``flow_dtype`` storage.
+
+    Args:
+        generator (nn.Module): A DVSR or HVSR generator.
+        t (int): Number of frames.
+        h (int): Height of the guide (full resolution).
+        w (int): Width of the guide (full resolution).
+        n (int): Batch size. Default: 1.
+        offload (bool): Whether the intermediate features are offloaded from
+            the compute device (``cpu_cache`` mode). Default: False.
+        dtype_bytes (int): Bytes per element. Default: 4.
+
+    Returns:
+        int: Estimated peak in bytes.
+    """
+    c = generator.mid_channels
+    hw = h * w
+    q = hw / 16.
+    # channels of the stage-2 guide input: depth, confidence (+ positional
+    # encoding and histogram error for HVSR)
+    extra = 9 if hasattr(generator, 'mpeaks') else 2
+    # guides, stage-2 inputs and depth/confidence outputs of both stages
+    inputs = (3 + extra + 4) * hw
+    # stored features and flows relative to float32
+    feat_ratio = 0.5 if getattr(generator, 'feature_dtype', None) else 1.
+    flow_ratio = 0.5 if getattr(generator, 'flow_dtype', None) else 1.
+    full_flow = getattr(generator, 'flow_resolution', 'full') == 'full'
+    # branch features of the running stage and stage-1 fused features
+    branches = 1 + 2 * getattr(generator, 'num_prop_iters', 2)
+    if getattr(generator, 'stream_reconstruction', False):
+        branches -= 1
+    feats = (branches * feat_ratio + 1) * c * q
+    # flows in both directions: SPyNet output, then the stored 1/4 flows
+    flows = (4 * hw if full_flow else 0) + 4 * q * flow_ratio
+    # first guide-encoder convolution / SPyNet finest level, per frame
+    transient = max(1.25 * c * hw, 104 * (hw if full_flow else q))
+    # reconstruction of one frame up to full resolution
+    recon = 2 * 64 * hw
+
+    if offload:
+        per_frame = inputs
+        fixed = transient + recon + 12 * c * q
+    else:
+        per_frame = inputs + feats + flows + transient
+        fixed = recon
+    return int(n * (fixed + t * per_frame) * dtype_bytes)
+
+
+def reconstruction_chunk(generator, t, h, w, memory_budget, n=1,
+                         dtype_bytes=4):
+    """Number of frames whose reconstruction fits into a memory budget.
+
+    :func:`estimate_activation_bytes` accounts for the reconstruction of a
+    single frame; what is left of the budget is spent on further frames
+    stacked along the batch.
+
+    Args:
+        generator (nn.Module): A DVSR or HVSR generator.
+        t (int): Number of frames.
+        h (int): Height of the guide (full resolution).
+        w (int): Width of the guide (full resolution).
+        memory_budget (int): Memory budget in bytes.
+        n (int): Batch size. Default: 1.
+        dtype_bytes (int): Bytes per element. Default: 4.
+
+    Returns:
+        int: Number of frames, between 1 and ``t``.
+    """
+    c = generator.mid_channels
+    hw = h * w
+    base = estimate_activation_bytes(
+        generator, t, h, w, n=n, dtype_bytes=dtype_bytes)
+    # concatenated branch features, fused features and both upsamplings
+    per_frame = n * (6 * c * hw / 16. + 2 * 64 * hw) * dtype_bytes
+    return int(max(1, min(t, 1 + (memory_budget - base) // per_frame)))
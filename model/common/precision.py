@@ -0,0 +1,35 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+import torch
+
+
+def fp32_region(tensor):
+    """Context manager that disables autocast on the device of ``tensor``.
+
+    Optical flow, flow warping, deformable offsets and the confidence softmax
+    are numerically sensitive, so they stay in float32 when the rest of the
+    network runs under bf16/fp16 autocast.
+
+    Args:
+        tensor (Tensor): A tensor on the device that runs the computation.
+    """
+    return torch.autocast(device_type=tensor.device.type, enabled=False)
+
+
+STORAGE_DTYPES = {'float16': torch.float16, 'bfloat16': torch.bfloat16}
+
+
+def to_storage(tensor, dtype):
+    """Cast a float32 tensor to the 16-bit storage ``dtype``.
+
+    Tensors of other dtypes, ``None`` and ``dtype=None`` pass through.
+    """
+    if dtype is None or tensor is None or tensor.dtype != torch.float32:
+        return tensor
+    return tensor.to(dtype)
+
+
+def from_storage(tensor, dtype):
+    """Upcast a tensor kept in the storage ``dtype`` back to float32."""
+    if dtype is None or tensor is None or tensor.dtype != dtype:
+        return tensor
+    return tensor.float()
@@ -1,14 +1,111 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates.
-import copy
+import math
 
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 from mmcv.cnn import constant_init
-from mmcv.cnn import ConvModule, build_activation_layer
-from mmcv.ops import ModulatedDeformConv2d, modulated_deform_conv2d
+from torch.nn.modules.utils import _pair
 
-class SecondOrderDeformableAlignment(ModulatedDeformConv2d):
+from .flow_warp import is_compiling
+from .precision import fp32_region
+
+try:
+    from mmcv.ops import modulated_deform_conv2d
+except ImportError:  # mmcv without compiled ops
+    modulated_deform_conv2d = None
+
+try:
+    from torchvision.ops import deform_conv2d
+except ImportError:
+    deform_conv2d = None
+
+DEFORM_BACKENDS = ('auto', 'mmcv', 'torchvision', 'grid_sample')
+
+
+def grid_sample_deform_conv2d(x, offset, mask, weight, bias, stride=1,
+                              padding=0, dilation=1, groups=1,
+                              deform_groups=1):
+    """Modulated deformable convolution with ``F.grid_sample``.
+
+    Same semantics and offset layout as ``mmcv.ops.modulated_deform_conv2d``
+    (per deformable group and kernel position, a (dy, dx) pair), built from
+    standard operators only, so that it runs on any device and can be traced
+    and exported to ONNX (opset >= 16).
+
+    Args:
+        x (Tensor): Input with shape (n, c, h, w).
+        offset (Tensor): Offsets with shape (n, 2 * dg * kh * kw, ho, wo).
+        mask (Tensor): Modulation with shape (n, dg * kh * kw, ho, wo).
+        weight (Tensor): Weight with shape (o, c / groups, kh, kw).
+        bias (Tensor | None): Bias with shape (o, ).
+
+    Returns:
+        Tensor: Output with shape (n, o, ho, wo).
+    """
+    stride, padding, dilation = _pair(stride), _pair(padding), _pair(dilation)
+    n, c, h, w = x.shape
+    out_channels, _, kh, kw = weight.shape
+    k = kh * kw
+    ho, wo = offset.shape[2:]
+
+    # sampling positions of every kernel tap (before the learned offsets)
+    ky, kx = torch.meshgrid(
+        torch.arange(kh, device=x.device, dtype=x.dtype) * dilation[0],
+        torch.arange(kw, device=x.device, dtype=x.dtype) * dilation[1])
+    base_y = (torch.arange(ho, device=x.device, dtype=x.dtype) * stride[0] -
+              padding[0]).view(1, ho, 1) + ky.reshape(k, 1, 1)
+    base_x = (torch.arange(wo, device=x.device, dtype=x.dtype) * stride[1] -
+              padding[1]).view(1, 1, wo) + kx.reshape(k, 1, 1)
+
+    offset = offset.view(n, deform_groups, k, 2, ho, wo)
+    pos_y = base_y + offset[:, :, :, 0]
+    pos_x = base_x + offset[:, :, :, 1]
+    # align_corners=True maps -1 / 1 to the centers of the border pixels,
+    # zero padding reproduces the bilinear sampling of the mmcv kernel
+    grid = torch.stack((2 * pos_x / max(w - 1, 1) - 1,
+                        2 * pos_y / max(h - 1, 1) - 1),
+                       dim=-1).view(n * deform_groups, k * ho, wo, 2)
+    cols = F.grid_sample(
+        x.reshape(n * deform_groups, c // deform_groups, h, w),
+        grid,
+        mode='bilinear',
+        padding_mode='zeros',
+        align_corners=True)
+    cols = cols.view(n, deform_groups, c // deform_groups, k, ho, wo)
+    cols = cols * mask.view(n, deform_groups, 1, k, ho, wo)
+
+    # im2col product, channel-major like the flattened weight
+    cols = cols.reshape(n, groups, c // groups * k, ho * wo)
+    out = torch.matmul(
+        weight.reshape(groups, out_channels // groups, -1).unsqueeze(0), cols)
+    out = out.reshape(n, out_channels, ho, wo)
+    if bias is not None:
+        out = out + bias.view(1, -1, 1, 1)
+    return out
+
+
+def set_deform_backend(module, backend):
+    """Select the deformable convolution backend of all alignment modules.
+
+    Args:
+        module (nn.Module): A model containing
+            :obj:`SecondOrderDeformableAlignment` modules.
+        backend (str): One of ``DEFORM_BACKENDS``.
+    """
+    for m in module.modules():
+        if isinstance(m, SecondOrderDeformableAlignment):
+            m.backend = backend
+    return module
+
+
+class SecondOrderDeformableAlignment(nn.Module):
     """Second-order deformable alignment module.
+
+    The parameters (``weight``, ``bias``, ``conv_offset``) match the former
+    ``mmcv.ops.ModulatedDeformConv2d`` based module, so existing checkpoints
+    load unchanged.
+
     Args:
         in_channels (int): Same as nn.Conv2d.
         out_channels (int): Same as nn.Conv2d.
@@ -17,17 +114,23 @@ class SecondOrderDeformableAlignment(ModulatedDeformConv2d):
         padding (int or tuple[int]): Same as nn.Conv2d.
         dilation (int or tuple[int]): Same as nn.Conv2d.
         groups (int): Same as nn.Conv2d.
-        bias (bool or str): If specified as `auto`, it will be decided by the
-            norm_cfg. Bias will be set as True if norm_cfg is None, otherwise
-            False.
+        deform_groups (int): Number of deformable groups. Default: 1.
+        bias (bool): Whether to use bias. Default: True.
         max_residue_magnitude (int): The maximum magnitude of the offset
             residue (Eq. 6 in paper). Default: 10.
+        backend (str): Deformable convolution implementation: 'mmcv'
+            (compiled mmcv op), 'torchvision' (torchvision.ops), 'grid_sample'
+            (pure PyTorch, exportable) or 'auto' (the first available of
+            them, 'grid_sample' while tracing or compiling). Default: 'auto'.
     """
 
     def __init__(self, n_p: int = 3, *args, **kwargs):
         self.max_residue_magnitude = kwargs.pop("max_residue_magnitude", 10)
+        backend = kwargs.pop("backend", "auto")
 
-        super(SecondOrderDeformableAlignment, self).__init__(*args, **kwargs)
+        super(SecondOrderDeformableAlignment, self).__init__()
+        self._init_conv(*args, **kwargs)
+        self.backend = backend
 
         self.conv_offset = nn.Sequential(
             nn.Conv2d(
@@ -43,9 +146,84 @@ class SecondOrderDeformableAlignment(ModulatedDeformConv2d):
 
         self.init_offset()
 
+    def _init_conv(self, in_channels, out_channels, kernel_size, stride=1,
+                   padding=0, dilation=1, groups=1, deform_groups=1,
+                   bias=True):
+        self.in_channels = in_channels
+        self.out_channels = out_channels
+        self.kernel_size = _pair(kernel_size)
+        self.stride = _pair(stride)
+        self.padding = _pair(padding)
+        self.dilation = _pair(dilation)
+        self.groups = groups
+        self.deform_groups = deform_groups
+        self.weight = nn.Parameter(
+            torch.Tensor(out_channels, in_channels // groups,
+                         *self.kernel_size))
+        if bias:
+            self.bias = nn.Parameter(torch.Tensor(out_channels))
+        else:
+            self.register_parameter('bias', None)
+
+        # same initialization as mmcv.ops.ModulatedDeformConv2d
+        n = in_channels * self.kernel_size[0] * self.kernel_size[1]
+        stdv = 1. / math.sqrt(n)
+        self.weight.data.uniform_(-stdv, stdv)
+        if self.bias is not None:
+            self.bias.data.zero_()
+
+    @property
+    def backend(self):
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend):
+        if backend not in DEFORM_BACKENDS:
+            raise ValueError(f'backend must be one of {DEFORM_BACKENDS}, '
+                             f'but got {backend}')
+        if backend == 'mmcv' and modulated_deform_conv2d is None:
+            raise ImportError('the mmcv backend requires mmcv-full')
+        if backend == 'torchvision' and deform_conv2d is None:
+            raise ImportError('the torchvision backend requires torchvision')
+        self._backend = backend
+
     def init_offset(self):
         constant_init(self.conv_offset[-1], val=0, bias=0)
 
+    def _resolve_backend(self):
+        if self._backend != 'auto':
+            return self._backend
+        if (torch.jit.is_tracing() or torch.jit.is_scripting()
+                or is_compiling()):
+            return 'grid_sample'
+        if modulated_deform_conv2d is not None:
+            return 'mmcv'
+        if deform_conv2d is not None:
+            return 'torchvision'
+        return 'grid_sample'
+
+    def deform_conv(self, x, offset, mask):
+        backend = self._resolve_backend()
+        if backend == 'mmcv':
+            return modulated_deform_conv2d(x, offset, mask, self.weight,
+                                           self.bias, self.stride,
+                                           self.padding, self.dilation,
+                                           self.groups, self.deform_groups)
+        if backend == 'torchvision':
+            return deform_conv2d(
+                x,
+                offset,
+                self.weight,
+                self.bias,
+                stride=self.stride,
+                padding=self.padding,
+                dilation=self.dilation,
+                mask=mask)
+        return grid_sample_deform_conv2d(x, offset, mask, self.weight,
+                                         self.bias, self.stride, self.padding,
+                                         self.dilation, self.groups,
+                                         self.deform_groups)
+
     def forward(self, x, extra_feat, flow_1, flow_2):
         """
         Inputs:
@@ -55,29 +233,24 @@ class SecondOrderDeformableAlignment(ModulatedDeformConv2d):
         Output:
            aligned feature: shape [B,C,H,W]
         """
-        extra_feat = torch.cat([extra_feat, flow_1, flow_2], dim=1).contiguous()
+        extra_feat = torch.cat(
+            [extra_feat, flow_1.to(extra_feat.dtype), flow_2.to(extra_feat.dtype)],
+            dim=1,
+        ).contiguous()
         out = self.conv_offset(extra_feat)
-        o1, o2, mask = torch.chunk(out, 3, dim=1)
-
-        # offset
-        offset = self.max_residue_magnitude * torch.tanh(torch.cat((o1, o2), dim=1))
-        offset_1, offset_2 = torch.chunk(offset, 2, dim=1)
-        offset_1 = offset_1 + flow_1.flip(1).repeat(1, offset_1.size(1) // 2, 1, 1)
-        offset_2 = offset_2 + flow_2.flip(1).repeat(1, offset_2.size(1) // 2, 1, 1)
-        offset = torch.cat([offset_1, offset_2], dim=1)
-
-        # mask
-        mask = torch.sigmoid(mask)
-
-        return modulated_deform_conv2d(
-            x,
-            offset,
-            mask,
-            self.weight,
-            self.bias,
-            self.stride,
-            self.padding,
-            self.dilation,
-            self.groups,
-            self.deform_groups,
-        )
+
+        # offsets and the deformable convolution stay in float32 under autocast
+        with fp32_region(x):
+            o1, o2, mask = torch.chunk(out.float(), 3, dim=1)
+
+            # offset
+            offset = self.max_residue_magnitude * torch.tanh(torch.cat((o1, o2), dim=1))
+            offset_1, offset_2 = torch.chunk(offset, 2, dim=1)
+            offset_1 = offset_1 + flow_1.flip(1).repeat(1, offset_1.size(1) // 2, 1, 1)
+            offset_2 = offset_2 + flow_2.flip(1).repeat(1, offset_2.size(1) // 2, 1, 1)
+            offset = torch.cat([offset_1, offset_2], dim=1)
+
+            # mask
+            mask = torch.sigmoid(mask)
+
+            return self.deform_conv(x.float(), offset, mask)
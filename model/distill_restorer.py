@@ -0,0 +1,118 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+import copy
+
+import torch
+from mmcv.runner import load_checkpoint
+
+from .basic_restorer import BasicRestorer
+from .builder import build_backbone, build_loss
+from .registry import MODELS
+
+
+@MODELS.register_module()
+class DistillRestorer(BasicRestorer):
+    """Restorer that trains a small generator against a frozen teacher.
+
+    The student (``generator``) is trained on the ground-truth loss of
+    :class:`BasicRestorer` plus a distillation loss to the outputs of a
+    pretrained teacher generator: the final depth ('output'), the stage-1
+    depth ('rgb_depth') and the stage-2 depth ('d_depth'). The teacher is
+    built and loaded at the first training iteration and is not a submodule,
+    so it is neither optimized nor saved; the checkpoints hold the student
+    only and load into a :class:`BasicRestorer` with the student generator
+    config.
+
+    Args:
+        generator (dict): Config for the student generator.
+        teacher (dict): Config for the teacher generator.
+        teacher_pretrained (str): Restorer checkpoint of the teacher, whose
+            'generator.' prefix is stripped.
+        pixel_loss (dict): Config for the ground-truth pixel-wise loss.
+        distill_loss (dict, optional): Config for the distillation loss.
+            Default: None (same as ``pixel_loss``).
+        distill_weights (dict, optional): Weight of every distilled output,
+            keys in 'output', 'd_depth' and 'rgb_depth'. Default:
+            dict(output=1.0, d_depth=0.5, rgb_depth=0.5).
+        gt_weight (float, optional): Weight of the ground-truth loss.
+            Default: 1.0.
+        train_cfg (dict): Config for training. Default: None.
+        test_cfg (dict): Config for testing. Default: None.
+        pretrained (str): Path for pretrained student model. Default: None.
+    """
+
+    def __init__(self,
+                 generator,
+                 teacher,
+                 teacher_pretrained,
+                 pixel_loss,
+                 distill_loss=None,
+                 distill_weights=None,
+                 gt_weight=1.0,
+                 train_cfg=None,
+                 test_cfg=None,
+                 pretrained=None):
+        super().__init__(generator, pixel_loss, train_cfg, test_cfg,
+                         pretrained)
+        if distill_weights is None:
+            distill_weights = dict(output=1.0, d_depth=0.5, rgb_depth=0.5)
+        for key in distill_weights:
+            if key not in ('output', 'd_depth', 'rgb_depth'):
+                raise ValueError(
+                    'distill_weights keys must be in "output", "d_depth" and '
+                    f'"rgb_depth", but got {key}')
+        self.teacher_cfg = copy.deepcopy(teacher)
+        self.teacher_cfg['spynet_pretrained'] = None
+        self.teacher_pretrained = teacher_pretrained
+        self.distill_loss = build_loss(
+            pixel_loss if distill_loss is None else distill_loss)
+        self.distill_weights = distill_weights
+        self.gt_weight = gt_weight
+        # kept in a list, out of the module tree (optimizer, DDP, state_dict)
+        self._teacher = []
+
+    @property
+    def teacher(self):
+        """The frozen teacher generator (built on first use)."""
+        if not self._teacher:
+            teacher = build_backbone(self.teacher_cfg)
+            load_checkpoint(
+                teacher,
+                self.teacher_pretrained,
+                map_location='cpu',
+                revise_keys=[(r'^generator\.', '')])
+            teacher.requires_grad_(False)
+            self._teacher.append(teacher.eval())
+        return self._teacher[0]
+
+    def forward_train(self, lq, guide, gt):
+        """Training forward function.
+
+        Args:
+            lq (Tensor): LQ Tensor with shape (n, c1, h/s, w/s).
+            guide (Tensor): Guide Tensor with shape (n, c2, h, w).
+            gt (Tensor): GT Tensor with shape (n, c1, h, w).
+
+        Returns:
+            Tensor: Output tensor.
+        """
+        teacher = self.teacher.to(lq.device)
+        with torch.no_grad():
+            target, target_intermed = teacher(lq, guide)
+        target_intermed['output'] = target
+
+        losses = dict()
+        output, intermed = self.generator(lq, guide)
+        intermed['output'] = output
+        if self.gt_weight > 0:
+            losses['loss_pix'] = self.gt_weight * self.gt_loss(
+                output, intermed, gt)
+        for key, weight in self.distill_weights.items():
+            if weight > 0:
+                losses[f'loss_distill_{key}'] = weight * self.distill_loss(
+                    intermed[key], target_intermed[key])
+        outputs = dict(
+            losses=losses,
+            num_samples=len(gt.data),
+            results=dict(lq=lq.cpu(), guide=guide.cpu(), gt=gt.cpu(), output=output.cpu()))
+        self.current_iters += 1
+        return outputs
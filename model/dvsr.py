@@ -1,6 +1,8 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates.
 # Adapted from BasicVSR++ network structure: "BasicVSR++: Improving Video Super-Resolution with Enhanced Propagation and Alignment"
 
+import functools
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -8,8 +10,10 @@ from mmcv.cnn import constant_init
 from mmcv.runner import load_checkpoint
 
 from .common import PixelShufflePack, flow_warp, ResidualBlocksWithInputConv, SPyNet, SecondOrderDeformableAlignment
+from .common import FEATURE_TIERS, ConcatBuffer, FeatureStore, GuideCache, flow_warp_batched
+from .common import estimate_activation_bytes, reconstruction_chunk
+from .common.precision import STORAGE_DTYPES, fp32_region, from_storage, to_storage
 from .registry import BACKBONES
-from mmseg.utils import get_root_logger
 
 
 @BACKBONES.register_module()
@@ -33,7 +37,72 @@ class DVSR(nn.Module):
             than this value, the intermediate features are sent to CPU. This
             saves GPU memory, but slows down the inference speed. You can
             increase this number if you have a GPU with large memory.
-            Default: 100.
+            Default: 200.
+        deform_backend (str, optional): Implementation of the deformable
+            alignment: 'auto', 'mmcv', 'torchvision' or 'grid_sample'.
+            Default: 'auto'.
+        flow_resolution (str, optional): Resolution of the optical flow
+            estimation: 'full' (SPyNet on the guides, then downsampled),
+            'quarter' (SPyNet on 1/4 guides) or 'pyramid' (SPyNet pyramid
+            stopped at 1/4). Default: 'full'.
+        share_flow (bool, optional): Build a single SPyNet and reuse the
+            flows of the first stage in the second stage. Default: False.
+        fast_propagation (bool, optional): Warp both neighbours with one
+            grid_sample and, without autograd, reuse the concatenation
+            buffers of the propagation loop. The outputs are bit-for-bit
+            equal. Default: True.
+        stream_reconstruction (bool, optional): Reconstruct every frame
+            during the last propagation branch and release the branch
+            features as soon as they are consumed, which lowers the peak
+            memory. Default: False.
+        feature_store (str | dict, optional): Keep the per-frame features of
+            the branches in a :class:`FeatureStore` tier, 'device', 'host' or
+            'disk' (memory-mapped files), with background prefetch in the
+            read order of the passes. A dict gives the tier and the other
+            store arguments, e.g. ``dict(tier='disk', root='/scratch')``.
+            Replaces ``cpu_cache``; inference only. Default: None.
+        feature_dtype (str, optional): Keep the stored branch features in
+            'float16' or 'bfloat16' and upcast them to float32 when they are
+            consumed; the computation precision is unchanged. Default: None
+            (float32).
+        flow_dtype (str, optional): Same for the stored optical flows. Note
+            that bfloat16 rounds large displacements to a fraction of a
+            pixel. Default: None (float32).
+        memory_budget (int, optional): Device memory budget in bytes. When
+            given, the features are sent to CPU if the estimated activation
+            memory of the input exceeds it, instead of comparing the length
+            with ``cpu_cache_length``. Default: None.
+        recon_chunk (int | str, optional): Number of frames whose
+            reconstruction runs at once, stacked along the batch. 'auto'
+            derives it from ``memory_budget``. Always 1 (the memory-minimal
+            per-frame loop) in ``cpu_cache`` mode. Default: 1.
+        refine_mode (str, optional): 'always' runs the refinement stage on
+            all frames, 'never' returns the stage-1 prediction and
+            'adaptive' skips the stage for chunks of ``refine_chunk`` frames
+            whose stage-1 depth agrees with the dToF input: the mean
+            absolute difference of its block averages with the valid input
+            blocks stays below ``refine_threshold`` (normalized depth) on
+            every frame. Default: 'always'.
+        refine_threshold (float, optional): See ``refine_mode``. Calibrate
+            it with ``tools/benchmark_refinement.py``. Default: 0.01.
+        refine_chunk (int, optional): See ``refine_mode``. Default: 10.
+        static_flow_threshold (float, optional): If given, the pairs of
+            neighbouring guides whose mean absolute difference at 1/8
+            resolution is below it get zero flows without running SPyNet;
+            ``flow_stats`` counts them. None computes all flows. Default:
+            None.
+        guide_cache (GuideCache | dict, optional): Cache (or the arguments
+            of a :class:`GuideCache`) reusing the SPyNet flows and the
+            stage-1 guide features of guides seen before, e.g. in runs of
+            the same video with other dToF inputs. Default: None.
+        compile_propagation (bool | dict, optional): Run the steady-state
+            propagation steps through ``torch.compile`` (dict: its keyword
+            arguments), one captured graph per branch; the first two steps
+            of a branch and the data movement stay eager. The 'auto' deform
+            backend uses 'grid_sample' inside the graph. Default: False.
+        num_prop_iters (int, optional): Number of backward/forward
+            propagation iterations; 1 gives a lighter model (e.g. a
+            distillation student) with different weights. Default: 2.
     """
 
     def __init__(
@@ -45,18 +114,88 @@ class DVSR(nn.Module):
         is_low_res_input=True,
         spynet_pretrained=None,
         cpu_cache_length=200,
+        deform_backend='auto',
+        flow_resolution='full',
+        share_flow=False,
+        fast_propagation=True,
+        stream_reconstruction=False,
+        feature_store=None,
+        feature_dtype=None,
+        flow_dtype=None,
+        memory_budget=None,
+        recon_chunk=1,
+        refine_mode="always",
+        refine_threshold=0.01,
+        refine_chunk=10,
+        static_flow_threshold=None,
+        guide_cache=None,
+        compile_propagation=False,
+        num_prop_iters=2,
     ):
         
         super().__init__()
         self.mid_channels = mid_channels
+        if num_prop_iters < 1:
+            raise ValueError(
+                f"num_prop_iters must be positive, but got {num_prop_iters}"
+            )
+        self.num_prop_iters = num_prop_iters
         self.is_low_res_input = is_low_res_input
         self.scale = scale
         self.cpu_cache_length = cpu_cache_length
+        if flow_resolution not in ("full", "quarter", "pyramid"):
+            raise ValueError(
+                "flow_resolution must be 'full', 'quarter' or 'pyramid', "
+                f"but got {flow_resolution}"
+            )
+        self.flow_resolution = flow_resolution
+        self.share_flow = share_flow
+        self.fast_propagation = fast_propagation
+        self.stream_reconstruction = stream_reconstruction
+        if isinstance(feature_store, str):
+            feature_store = dict(tier=feature_store)
+        if feature_store is not None and feature_store.get("tier") not in FEATURE_TIERS:
+            raise ValueError(
+                f"feature_store tier must be one of {FEATURE_TIERS}, "
+                f"but got {feature_store.get('tier')}"
+            )
+        self.feature_store = feature_store
+        for name, dtype in [("feature_dtype", feature_dtype), ("flow_dtype", flow_dtype)]:
+            if dtype is not None and dtype not in STORAGE_DTYPES:
+                raise ValueError(
+                    f"{name} must be None, 'float16' or 'bfloat16', but got {dtype}"
+                )
+        self.feature_dtype = STORAGE_DTYPES.get(feature_dtype)
+        self.flow_dtype = STORAGE_DTYPES.get(flow_dtype)
+        self.memory_budget = memory_budget
+        if recon_chunk != "auto" and not (isinstance(recon_chunk, int) and recon_chunk >= 1):
+            raise ValueError(
+                f"recon_chunk must be a positive integer or 'auto', but got {recon_chunk}"
+            )
+        self.recon_chunk = recon_chunk
+        if refine_mode not in ("always", "adaptive", "never"):
+            raise ValueError(
+                "refine_mode must be 'always', 'adaptive' or 'never', "
+                f"but got {refine_mode}"
+            )
+        self.refine_mode = refine_mode
+        self.refine_threshold = refine_threshold
+        self.refine_chunk = refine_chunk
+        self.refine_stats = None
+        self.static_flow_threshold = static_flow_threshold
+        self.flow_stats = dict(pairs=0, skipped_pairs=0)
+        if isinstance(guide_cache, dict):
+            guide_cache = GuideCache(**guide_cache)
+        self.guide_cache = guide_cache
+        self.compile_propagation = compile_propagation
+        self._compiled_steps = {}
+        self._shared_flows = None
 
         # optical flow
         self.spynet = nn.ModuleDict()
         self.spynet["hg_1"] = SPyNet(pretrained=spynet_pretrained)
-        self.spynet["hg_2"] = SPyNet(pretrained=spynet_pretrained)
+        if not share_flow:  # otherwise stage 2 reuses the flows of stage 1
+            self.spynet["hg_2"] = SPyNet(pretrained=spynet_pretrained)
 
         # feature extraction module
         self.conv_guide_init = nn.ModuleDict()
@@ -96,7 +235,11 @@ class DVSR(nn.Module):
         self.backbone["hg_1"] = nn.ModuleDict()
         self.backbone["hg_2"] = nn.ModuleDict()
 
-        modules = ["backward_1", "forward_1", "backward_2", "forward_2"]
+        modules = [
+            f"{direction}_{iter_}"
+            for iter_ in range(1, num_prop_iters + 1)
+            for direction in ["backward", "forward"]
+        ]
         for i, module in enumerate(modules):
             self.deform_align["hg_1"][module] = SecondOrderDeformableAlignment(
                 3,
@@ -106,6 +249,7 @@ class DVSR(nn.Module):
                 padding=1,
                 deform_groups=16,
                 max_residue_magnitude=max_residue_magnitude,
+                backend=deform_backend,
             )
             self.deform_align["hg_2"][module] = SecondOrderDeformableAlignment(
                 3,
@@ -115,6 +259,7 @@ class DVSR(nn.Module):
                 padding=1,
                 deform_groups=16,
                 max_residue_magnitude=max_residue_magnitude,
+                backend=deform_backend,
             )
             self.backbone["hg_1"][module] = ResidualBlocksWithInputConv(
                 (2 + i) * mid_channels, mid_channels, num_blocks
@@ -129,10 +274,10 @@ class DVSR(nn.Module):
         # upsampling module
         self.reconstruction = nn.ModuleDict()
         self.reconstruction["hg_1"] = ResidualBlocksWithInputConv(
-            5 * mid_channels, mid_channels, 5
+            (1 + 2 * num_prop_iters) * mid_channels, mid_channels, 5
         )
         self.reconstruction["hg_2"] = ResidualBlocksWithInputConv(
-            5 * mid_channels, mid_channels, 5
+            (1 + 2 * num_prop_iters) * mid_channels, mid_channels, 5
         )
 
         self.final_pred = nn.ModuleDict()
@@ -172,13 +317,13 @@ class DVSR(nn.Module):
             lqs (tensor): Input low quality (LQ) sequence with
                 shape (n, t, c, h, w).
         """
-
+        self.is_mirror_extended = False
         if lqs.size(1) % 2 == 0:
             lqs_1, lqs_2 = torch.chunk(lqs, 2, dim=1)
-            if torch.norm(lqs_1 - lqs_2.flip(1)) == 0:
+            if torch.equal(lqs_1, lqs_2.flip(1)):
                 self.is_mirror_extended = True
 
-    def compute_flow(self, guides, hg_idx):
+    def compute_flow(self, guides, hg_idx, skip_levels=0):
         """Compute optical flow using SPyNet for feature alignment.
         Note that if the input is an mirror-extended sequence, 'flows_forward'
         is not needed, since it is equal to 'flows_backward.flip(1)'.
@@ -186,6 +331,9 @@ class DVSR(nn.Module):
             guides (tensor): Input low quality (LQ) sequence with
                 shape (n, t, c, h, w).
             hg_idx: Identify processing stage: init stage or refine stage
+            skip_levels (int): Number of the finest SPyNet pyramid levels
+                that are skipped, the flows have 1/2**skip_levels of the
+                input resolution. Default: 0.
         Return:
             tuple(Tensor): Optical flow. 'flows_forward' corresponds to the
                 flows used for forward-time propagation (current to previous).
@@ -193,49 +341,162 @@ class DVSR(nn.Module):
                 backward-time propagation (current to next).
         """
 
-        n, t, c, h, w = guides.size() ## same resolution as final output
-        guides_1 = guides[:, :-1, :, :, :]
-        guides_2 = guides[:, 1:, :, :, :]
-        
-        if self.cpu_cache:
-            flows_backward = []
-            for tt in range(t-1):
-                fb = self.spynet[f"hg_{hg_idx}"](guides_1[:,tt], guides_2[:,tt])
-                flows_backward.append(fb.unsqueeze(1))
-            flows_backward = torch.cat(flows_backward, dim = 1)
-        
-        else:
-            guides_1 = guides_1.reshape(-1, c, h, w)
-            guides_2 = guides_2.reshape(-1, c, h, w)
-            flows_backward = self.spynet[f"hg_{hg_idx}"](guides_1, guides_2).view(
-                n, t - 1, 2, h, w
-            )
-        
-        if self.is_mirror_extended:  # flows_forward = flows_backward.flip(1)
-            flows_forward = None
-        else:
-            
-            if self.cpu_cache:
-                flows_forward = []
-                for tt in range(t-1):
-                    ff = self.spynet[f"hg_{hg_idx}"](guides_2[:,tt], guides_1[:,tt])
-                    flows_forward.append(ff.unsqueeze(1))
-                flows_forward = torch.cat(flows_forward, dim = 1)
+        static = None
+        if self.static_flow_threshold is not None:
+            static = SPyNet.static_pairs(guides, self.static_flow_threshold)
+            self.flow_stats["pairs"] += static.numel()
+            self.flow_stats["skipped_pairs"] += int(static.sum())
+
+        # every frame is pyramided once and shared by all pairs
+        flows_backward, flows_forward = self.spynet[
+            f"hg_{hg_idx}"
+        ].compute_flow_sequence(
+            guides,
+            skip_levels,
+            # flows_forward = flows_backward.flip(1) for mirror-extended inputs
+            with_forward=not self.is_mirror_extended,
+            per_pair=self.cpu_cache,
+            static=static,
+        )
 
-            else:
-                guides_1 = guides_1.reshape(-1, c, h, w)
-                guides_2 = guides_2.reshape(-1, c, h, w)
-                flows_forward = self.spynet[f"hg_{hg_idx}"](guides_2, guides_1).view(
-                    n, t - 1, 2, h, w
-                )
-        
         if self.cpu_cache:
             flows_backward = flows_backward.cpu()
-            flows_forward = flows_forward.cpu()
+            if flows_forward is not None:
+                flows_forward = flows_forward.cpu()
 
         return flows_forward, flows_backward
 
-    def propagate(self, feats, flows, module_name, hg_idx):
+    def get_flows(self, guides, hg_idx):
+        """Compute optical flows at the propagation (1/4) resolution.
+        'full' runs SPyNet on the full-resolution guides and downsamples the
+        flows, 'quarter' runs SPyNet on guides downsampled by 4 and
+        'pyramid' stops the SPyNet pyramid two levels early.
+        Args:
+            guides (tensor): Input RGB guidance with shape (n, t, 3, h, w)
+            hg_idx: Identify processing stage: init stage or refine stage
+        Return:
+            tuple(Tensor): 'flows_forward' (None for mirror-extended inputs)
+                and 'flows_backward' with shape (n, t - 1, 2, h/4, w/4).
+        """
+
+        n, t, c, h, w = guides.size()
+
+        # flows are always estimated in float32
+        with fp32_region(guides):
+            guides = guides.float()
+            if self.flow_resolution == "quarter":
+                guides = F.avg_pool2d(guides.reshape(-1, c, h, w), 4)
+                return self.compute_flow(
+                    guides.view(n, t, c, h // 4, w // 4), hg_idx
+                )
+            if self.flow_resolution == "pyramid":
+                return self.compute_flow(guides, hg_idx, skip_levels=2)
+            flows = self.compute_flow(guides, hg_idx)
+
+        return tuple(
+            None
+            if flow is None
+            else F.interpolate(
+                flow.reshape(-1, 2, h, w),
+                scale_factor=0.25,
+                mode="bicubic",
+            ).view(n, t - 1, 2, h // 4, w // 4)
+            / 4
+            for flow in flows
+        )
+
+    def guide_flows(self, guides, hg_idx):
+        """'get_flows' through the guide cache, if any."""
+        if self.guide_cache is None:
+            return self.get_flows(guides, hg_idx)
+        cache = self.guide_cache
+        key = cache.key(
+            "flows",
+            cache.digest(guides),
+            cache.module_digest(self.spynet[f"hg_{hg_idx}"]),
+            self.flow_resolution,
+            self.static_flow_threshold,
+            self.is_mirror_extended,
+        )
+        device = "cpu" if self.cpu_cache else self.compute_device
+        return cache.fetch(key, lambda: self.get_flows(guides, hg_idx), device)
+
+    def guide_features(self, guides, i=None):
+        """conv_guide_init['hg_1'] of all frames of the guides, or of frame i,
+        through the guide cache, if any.
+        Args:
+            guides (tensor): Input RGB guidance with shape (n, t, 3, h, w)
+            i (int): Frame index, None for all frames stacked along the batch
+        """
+        conv = self.conv_guide_init["hg_1"]
+
+        def compute():
+            return conv(guides.flatten(0, 1) if i is None else guides[:, i])
+
+        if self.guide_cache is None:
+            return compute()
+        cache = self.guide_cache
+        key = cache.key(
+            "guide_feats",
+            cache.digest(guides),
+            cache.module_digest(conv),
+            torch.is_autocast_enabled() and torch.get_autocast_gpu_dtype(),
+            torch.is_autocast_cpu_enabled() and torch.get_autocast_cpu_dtype(),
+            i,
+        )
+        return cache.fetch(key, compute, self.compute_device)
+
+    @staticmethod
+    def propagation_step(deform_align, backbone, feat_prop, feat_n2, flow_n1,
+                         flow_n2, feat_current, *branch_feats):
+        """A steady-state step of 'propagate' (both neighbours available) as a
+        pure tensor function, which torch.compile captures once per branch.
+        Args:
+            deform_align (nn.Module): Alignment module of the branch.
+            backbone (nn.Module): Residual blocks of the branch.
+            feat_prop, feat_n2 (tensor): Propagated features of the previous
+                two steps with shape (n, c, h/4, w/4).
+            flow_n1, flow_n2 (tensor): Flows to the previous two frames with
+                shape (n, 2, h/4, w/4), flow_n2 not yet composed.
+            feat_current (tensor): Spatial features of the frame.
+            branch_feats (tensor): Features of the previous branches.
+        Returns:
+            Tensor: Propagated features of this step.
+        """
+        flow_n2 = flow_n1 + flow_warp(flow_n2, flow_n1.permute(0, 2, 3, 1))
+        cond_n1 = flow_warp(feat_prop, flow_n1.permute(0, 2, 3, 1))
+        cond_n2 = flow_warp(feat_n2, flow_n2.permute(0, 2, 3, 1))
+        cond = torch.cat([cond_n1, feat_current, cond_n2], dim=1)
+        feat_prop = deform_align(
+            torch.cat([feat_prop, feat_n2], dim=1), cond, flow_n1, flow_n2
+        )
+        feat = torch.cat([feat_current, *branch_feats, feat_prop], dim=1)
+        return feat_prop + backbone(feat)
+
+    def compiled_step(self, hg_idx, module_name):
+        """'propagation_step' of a branch, compiled on first use."""
+        key = (hg_idx, module_name)
+        if key not in self._compiled_steps:
+            options = self.compile_propagation
+            options = options if isinstance(options, dict) else {}
+            self._compiled_steps[key] = torch.compile(
+                functools.partial(
+                    self.propagation_step,
+                    self.deform_align[f"hg_{hg_idx}"][module_name],
+                    self.backbone[f"hg_{hg_idx}"][module_name],
+                ),
+                **options,
+            )
+        return self._compiled_steps[key]
+
+    @staticmethod
+    def _cat(tensors, buffer=None):
+        """torch.cat along channels, into a reusable buffer if given."""
+        if buffer is None:
+            return torch.cat(tensors, dim=1)
+        return buffer.cat(tensors)
+
+    def propagate(self, feats, flows, module_name, hg_idx, on_frame=None):
         """Propagate the latent features throughout the sequence.
         Args:
             feats dict(list[tensor]): Features from previous branches. Each
@@ -261,67 +522,166 @@ class DVSR(nn.Module):
             frame_idx = frame_idx[::-1]
             flow_idx = frame_idx
 
+        # reusable concatenation buffers, only without autograd
+        buffers = [None, None, None]
+        if self.fast_propagation and not torch.is_grad_enabled():
+            buffers = [ConcatBuffer() for _ in range(3)]
+        branches = [k for k in feats if k not in ["spatial", module_name]]
+        if isinstance(feats, FeatureStore):
+            # read order of this pass, for the background prefetch
+            feats.schedule("spatial", [mapping_idx[idx] for idx in frame_idx])
+            for k in branches:
+                feats.schedule(k, frame_idx)
+
         feat_prop = flows.new_zeros(n, self.mid_channels, h, w)
         for i, idx in enumerate(frame_idx):
             feat_current = feats["spatial"][mapping_idx[idx]]
             if self.cpu_cache:
-                feat_current = feat_current.cuda()
-                feat_prop = feat_prop.cuda()
-            # second-order deformable alignment
-            if i > 0:
+                feat_current = feat_current.to(self.compute_device)
+                feat_prop = feat_prop.to(self.compute_device)
+            feat_current = from_storage(feat_current, self.feature_dtype)
+            if i > 1 and self.compile_propagation:
+                # steady state: one captured graph per branch
+                feat_list = [feat_current] + [feats[k][idx] for k in branches]
+                feat_n2 = feats[module_name][-2]
                 flow_n1 = flows[:, flow_idx[i], :, :, :]
+                flow_n2 = flows[:, flow_idx[i - 1], :, :, :]
                 if self.cpu_cache:
-                    flow_n1 = flow_n1.cuda()
+                    feat_list = [f.to(self.compute_device) for f in feat_list]
+                    feat_n2 = feat_n2.to(self.compute_device)
+                    flow_n1 = flow_n1.to(self.compute_device)
+                    flow_n2 = flow_n2.to(self.compute_device)
+                feat_list = [from_storage(f, self.feature_dtype) for f in feat_list]
+                feat_prop = self.compiled_step(hg_idx, module_name)(
+                    feat_prop,
+                    from_storage(feat_n2, self.feature_dtype),
+                    from_storage(flow_n1, self.flow_dtype),
+                    from_storage(flow_n2, self.flow_dtype),
+                    *feat_list,
+                )
+                feat_list.append(feat_prop)
+            else:
+                # second-order deformable alignment
+                if i > 0:
+                    flow_n1 = flows[:, flow_idx[i], :, :, :]
+                    if self.cpu_cache:
+                        flow_n1 = flow_n1.to(self.compute_device)
+                    flow_n1 = from_storage(flow_n1, self.flow_dtype)
 
-                cond_n1 = flow_warp(feat_prop, flow_n1.permute(0, 2, 3, 1))
+                    if i > 1:  # second-order features
+                        feat_n2 = feats[module_name][-2]
+                        if self.cpu_cache:
+                            feat_n2 = feat_n2.to(self.compute_device)
+                        feat_n2 = from_storage(feat_n2, self.feature_dtype)
 
-                # initialize second-order features
-                feat_n2 = torch.zeros_like(feat_prop)
-                flow_n2 = torch.zeros_like(flow_n1)
-                cond_n2 = torch.zeros_like(cond_n1)
+                        flow_n2 = flows[:, flow_idx[i - 1], :, :, :]
+                        if self.cpu_cache:
+                            flow_n2 = flow_n2.to(self.compute_device)
+                        flow_n2 = from_storage(flow_n2, self.flow_dtype)
 
-                if i > 1:  # second-order features
-                    feat_n2 = feats[module_name][-2]
-                    if self.cpu_cache:
-                        feat_n2 = feat_n2.cuda()
+                        flow_n2 = flow_n1 + flow_warp(flow_n2, flow_n1.permute(0, 2, 3, 1))
+                        if self.fast_propagation:
+                            cond_n1, cond_n2 = flow_warp_batched(
+                                [feat_prop, feat_n2],
+                                [flow_n1.permute(0, 2, 3, 1), flow_n2.permute(0, 2, 3, 1)],
+                            )
+                        else:
+                            cond_n1 = flow_warp(feat_prop, flow_n1.permute(0, 2, 3, 1))
+                            cond_n2 = flow_warp(feat_n2, flow_n2.permute(0, 2, 3, 1))
+                    else:
+                        cond_n1 = flow_warp(feat_prop, flow_n1.permute(0, 2, 3, 1))
 
-                    flow_n2 = flows[:, flow_idx[i - 1], :, :, :]
-                    if self.cpu_cache:
-                        flow_n2 = flow_n2.cuda()
+                        # initialize second-order features
+                        feat_n2 = torch.zeros_like(feat_prop)
+                        flow_n2 = torch.zeros_like(flow_n1)
+                        cond_n2 = torch.zeros_like(cond_n1)
 
-                    flow_n2 = flow_n1 + flow_warp(flow_n2, flow_n1.permute(0, 2, 3, 1))
-                    cond_n2 = flow_warp(feat_n2, flow_n2.permute(0, 2, 3, 1))
+                    # flow-guided deformable convolution
+                    cond = self._cat([cond_n1, feat_current, cond_n2], buffers[0])
+                    feat_prop = self._cat([feat_prop, feat_n2], buffers[1])
+                    feat_prop = self.deform_align[f"hg_{hg_idx}"][module_name](
+                        feat_prop, cond, flow_n1, flow_n2
+                    )
 
-                # flow-guided deformable convolution
-                cond = torch.cat([cond_n1, feat_current, cond_n2], dim=1)
-                feat_prop = torch.cat([feat_prop, feat_n2], dim=1)
-                feat_prop = self.deform_align[f"hg_{hg_idx}"][module_name](
-                    feat_prop, cond, flow_n1, flow_n2
-                )
+                # concatenate and residual blocks
 
-            # concatenate and residual blocks
+                feat_list = [feat_current] + [feats[k][idx] for k in branches] + [feat_prop]
+                if self.cpu_cache:
+                    feat_list = [f.to(self.compute_device) for f in feat_list]
+                feat_list = [from_storage(f, self.feature_dtype) for f in feat_list]
 
-            feat = (
-                [feat_current]
-                + [feats[k][idx] for k in feats if k not in ["spatial", module_name]]
-                + [feat_prop]
-            )
-            if self.cpu_cache:
-                feat = [f.cuda() for f in feat]
+                feat = self._cat(feat_list, buffers[2])
+                feat_prop = feat_prop + self.backbone[f"hg_{hg_idx}"][module_name](feat)
+            feat_stored = to_storage(feat_prop, self.feature_dtype)
+            feats[module_name].append(feat_stored)
 
-            feat = torch.cat(feat, dim=1)
-            feat_prop = feat_prop + self.backbone[f"hg_{hg_idx}"][module_name](feat)
-            feats[module_name].append(feat_prop)
+            if on_frame is not None:
+                # the features of this frame are final: consume and release
+                # them, only the second-order neighbour is still needed
+                on_frame(
+                    idx, feat_list[:-1] + [from_storage(feat_stored, self.feature_dtype)]
+                )
+                del feat_list
+                feats["spatial"][mapping_idx[idx]] = None
+                for k in branches:
+                    feats[k][idx] = None
+                if len(feats[module_name]) > 2:
+                    feats[module_name][-3] = None
 
             if self.cpu_cache:
                 feats[module_name][-1] = feats[module_name][-1].cpu()
                 torch.cuda.empty_cache()
 
         if "backward" in module_name:
-            feats[module_name] = feats[module_name][::-1]
+            feats[module_name].reverse()
 
         return feats
 
+    def reconstruct(self, lqs, i, hr, hg_idx):
+        """Compute the output of one frame given its branch features.
+        Args:
+            lqs (tensor): Input low quality (LQ) sequence with
+                shape (n, t, c, h/s, w/s).
+            i (int | list[int]): Index of the frame, or indices of K frames
+                whose features are stacked (frame-major) along the batch.
+            hr (list[tensor]): Features of the frame, in the order 'spatial',
+                'backward_1', 'forward_1', 'backward_2', 'forward_2'.
+            hg_idx: Identify processing stage: init stage or refine stage
+        Returns:
+            tuple(Tensor): depth and confidence with shape (n, 1, h, w) and
+                the fused features with shape (n, c, h/4, w/4); the batch
+                is K * n for a list of frames.
+        """
+        if self.cpu_cache:
+            hr = [f.to(self.compute_device) for f in hr]
+        hr = torch.cat([from_storage(f, self.feature_dtype) for f in hr], dim=1)
+
+        hr = self.reconstruction[f"hg_{hg_idx}"](hr)
+        feat_fused = hr.clone()
+        hr = self.final_pred[f"hg_{hg_idx}"](hr)
+
+        depth, conf = torch.chunk(hr, 2, dim=1)
+        lq = lqs[:, i, :, :, :]
+        if lq.dim() == 5:  # frames stacked along the batch
+            lq = lq.transpose(0, 1).flatten(0, 1)
+        depth = depth + self.img_upsample(lq)
+        if self.cpu_cache:
+            hr = hr.cpu()
+            depth = depth.cpu()
+            conf = conf.cpu()
+            torch.cuda.empty_cache()
+        return depth, conf, feat_fused
+
+    def recon_frames(self, t, h, w, n=1):
+        """Number of frames reconstructed at once (see 'recon_chunk')."""
+        if self.cpu_cache or self.recon_chunk == 1:
+            return 1
+        if self.recon_chunk == "auto":
+            if self.memory_budget is None:
+                return 1
+            return reconstruction_chunk(self, t, h, w, self.memory_budget, n=n)
+        return min(self.recon_chunk, t)
+
     def upsample(self, lqs, feats, hg_idx):
         """Compute the output image given the features.
         Args:
@@ -340,29 +700,44 @@ class DVSR(nn.Module):
 
         mapping_idx = list(range(0, num_outputs))
         mapping_idx += mapping_idx[::-1]
+        if isinstance(feats, FeatureStore):
+            # every frame reads the first entry of the propagation branches
+            feats.schedule("spatial", mapping_idx[: lqs.size(1)])
+            for k in feats:
+                if k != "spatial":
+                    feats.schedule(k, [0] * lqs.size(1))
 
-        for i in range(0, lqs.size(1)):
-            hr = [feats[k].pop(0) for k in feats if k != "spatial"]
-            hr.insert(0, feats["spatial"][mapping_idx[i]])
-            hr = torch.cat(hr, dim=1)
-            if self.cpu_cache:
-                hr = hr.cuda()
-
-            hr = self.reconstruction[f"hg_{hg_idx}"](hr)
-            feat_fused = hr.clone()
-            hr = self.final_pred[f"hg_{hg_idx}"](hr)
-
-            depth, conf = torch.chunk(hr, 2, dim=1)
-            depth = depth + self.img_upsample(lqs[:, i, :, :, :])
-            if self.cpu_cache:
-                hr = hr.cpu()
-                depth = depth.cpu()
-                conf = conf.cpu()
-                torch.cuda.empty_cache()
+        n, t = lqs.shape[:2]
+        # lqs are at 1/4 of the output resolution
+        chunk = self.recon_frames(t, lqs.size(3) * 4, lqs.size(4) * 4, n)
+        if chunk == 1:
+            for i in range(0, t):
+                hr = [feats[k].pop(0) for k in feats if k != "spatial"]
+                hr.insert(0, feats["spatial"][mapping_idx[i]])
+                depth, conf, feat_fused = self.reconstruct(lqs, i, hr, hg_idx)
 
-            depths.append(depth)
-            confs.append(conf)
-            feats_fused.append(feat_fused)
+                depths.append(depth)
+                confs.append(conf)
+                feats_fused.append(feat_fused)
+        else:
+            # reconstruct chunks of frames stacked along the batch
+            for start in range(0, t, chunk):
+                idx = list(range(start, min(t, start + chunk)))
+                hr = [
+                    torch.cat([feats[k].pop(0) for _ in idx], dim=0)
+                    for k in feats
+                    if k != "spatial"
+                ]
+                hr.insert(
+                    0, torch.cat([feats["spatial"][mapping_idx[i]] for i in idx], dim=0)
+                )
+                outputs = self.reconstruct(lqs, idx, hr, hg_idx)
+                depth, conf, feat_fused = [
+                    x.view(len(idx), n, *x.shape[1:]).unbind(0) for x in outputs
+                ]
+                depths.extend(depth)
+                confs.extend(conf)
+                feats_fused.extend(feat_fused)
 
         return (
             torch.stack(depths, dim=1),
@@ -389,8 +764,16 @@ class DVSR(nn.Module):
 
         n, t, c, h, w = lqs.size() ## 1/4 resolution of final output
 
+        # all intermediate tensors are computed on the device of the inputs
+        self.compute_device = lqs.device
+
         # whether to cache the features in CPU (no effect if using CPU)
-        if t > self.cpu_cache_length and lqs.is_cuda:
+        if self.memory_budget is not None:
+            self.cpu_cache = lqs.is_cuda and (
+                estimate_activation_bytes(self, t, h * 4, w * 4, n=n)
+                > self.memory_budget
+            )
+        elif t > self.cpu_cache_length and lqs.is_cuda:
             self.cpu_cache = True
         else:
             self.cpu_cache = False
@@ -399,108 +782,222 @@ class DVSR(nn.Module):
         self.check_if_mirror_extended(lqs)
 
         feats = {}
-        # compute spatial features
-        if self.cpu_cache:
-            feats["spatial"] = []
-            for i in range(0, t):
+        if self.feature_store is not None:
+            # the store takes care of the placement of the features
+            self.cpu_cache = False
+            feats = FeatureStore(
+                capacity=t, device=self.compute_device, **self.feature_store
+            )
+        try:
+            offload = self.cpu_cache or getattr(feats, "offload", False)
+            # compute spatial features
+            if offload:
+                feats["spatial"] = []
+                for i in range(0, t):
+                    if hg_idx == 1:
+                        guide_feat = self.guide_features(guides, i)
+                        feat = self.feat_extract[f"hg_{hg_idx}"](
+                            torch.cat([lqs[:, i, :, :, :], guide_feat], dim=1)
+                        )
+                    else:
+                        guide_feat = self.conv_guide_init[f"hg_{hg_idx}"](
+                            extra_inputs[:, i, :, :, :].to(guides.device)
+                        )
+                        feat = self.feat_extract[f"hg_{hg_idx}"](
+                            torch.cat(
+                                [
+                                    lqs[:, i, :, :, :],
+                                    guide_feat,
+                                    extra_feats[:, i, :, :, :],
+                                ],
+                                dim=1,
+                            )
+                        )
+                    feat = to_storage(feat, self.feature_dtype)
+                    if self.cpu_cache:
+                        feat = feat.cpu()
+                    feats["spatial"].append(feat)
+                    torch.cuda.empty_cache()
+            else:
                 if hg_idx == 1:
-                    guide_feat = self.conv_guide_init[f"hg_{hg_idx}"](
-                        guides[:, i, :, :, :]
+                    guide_feats_ = self.guide_features(guides)
+                    feats_ = self.feat_extract[f"hg_{hg_idx}"](
+                        torch.cat(
+                            [
+                                lqs.reshape(-1, c, h, w),
+                                guide_feats_,
+                            ],
+                            dim=1,
+                        )
                     )
-                    feat = self.feat_extract[f"hg_{hg_idx}"](
-                        torch.cat([lqs[:, i, :, :, :], guide_feat], dim=1)
-                    ).cpu()
                 else:
-                    guide_feat = self.conv_guide_init[f"hg_{hg_idx}"](
-                        extra_inputs[:, i, :, :, :].to(guides.device)
+                    guide_feats_ = self.conv_guide_init[f"hg_{hg_idx}"](
+                        extra_inputs.reshape(-1, 2, int(h * 4), int(w * 4))
                     )
-                    feat = self.feat_extract[f"hg_{hg_idx}"](
+                    feats_ = self.feat_extract[f"hg_{hg_idx}"](
                         torch.cat(
                             [
-                                lqs[:, i, :, :, :],
-                                guide_feat,
-                                extra_feats[:, i, :, :, :],
+                                lqs.reshape(-1, c, h, w),
+                                guide_feats_,
+                                extra_feats.reshape(-1, self.mid_channels, h, w),
                             ],
                             dim=1,
                         )
-                    ).cpu()
-                feats["spatial"].append(feat)
-                torch.cuda.empty_cache()
-        else:
-            if hg_idx == 1:
-                guide_feats_ = self.conv_guide_init[f"hg_{hg_idx}"](
-                    guides.view(-1, 3, int(h * 4), int(w * 4))
-                )
-                feats_ = self.feat_extract[f"hg_{hg_idx}"](
-                    torch.cat(
-                        [
-                            lqs.view(-1, c, h, w),
-                            guide_feats_,
-                        ],
-                        dim=1,
                     )
-                )
-            else:
-                guide_feats_ = self.conv_guide_init[f"hg_{hg_idx}"](
-                    extra_inputs.view(-1, 2, int(h * 4), int(w * 4))
-                )
-                feats_ = self.feat_extract[f"hg_{hg_idx}"](
-                    torch.cat(
-                        [
-                            lqs.view(-1, c, h, w),
-                            guide_feats_,
-                            extra_feats.view(-1, self.mid_channels, h, w),
-                        ],
-                        dim=1,
-                    )
-                )
-            h, w = feats_.shape[2:]
-            feats_ = feats_.view(n, t, -1, h, w)
-            feats["spatial"] = [feats_[:, i, :, :, :] for i in range(0, t)]
-        
-        # compute optical flow using the low-res inputs
-        flows_forward, flows_backward = self.compute_flow(guides, hg_idx)
-        
-        flows_forward = (
-            F.interpolate(
-                flows_forward.view(-1, 2, int(h * 4), int(w * 4)),
-                scale_factor=0.25,
-                mode="bicubic",
-            ).view(n, t - 1, 2, h, w)
-            / 4
-        )
-        flows_backward = (
-            F.interpolate(
-                flows_backward.view(-1, 2, int(h * 4), int(w * 4)),
-                scale_factor=0.25,
-                mode="bicubic",
-            ).view(n, t - 1, 2, h, w)
-            / 4
-        )
+                h, w = feats_.shape[2:]
+                feats_ = to_storage(feats_.view(n, t, -1, h, w), self.feature_dtype)
+                feats["spatial"] = [feats_[:, i, :, :, :] for i in range(0, t)]
         
-        # feature propagation
-        for iter_ in [1, 2]:
-            for direction in ["backward", "forward"]:
-                module = f"{direction}_{iter_}"
+            # compute optical flow at the propagation resolution
+            if self.share_flow and hg_idx == 2:
+                flows_forward, flows_backward = self._shared_flows
+                self._shared_flows = None
+            else:
+                flows_forward, flows_backward = [
+                    to_storage(flow, self.flow_dtype)
+                    for flow in self.guide_flows(guides, hg_idx)
+                ]
+                if self.share_flow:
+                    self._shared_flows = (flows_forward, flows_backward)
 
-                feats[module] = []
+            # feature propagation
+            for iter_ in range(1, self.num_prop_iters + 1):
+                for direction in ["backward", "forward"]:
+                    module = f"{direction}_{iter_}"
 
-                if direction == "backward":
-                    flows = flows_backward
-                elif flows_forward is not None:
-                    flows = flows_forward
-                else:
-                    flows = flows_backward.flip(1)
+                    feats[module] = []
 
-                feats = self.propagate(feats, flows, module, hg_idx)
-                if self.cpu_cache:
-                    del flows
-                    torch.cuda.empty_cache()
-        depth, conf, feats_fused = self.upsample(lqs, feats, hg_idx)
-        if hg_idx == 1:
-            return depth, conf, feats_fused
-        else:
-            return depth, conf, None
+                    if direction == "backward":
+                        flows = flows_backward
+                    elif flows_forward is not None:
+                        flows = flows_forward
+                    else:
+                        flows = flows_backward.flip(1)
+
+                    if (
+                        self.stream_reconstruction
+                        and module == f"forward_{self.num_prop_iters}"
+                    ):
+                        # reconstruct every frame as soon as its last branch is done
+                        outputs = []
+                        feats = self.propagate(
+                            feats,
+                            flows,
+                            module,
+                            hg_idx,
+                            on_frame=lambda i, hr: outputs.append(
+                                self.reconstruct(lqs, i, hr, hg_idx)
+                            ),
+                        )
+                    else:
+                        feats = self.propagate(feats, flows, module, hg_idx)
+                    if self.cpu_cache:
+                        del flows
+                        torch.cuda.empty_cache()
+            if self.stream_reconstruction:
+                depth, conf, feats_fused = [
+                    torch.stack(x, dim=1) for x in zip(*outputs)
+                ]
+                del outputs
+            else:
+                depth, conf, feats_fused = self.upsample(lqs, feats, hg_idx)
+            if hg_idx == 1:
+                return depth, conf, feats_fused
+            else:
+                return depth, conf, None
+        finally:
+            if isinstance(feats, FeatureStore):
+                feats.close()
+
+    def refine_runs(self, error):
+        """Frame ranges that run the refinement stage (see 'refine_mode').
+        Args:
+            error (tensor): Per-frame disagreement of the stage-1 prediction
+                with the dToF input, shape (t,); only used by 'adaptive'.
+        Returns:
+            list[tuple[int]]: (start, end) of the refined frames, chunks of
+                ``refine_chunk`` frames merged when consecutive.
+        """
+        t = error.numel()
+        if self.refine_mode == "always":
+            return [(0, t)]
+        if self.refine_mode == "never":
+            return []
+        runs = []
+        for start in range(0, t, self.refine_chunk):
+            end = min(t, start + self.refine_chunk)
+            if error[start:end].max() <= self.refine_threshold:
+                continue
+            if runs and runs[-1][1] == start:
+                runs[-1] = (runs[-1][0], end)
+            else:
+                runs.append((start, end))
+        return runs
+
+    def stage_1_error(self, lqs, rgb_depth):
+        """Per-frame disagreement of the stage-1 depth with the dToF input.
+        Args:
+            lqs (tensor): Input dToF sequence with shape (n, t, 1, h/s, w/s).
+            rgb_depth (tensor): Stage-1 depth with shape (n, t, 1, h, w).
+        Returns:
+            Tensor: Mean absolute difference of the block averages of
+                rgb_depth with the valid (non-zero) input blocks, maximum
+                over the batch, shape (t,).
+        """
+        n, t = lqs.shape[:2]
+        lqs = lqs.to(rgb_depth.device).float()
+        blocks = F.avg_pool2d(rgb_depth.flatten(0, 1).float(), self.scale)
+        blocks = blocks.view(lqs.shape)
+        valid = (lqs > 0).float()
+        error = ((blocks - lqs).abs() * valid).sum(dim=(2, 3, 4))
+        error = error / valid.sum(dim=(2, 3, 4)).clamp(min=1)
+        return error.max(dim=0)[0]
+
+    def refine(self, lqs, guides, extra_inputs, extra_feats, rgb_depth, rgb_conf, runs):
+        """Run the refinement stage on the frame ranges in 'runs'.
+        Frames outside the ranges keep the stage-1 prediction: their stage-2
+        depth is the stage-1 depth and their stage-2 confidence the lowest
+        value of its dtype, so the softmax blend gives them no weight.
+        Returns:
+            tuple(Tensor): stage-2 depth and confidence with shape (n, t, 1, h, w)
+        """
+        t = lqs.size(1)
+        self.refine_stats = dict(
+            frames=t, refined_frames=sum(end - start for start, end in runs)
+        )
+        # stage-1 flows of share_flow, released whatever runs
+        shared_flows, self._shared_flows = self._shared_flows, None
+        try:
+            if runs == [(0, t)]:
+                self._shared_flows = shared_flows
+                d_depth, d_conf, _ = self.hg_forward(
+                    lqs, guides, extra_inputs, extra_feats, hg_idx=2
+                )
+                return d_depth, d_conf
+
+            d_depth = rgb_depth.clone()
+            d_conf = torch.full_like(rgb_conf, torch.finfo(rgb_conf.dtype).min)
+            if shared_flows is not None and shared_flows[0] is None:
+                # a mirror-extended sequence only stores the backward flows,
+                # whose flip is not the forward flow of a sub-range
+                shared_flows = (shared_flows[1].flip(1), shared_flows[1])
+            for start, end in runs:
+                if shared_flows is not None:
+                    self._shared_flows = tuple(
+                        flow[:, start : end - 1] for flow in shared_flows
+                    )
+                depth, conf, _ = self.hg_forward(
+                    lqs[:, start:end],
+                    guides[:, start:end],
+                    extra_inputs[:, start:end],
+                    extra_feats[:, start:end],
+                    hg_idx=2,
+                )
+                d_depth[:, start:end] = depth
+                d_conf[:, start:end] = conf
+            return d_depth, d_conf
+        finally:
+            self._shared_flows = None
 
     def forward(self, lqs, guides):
         """Forward function for BasicVSR++.
@@ -511,27 +1008,40 @@ class DVSR(nn.Module):
         Returns:
             Tensor: Output HR sequence with shape (n, t, c, h, w).
         """
+        self.flow_stats = dict(pairs=0, skipped_pairs=0)
+        lq_blocks = lqs
         lqs = lqs.repeat_interleave(self.scale//4, dim = 3).repeat_interleave(self.scale//4, dim = 4)
         n, t, c, h, w = lqs.size() ## 1/4 resolution of final output
 
         rgb_depth, rgb_conf, rgb_feats = self.hg_forward(lqs, guides, hg_idx=1)
-        d_depth, d_conf, _ = self.hg_forward(
-            lqs, guides, torch.cat((rgb_depth, rgb_conf), dim=2), rgb_feats, hg_idx=2
+        if self.refine_mode == "adaptive":
+            error = self.stage_1_error(lq_blocks, rgb_depth)
+        else:
+            error = torch.zeros(t)
+        d_depth, d_conf = self.refine(
+            lqs,
+            guides,
+            torch.cat((rgb_depth, rgb_conf), dim=2),
+            rgb_feats,
+            rgb_depth,
+            rgb_conf,
+            self.refine_runs(error),
         )
 
-        rgb_conf, d_conf = torch.chunk(
-            self.softmax(
-                torch.cat(
-                    (
-                        rgb_conf,
-                        d_conf,
-                    ),
-                    dim=2,
-                )
-            ),
-            2,
-            dim=2,
-        )
+        with fp32_region(d_conf):
+            rgb_conf, d_conf = torch.chunk(
+                self.softmax(
+                    torch.cat(
+                        (
+                            rgb_conf.float(),
+                            d_conf.float(),
+                        ),
+                        dim=2,
+                    )
+                ),
+                2,
+                dim=2,
+            )
         
         depth_final = d_depth * d_conf + rgb_depth * rgb_conf
         intermed = {
@@ -1,24 +1,29 @@
-HVSR Implementation with Detailed Comments
-
 # Copyright (c) Meta Platforms, Inc. and affiliates.
 # Adapted from BasicVSR++ network structure: "BasicVSR++: Improving Video Super-Resolution with Enhanced Propagation and Alignment"
 
 import numpy as np
+import functools
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from mmcv.cnn import constant_init
-from mmcv.ops import ModulatedDeformConv2d, modulated_deform_conv2d
 from mmcv.runner import load_checkpoint
 
 from .common import PixelShufflePack, flow_warp, ResidualBlocksWithInputConv, SPyNet, SecondOrderDeformableAlignment
+from .common import FEATURE_TIERS, ConcatBuffer, FeatureStore, GuideCache, flow_warp_batched
+from .common import estimate_activation_bytes, reconstruction_chunk
+from .common.precision import STORAGE_DTYPES, fp32_region, from_storage, to_storage
 from .registry import BACKBONES
-from mmseg.utils import get_root_logger
 
 
-def dtof_hist_torch(d, img, rebin_idx, pitch, temp_res):
+def dtof_hist_torch(d, img, rebin_idx, pitch, temp_res, chunk_size=None):
     """
     Convert predicted depth map into a histogram for comparison with dToF sensor data
+
+    The histogram is formed block by block: the rebin indices stay at block
+    resolution and are broadcast over the pitch x pitch pixels of each block,
+    so no full-resolution (n*t, M, h, w) volume is allocated.
     
     Args:
         d (tensor): predicted depth map with size (n*t, 1, h, w)
@@ -28,40 +33,49 @@ def dtof_hist_torch(d, img, rebin_idx, pitch, temp_res):
             with size (n*t, 2*self.mpeaks+2, h/s, w/s)
         pitch: size of each patch (iFoV), same as self.scale in main model
         temp_res: temporal resolution of dToF sensor
+        chunk_size: number of frames processed at once (None: all frames)
     """
-    d = torch.clamp(d.clone(), min=0.0, max=1.0).to(img.device)
+    if chunk_size is not None and d.size(0) > chunk_size:
+        return torch.cat(
+            [
+                dtof_hist_torch(
+                    d[i : i + chunk_size],
+                    img[i : i + chunk_size],
+                    rebin_idx[i : i + chunk_size],
+                    pitch,
+                    temp_res,
+                )
+                for i in range(0, d.size(0), chunk_size)
+            ],
+            dim=0,
+        )
+
+    d = torch.clamp(d, min=0.0, max=1.0).to(img.device)
     B, _, H, W = d.shape ## same resolution as final output
-    _, M, _, _ = rebin_idx.shape
+    _, M, h, w = rebin_idx.shape
     
     # Calculate albedo from input image
     albedo = torch.mean(img, dim=1).unsqueeze(1)
     # Apply inverse square law for intensity falloff
-    r = albedo / (1e-3 + d**2)
-
-    # Upsample rebin indices to match depth map resolution
-    rebin_idx = torch.repeat_interleave(
-        torch.repeat_interleave(rebin_idx, pitch, dim=2), pitch, dim=3
-    ).detach()
-    
-    # Create histogram by comparing depth values with rebin indices
-    hist = torch.sum(
-        ((torch.round(d * (temp_res - 1)) - rebin_idx) >= 0).float(), dim=1
-    ).unsqueeze(1)
-
-    # Convert to one-hot representation
-    idx_volume = (
-        torch.arange(1, M + 1).unsqueeze(0).unsqueeze(2).unsqueeze(3).float().to(img.device)
-    )
-    hist = ((hist - idx_volume) == 0).float()
-    
-    # Apply intensity weighting and downsample
-    hist = torch.sum(
-        (hist * r).view(B, M, H // pitch, pitch, W // pitch, pitch), dim=(3, 5)
-    )
+    r = (albedo / (1e-3 + d**2)).view(B, h, pitch, w, pitch)
+
+    # Per pixel, count the rebin indices at or below its depth bin; the
+    # indices of a block are broadcast over its pixels
+    depth_bin = torch.round(d * (temp_res - 1)).view(B, h, pitch, w, pitch)
+    rebin_idx = rebin_idx.detach().view(B, M, h, 1, w, 1)
+    count = torch.zeros(depth_bin.shape, device=img.device)
+    for m in range(M):
+        count += ((depth_bin - rebin_idx[:, m]) >= 0).float()
+
+    # Intensity-weighted block sums of the pixels falling into each bin
+    hist = r.new_empty(B, M, h, w, dtype=torch.promote_types(r.dtype, count.dtype))
+    for m in range(M):
+        hist[:, m] = torch.sum((count == m + 1).float() * r, dim=(2, 4))
     return hist
 
 
-def get_inp_error(cdf, rebin_idx, pred, img, pitch, temp_res):
+def get_inp_error(cdf, rebin_idx, pred, img, pitch, temp_res, upsample=True,
+                  chunk_size=None):
     """
     Calculate histogram matching error between predicted depth and sensor measurements
     
@@ -72,6 +86,9 @@ def get_inp_error(cdf, rebin_idx, pred, img, pitch, temp_res):
         img (tensor): Input guidance RGB image (n*t, 3, h, w)
         pitch: Size of each patch (iFoV), same as self.scale in main model
         temp_res: Temporal resolution
+        upsample: Return the error map at full resolution (n*t, 1, h, w) instead of
+            one value per block (n*t, 1, h/s, w/s)
+        chunk_size: Number of frames of a histogram chunk (None: all frames)
         
     Returns:
         tensor: Histogram matching error map
@@ -83,7 +100,9 @@ def get_inp_error(cdf, rebin_idx, pred, img, pitch, temp_res):
     cdf_inp = cdf / (torch.max(cdf, dim=1)[0].unsqueeze(1) + 1e-3)
 
     # Generate histogram from prediction and convert to CDF
-    hist_pred = dtof_hist_torch(pred, img, rebin_idx[:, :-1], pitch, temp_res)
+    hist_pred = dtof_hist_torch(
+        pred, img, rebin_idx[:, :-1], pitch, temp_res, chunk_size
+    )
     hist_pred = hist_pred / (torch.sum(hist_pred, dim=1).unsqueeze(1) + 1e-3)
     cdf_pred = torch.cumsum(hist_pred, dim=1).detach()
     
@@ -92,27 +111,34 @@ def get_inp_error(cdf, rebin_idx, pred, img, pitch, temp_res):
         torch.abs((cdf_inp[:, 1:] - cdf_pred) * delta_idx), dim=1
     ).unsqueeze(1)
     inp_error[torch.max(cdf_inp, axis=1)[0].unsqueeze(1) == 0] = -1
+    del hist_pred, cdf_pred, cdf_inp, rebin_idx
+    inp_error = inp_error.detach()
 
     # Upsample error map
-    inp_error = torch.repeat_interleave(
-        torch.repeat_interleave(inp_error, pitch, dim=2), pitch, dim=3
-    ).detach()
-    del hist_pred, cdf_pred, cdf_inp, rebin_idx
+    if upsample:
+        inp_error = torch.repeat_interleave(
+            torch.repeat_interleave(inp_error, pitch, dim=2), pitch, dim=3
+        )
     return inp_error
 
 
-def get_pos_encoding(B, T, H, W, pitch):
+def get_pos_encoding(B, T, H, W, pitch, origin=(0, 0), frame_size=None):
     """
     Generate positional encodings to assist alignment vector predictions
     
     Args:
         B, T, H, W: Batch size, number of frames, height and width of sequence
         pitch: Size of each patch (iFoV) same as self.scale in main model
+        origin: (y, x) position of the sequence inside the full frame, used
+            when the frame is processed in tiles. Default: (0, 0)
+        frame_size: (H, W) of the full frame. Default: (H, W)
         
     Returns:
         tensor: Position encodings containing absolute positions, relative positions within patches,
                and patch center positions
     """
+    frame_h, frame_w = (H, W) if frame_size is None else frame_size
+
     # Create coordinate grids
     y, x = torch.meshgrid(torch.arange(H), torch.arange(W))
     y = y.unsqueeze(0).unsqueeze(1).float()
@@ -133,9 +159,11 @@ def get_pos_encoding(B, T, H, W, pitch):
     rel_x = x - patch_x
     
     # Combine different position representations
-    abs_pos = torch.cat((y / H, x / W), dim=1)
+    abs_pos = torch.cat(((y + origin[0]) / frame_h, (x + origin[1]) / frame_w), dim=1)
     rel_pos = torch.cat((rel_y / pitch, rel_x / pitch), dim=1)
-    patch_pos = torch.cat((patch_y / H, patch_x / W), dim=1)
+    patch_pos = torch.cat(
+        ((patch_y + origin[0]) / frame_h, (patch_x + origin[1]) / frame_w), dim=1
+    )
     pos_encoding = torch.cat((abs_pos, rel_pos, patch_pos), dim=1).float().unsqueeze(1)
     return pos_encoding.repeat(B, T, 1, 1, 1)
 
@@ -160,6 +188,45 @@ class HVSR(nn.Module):
         is_low_res_input (bool): Whether input is low-resolution
         spynet_pretrained (str): Pre-trained model path for optical flow network
         cpu_cache_length (int): Threshold for using CPU cache to save GPU memory
+        deform_backend (str): Deformable alignment implementation ('auto', 'mmcv',
+            'torchvision' or 'grid_sample')
+        flow_resolution (str): Resolution of the optical flow estimation ('full',
+            'quarter' or 'pyramid')
+        share_flow (bool): Reuse the optical flow of stage 1 in stage 2 (single SPyNet)
+        fast_propagation (bool): Batched warping and reused concatenation buffers in
+            the propagation loop (bit-for-bit equal outputs)
+        stream_reconstruction (bool): Reconstruct frames during the last propagation
+            branch and release consumed features to lower peak memory
+        feature_store (str | dict): FeatureStore tier of the branch features ('device',
+            'host' or 'disk', or a dict with the store arguments), replaces cpu_cache
+        feature_dtype (str): Storage dtype of the branch features, 'float16' or 'bfloat16'
+            (upcast to float32 when consumed; None keeps float32)
+        flow_dtype (str): Storage dtype of the optical flows, as feature_dtype
+        memory_budget (int): Device memory budget in bytes; if given, cpu_cache is enabled when
+            the estimated activation memory exceeds it (instead of cpu_cache_length)
+        recon_chunk (int | str): Frames reconstructed at once, stacked along the batch
+            ('auto': from memory_budget; 1: per-frame loop, always used with cpu_cache)
+        refine_mode (str): 'always', 'never' (stage-1 prediction only) or 'adaptive':
+            skip stage 2 for chunks of refine_chunk frames whose mean histogram
+            error (see 'get_inp_error') stays below refine_threshold on every frame
+        refine_threshold (float): See refine_mode, calibrate with
+            tools/benchmark_refinement.py
+        refine_chunk (int): See refine_mode
+        static_flow_threshold (float): Guide pairs with a mean absolute difference at 1/8
+            resolution below it get zero flows without SPyNet (None: all flows computed)
+        guide_cache (GuideCache | dict): Reuse the SPyNet flows and stage-1 guide
+            features of guides seen before (e.g. dToF sweeps of one video)
+        compile_propagation (bool | dict): torch.compile the steady-state propagation
+            step, one graph per branch (dict: torch.compile arguments)
+        hist_chunk_size (int): Frames per chunk of the block-level histogram of the
+            input error (None: all frames at once)
+        split_guide_init (bool): Without autograd, compute the contribution of the
+            positional encoding to the first stage-2 guide convolution once per
+            resolution instead of once per frame, without concatenating the
+            expanded encoding to the stage-2 inputs (opt-in, equal up to float
+            rounding; the default concatenates, as during training)
+        num_prop_iters (int): Number of backward/forward propagation iterations
+            (1 for a lighter student model, not checkpoint compatible)
     """
 
     def __init__(
@@ -172,12 +239,85 @@ class HVSR(nn.Module):
         is_low_res_input=True,
         spynet_pretrained=None,
         cpu_cache_length=200,
+        deform_backend='auto',
+        flow_resolution='full',
+        share_flow=False,
+        fast_propagation=True,
+        stream_reconstruction=False,
+        feature_store=None,
+        feature_dtype=None,
+        flow_dtype=None,
+        memory_budget=None,
+        recon_chunk=1,
+        refine_mode="always",
+        refine_threshold=0.01,
+        refine_chunk=10,
+        static_flow_threshold=None,
+        guide_cache=None,
+        compile_propagation=False,
+        hist_chunk_size=16,
+        split_guide_init=False,
+        num_prop_iters=2,
     ):
         super().__init__()
         self.mid_channels = mid_channels
+        if num_prop_iters < 1:
+            raise ValueError(
+                f"num_prop_iters must be positive, but got {num_prop_iters}"
+            )
+        self.num_prop_iters = num_prop_iters
         self.is_low_res_input = is_low_res_input
         self.scale = scale
         self.cpu_cache_length = cpu_cache_length
+        if flow_resolution not in ("full", "quarter", "pyramid"):
+            raise ValueError(
+                "flow_resolution must be 'full', 'quarter' or 'pyramid', "
+                f"but got {flow_resolution}"
+            )
+        self.flow_resolution = flow_resolution
+        self.share_flow = share_flow
+        self.fast_propagation = fast_propagation
+        self.stream_reconstruction = stream_reconstruction
+        if isinstance(feature_store, str):
+            feature_store = dict(tier=feature_store)
+        if feature_store is not None and feature_store.get("tier") not in FEATURE_TIERS:
+            raise ValueError(
+                f"feature_store tier must be one of {FEATURE_TIERS}, "
+                f"but got {feature_store.get('tier')}"
+            )
+        self.feature_store = feature_store
+        for name, dtype in [("feature_dtype", feature_dtype), ("flow_dtype", flow_dtype)]:
+            if dtype is not None and dtype not in STORAGE_DTYPES:
+                raise ValueError(
+                    f"{name} must be None, 'float16' or 'bfloat16', but got {dtype}"
+                )
+        self.feature_dtype = STORAGE_DTYPES.get(feature_dtype)
+        self.flow_dtype = STORAGE_DTYPES.get(flow_dtype)
+        self.memory_budget = memory_budget
+        if recon_chunk != "auto" and not (isinstance(recon_chunk, int) and recon_chunk >= 1):
+            raise ValueError(
+                f"recon_chunk must be a positive integer or 'auto', but got {recon_chunk}"
+            )
+        self.recon_chunk = recon_chunk
+        if refine_mode not in ("always", "adaptive", "never"):
+            raise ValueError(
+                "refine_mode must be 'always', 'adaptive' or 'never', "
+                f"but got {refine_mode}"
+            )
+        self.refine_mode = refine_mode
+        self.refine_threshold = refine_threshold
+        self.refine_chunk = refine_chunk
+        self.refine_stats = None
+        self.static_flow_threshold = static_flow_threshold
+        self.flow_stats = dict(pairs=0, skipped_pairs=0)
+        if isinstance(guide_cache, dict):
+            guide_cache = GuideCache(**guide_cache)
+        self.guide_cache = guide_cache
+        self.compile_propagation = compile_propagation
+        self._compiled_steps = {}
+        self.hist_chunk_size = hist_chunk_size
+        self.split_guide_init = split_guide_init
+        self._shared_flows = None
 
         self.args = dtof_args
         self.mpeaks = self.args['mpeaks']
@@ -186,7 +326,8 @@ class HVSR(nn.Module):
         # Optical flow networks for both stages
         self.spynet = nn.ModuleDict()
         self.spynet["hg_1"] = SPyNet(pretrained=spynet_pretrained)
-        self.spynet["hg_2"] = SPyNet(pretrained=spynet_pretrained)
+        if not share_flow:  # otherwise stage 2 reuses the flows of stage 1
+            self.spynet["hg_2"] = SPyNet(pretrained=spynet_pretrained)
 
         # Feature extraction modules
         self.conv_guide_init = nn.ModuleDict()
@@ -231,7 +372,11 @@ class HVSR(nn.Module):
         self.backbone["hg_2"] = nn.ModuleDict()
 
         # Initialize propagation modules for both forward and backward directions
-        modules = ["backward_1", "forward_1", "backward_2", "forward_2"]
+        modules = [
+            f"{direction}_{iter_}"
+            for iter_ in range(1, num_prop_iters + 1)
+            for direction in ["backward", "forward"]
+        ]
         for i, module in enumerate(modules):
             self.deform_align["hg_1"][module] = SecondOrderDeformableAlignment(
                 3,
@@ -241,6 +386,7 @@ class HVSR(nn.Module):
                 padding=1,
                 deform_groups=16,
                 max_residue_magnitude=max_residue_magnitude,
+                backend=deform_backend,
             )
             self.deform_align["hg_2"][module] = SecondOrderDeformableAlignment(
                 3,
@@ -250,6 +396,7 @@ class HVSR(nn.Module):
                 padding=1,
                 deform_groups=16,
                 max_residue_magnitude=max_residue_magnitude,
+                backend=deform_backend,
             )
             self.backbone["hg_1"][module] = ResidualBlocksWithInputConv(
                 (2 + i) * mid_channels, mid_channels, num_blocks
@@ -264,10 +411,10 @@ class HVSR(nn.Module):
         # Reconstruction modules for both stages
         self.reconstruction = nn.ModuleDict()
         self.reconstruction["hg_1"] = ResidualBlocksWithInputConv(
-            5 * mid_channels, mid_channels, 5
+            (1 + 2 * num_prop_iters) * mid_channels, mid_channels, 5
         )
         self.reconstruction["hg_2"] = ResidualBlocksWithInputConv(
-            5 * mid_channels, mid_channels, 5
+            (1 + 2 * num_prop_iters) * mid_channels, mid_channels, 5
         )
 
         # Final prediction layers for depth and confidence
@@ -301,7 +448,77 @@ class HVSR(nn.Module):
         # Flag for mirror-extended sequence
         self.is_mirror_extended = False
 
-def check_if_mirror_extended(self, lqs):
+        # Position of the current input inside the full frame, set by tiled
+        # inference (see 'apis/tiled_inference.py')
+        self.pos_window = None
+        # Positional encodings and their first-convolution terms, per
+        # resolution, window and device (see 'pos_encoding')
+        self._pos_cache = {}
+        self._pos_term = None
+
+    def pos_encoding(self, H, W, device):
+        """Positional encoding of the current window, cached.
+        Args:
+            H, W: Height and width of the sequence (full resolution)
+            device: Device of the encoding
+        Returns:
+            tensor: Encoding with shape (1, 1, 6, H, W), to be broadcast over
+                the batch and the frames
+        """
+        window = self.pos_window or {}
+        key = ("enc", H, W, self.scale, str(device), repr(sorted(window.items())))
+        if key not in self._pos_cache:
+            self._cache_put(
+                key,
+                get_pos_encoding(1, 1, H, W, self.scale, **window).to(device),
+            )
+        return self._pos_cache[key]
+
+    def pos_term(self, H, W, device):
+        """Contribution of the positional encoding to the first convolution
+        of conv_guide_init['hg_2'] (bias included), cached per resolution and
+        weights. Only valid without autograd.
+        Returns:
+            tensor: Term with shape (1, mid_channels, H, W)
+        """
+        conv = self.conv_guide_init["hg_2"][0]
+        window = self.pos_window or {}
+        key = (
+            "term", H, W, self.scale, str(device), repr(sorted(window.items())),
+            conv.weight.data_ptr(), conv.weight._version, conv.bias._version,
+            torch.is_autocast_enabled(), torch.is_autocast_cpu_enabled(),
+        )
+        if key not in self._pos_cache:
+            pos = self.pos_encoding(H, W, device)[:, 0]
+            self._cache_put(
+                key,
+                F.conv2d(pos, conv.weight[:, 2:8], conv.bias, conv.stride, conv.padding),
+            )
+        return self._pos_cache[key]
+
+    def _cache_put(self, key, value, max_entries=16):
+        # tiled inference creates one entry per tile, keep the latest ones
+        while len(self._pos_cache) >= max_entries:
+            del self._pos_cache[next(iter(self._pos_cache))]
+        self._pos_cache[key] = value
+
+    def guide_init_2(self, x):
+        """Apply conv_guide_init['hg_2'] to the stage-2 inputs.
+        Args:
+            x (tensor): Depth, confidence, positional encoding and input error
+                with shape (n, 9, h, w), or without the positional encoding
+                (n, 3, h, w) when its term of the first convolution is
+                precomputed (see 'pos_term')
+        """
+        layers = self.conv_guide_init["hg_2"]
+        if self._pos_term is None:
+            return layers(x)
+        conv = layers[0]
+        weight = torch.cat((conv.weight[:, :2], conv.weight[:, 8:]), dim=1)
+        x = F.conv2d(x, weight, None, conv.stride, conv.padding) + self._pos_term
+        return layers[1:](x)
+
+    def check_if_mirror_extended(self, lqs):
         """Check whether the input sequence is mirror-extended.
         
         Mirror extension means the sequence is reflected around its midpoint,
@@ -312,16 +529,17 @@ def check_if_mirror_extended(self, lqs):
             lqs (tensor): Input low quality sequence with shape (n, t, c, h, w)
                 where n=batch size, t=sequence length, c=channels, h=height, w=width
         """
+        # reset, the flag must not stick from a previous sequence
+        self.is_mirror_extended = False
         # Only check if sequence length is even
         if lqs.size(1) % 2 == 0:
             # Split sequence into two equal halves
             lqs_1, lqs_2 = torch.chunk(lqs, 2, dim=1)
             # Check if first half equals second half reversed
-            # If norm is 0, sequences are identical
-            if torch.norm(lqs_1 - lqs_2.flip(1)) == 0:
+            if torch.equal(lqs_1, lqs_2.flip(1)):
                 self.is_mirror_extended = True
 
-    def compute_flow(self, guides, hg_idx):
+    def compute_flow(self, guides, hg_idx, skip_levels=0):
         """Compute optical flow between consecutive frames using SPyNet.
         
         For mirror-extended sequences, only backward flow is computed since
@@ -330,6 +548,7 @@ def check_if_mirror_extended(self, lqs):
         Args:
             guides (tensor): Input sequence, shape (n, t, c, h, w)
             hg_idx: Stage identifier (1=initial stage, 2=refinement stage)
+            skip_levels: Number of finest SPyNet pyramid levels to skip
         
         Returns:
             tuple(Tensor): Forward and backward optical flows:
@@ -337,53 +556,163 @@ def check_if_mirror_extended(self, lqs):
                 - flows_backward: Flow from current to next frame
                 Both have shape (n, t-1, 2, h, w)
         """
-        n, t, c, h, w = guides.size()
-        # Split into consecutive pairs for flow computation 
-        guides_1 = guides[:, :-1, :, :, :]  # frames 0 to t-1
-        guides_2 = guides[:, 1:, :, :, :]   # frames 1 to t
-        
-        if self.cpu_cache:
-            # Process frames sequentially when using CPU cache
-            flows_backward = []
-            for tt in range(t-1):
-                fb = self.spynet[f"hg_{hg_idx}"](guides_1[:,tt], guides_2[:,tt])
-                flows_backward.append(fb.unsqueeze(1))
-            flows_backward = torch.cat(flows_backward, dim = 1)
-        
-        else:
-            # Process all frames at once if memory allows
-            guides_1 = guides_1.reshape(-1, c, h, w)
-            guides_2 = guides_2.reshape(-1, c, h, w)
-            flows_backward = self.spynet[f"hg_{hg_idx}"](guides_1, guides_2).view(
-                n, t - 1, 2, h, w
-            )
-        
-        # For mirror-extended sequences, forward flow is backward flow reversed
-        if self.is_mirror_extended:
-            flows_forward = None
-        else:
-            if self.cpu_cache:
-                # Sequential processing for forward flows
-                flows_forward = []
-                for tt in range(t-1):
-                    ff = self.spynet[f"hg_{hg_idx}"](guides_2[:,tt], guides_1[:,tt])
-                    flows_forward.append(ff.unsqueeze(1))
-                flows_forward = torch.cat(flows_forward, dim = 1)
-            else:
-                guides_1 = guides_1.reshape(-1, c, h, w)
-                guides_2 = guides_2.reshape(-1, c, h, w)
-                flows_forward = self.spynet[f"hg_{hg_idx}"](guides_2, guides_1).view(
-                    n, t - 1, 2, h, w
-                )
-        
-        # Move flows to CPU if using CPU cache to save GPU memory
+
+        static = None
+        if self.static_flow_threshold is not None:
+            static = SPyNet.static_pairs(guides, self.static_flow_threshold)
+            self.flow_stats["pairs"] += static.numel()
+            self.flow_stats["skipped_pairs"] += int(static.sum())
+
+        # every frame is pyramided once and shared by all pairs
+        flows_backward, flows_forward = self.spynet[
+            f"hg_{hg_idx}"
+        ].compute_flow_sequence(
+            guides,
+            skip_levels,
+            # flows_forward = flows_backward.flip(1) for mirror-extended inputs
+            with_forward=not self.is_mirror_extended,
+            per_pair=self.cpu_cache,
+            static=static,
+        )
+
         if self.cpu_cache:
             flows_backward = flows_backward.cpu()
-            flows_forward = flows_forward.cpu()
+            if flows_forward is not None:
+                flows_forward = flows_forward.cpu()
 
         return flows_forward, flows_backward
 
-    def propagate(self, feats, flows, module_name, hg_idx):
+    def get_flows(self, guides, hg_idx):
+        """Compute optical flows at the propagation (1/4) resolution.
+        'full' runs SPyNet on the full-resolution guides and downsamples the
+        flows, 'quarter' runs SPyNet on guides downsampled by 4 and
+        'pyramid' stops the SPyNet pyramid two levels early.
+        Args:
+            guides (tensor): Input RGB guidance with shape (n, t, 3, h, w)
+            hg_idx: Identify processing stage: init stage or refine stage
+        Return:
+            tuple(Tensor): 'flows_forward' (None for mirror-extended inputs)
+                and 'flows_backward' with shape (n, t - 1, 2, h/4, w/4).
+        """
+
+        n, t, c, h, w = guides.size()
+
+        # flows are always estimated in float32
+        with fp32_region(guides):
+            guides = guides.float()
+            if self.flow_resolution == "quarter":
+                guides = F.avg_pool2d(guides.reshape(-1, c, h, w), 4)
+                return self.compute_flow(
+                    guides.view(n, t, c, h // 4, w // 4), hg_idx
+                )
+            if self.flow_resolution == "pyramid":
+                return self.compute_flow(guides, hg_idx, skip_levels=2)
+            flows = self.compute_flow(guides, hg_idx)
+
+        return tuple(
+            None
+            if flow is None
+            else F.interpolate(
+                flow.reshape(-1, 2, h, w),
+                scale_factor=0.25,
+                mode="bicubic",
+            ).view(n, t - 1, 2, h // 4, w // 4)
+            / 4
+            for flow in flows
+        )
+
+    def guide_flows(self, guides, hg_idx):
+        """'get_flows' through the guide cache, if any."""
+        if self.guide_cache is None:
+            return self.get_flows(guides, hg_idx)
+        cache = self.guide_cache
+        key = cache.key(
+            "flows",
+            cache.digest(guides),
+            cache.module_digest(self.spynet[f"hg_{hg_idx}"]),
+            self.flow_resolution,
+            self.static_flow_threshold,
+            self.is_mirror_extended,
+        )
+        device = "cpu" if self.cpu_cache else self.compute_device
+        return cache.fetch(key, lambda: self.get_flows(guides, hg_idx), device)
+
+    def guide_features(self, guides, i=None):
+        """conv_guide_init['hg_1'] of all frames of the guides, or of frame i,
+        through the guide cache, if any.
+        Args:
+            guides (tensor): Input RGB guidance with shape (n, t, 3, h, w)
+            i (int): Frame index, None for all frames stacked along the batch
+        """
+        conv = self.conv_guide_init["hg_1"]
+
+        def compute():
+            return conv(guides.flatten(0, 1) if i is None else guides[:, i])
+
+        if self.guide_cache is None:
+            return compute()
+        cache = self.guide_cache
+        key = cache.key(
+            "guide_feats",
+            cache.digest(guides),
+            cache.module_digest(conv),
+            torch.is_autocast_enabled() and torch.get_autocast_gpu_dtype(),
+            torch.is_autocast_cpu_enabled() and torch.get_autocast_cpu_dtype(),
+            i,
+        )
+        return cache.fetch(key, compute, self.compute_device)
+
+    @staticmethod
+    def propagation_step(deform_align, backbone, feat_prop, feat_n2, flow_n1,
+                         flow_n2, feat_current, *branch_feats):
+        """A steady-state step of 'propagate' (both neighbours available) as a
+        pure tensor function, which torch.compile captures once per branch.
+        Args:
+            deform_align (nn.Module): Alignment module of the branch.
+            backbone (nn.Module): Residual blocks of the branch.
+            feat_prop, feat_n2 (tensor): Propagated features of the previous
+                two steps with shape (n, c, h/4, w/4).
+            flow_n1, flow_n2 (tensor): Flows to the previous two frames with
+                shape (n, 2, h/4, w/4), flow_n2 not yet composed.
+            feat_current (tensor): Spatial features of the frame.
+            branch_feats (tensor): Features of the previous branches.
+        Returns:
+            Tensor: Propagated features of this step.
+        """
+        flow_n2 = flow_n1 + flow_warp(flow_n2, flow_n1.permute(0, 2, 3, 1))
+        cond_n1 = flow_warp(feat_prop, flow_n1.permute(0, 2, 3, 1))
+        cond_n2 = flow_warp(feat_n2, flow_n2.permute(0, 2, 3, 1))
+        cond = torch.cat([cond_n1, feat_current, cond_n2], dim=1)
+        feat_prop = deform_align(
+            torch.cat([feat_prop, feat_n2], dim=1), cond, flow_n1, flow_n2
+        )
+        feat = torch.cat([feat_current, *branch_feats, feat_prop], dim=1)
+        return feat_prop + backbone(feat)
+
+    def compiled_step(self, hg_idx, module_name):
+        """'propagation_step' of a branch, compiled on first use."""
+        key = (hg_idx, module_name)
+        if key not in self._compiled_steps:
+            options = self.compile_propagation
+            options = options if isinstance(options, dict) else {}
+            self._compiled_steps[key] = torch.compile(
+                functools.partial(
+                    self.propagation_step,
+                    self.deform_align[f"hg_{hg_idx}"][module_name],
+                    self.backbone[f"hg_{hg_idx}"][module_name],
+                ),
+                **options,
+            )
+        return self._compiled_steps[key]
+
+    @staticmethod
+    def _cat(tensors, buffer=None):
+        """torch.cat along channels, into a reusable buffer if given."""
+        if buffer is None:
+            return torch.cat(tensors, dim=1)
+        return buffer.cat(tensors)
+
+    def propagate(self, feats, flows, module_name, hg_idx, on_frame=None):
         """Propagate features through the sequence using deformable convolution.
         
         Implements bi-directional feature propagation with second-order motion
@@ -414,6 +743,18 @@ def check_if_mirror_extended(self, lqs):
             frame_idx = frame_idx[::-1]
             flow_idx = frame_idx
 
+        # Reusable concatenation buffers (inference only, no autograd)
+        buffers = [None, None, None]
+        if self.fast_propagation and not torch.is_grad_enabled():
+            buffers = [ConcatBuffer() for _ in range(3)]
+        # Branches whose features are aggregated at every step
+        branches = [k for k in feats if k not in ["spatial", module_name]]
+        if isinstance(feats, FeatureStore):
+            # read order of this pass, for the background prefetch
+            feats.schedule("spatial", [mapping_idx[idx] for idx in frame_idx])
+            for k in branches:
+                feats.schedule(k, frame_idx)
+
         # Initialize feature propagation tensor
         feat_prop = flows.new_zeros(n, self.mid_channels, h, w)
         
@@ -421,55 +762,100 @@ def check_if_mirror_extended(self, lqs):
         for i, idx in enumerate(frame_idx):
             feat_current = feats["spatial"][mapping_idx[idx]]
             if self.cpu_cache:
-                feat_current = feat_current.cuda()
-                feat_prop = feat_prop.cuda()
+                feat_current = feat_current.to(self.compute_device)
+                feat_prop = feat_prop.to(self.compute_device)
+            feat_current = from_storage(feat_current, self.feature_dtype)
                 
-            # Apply second-order deformable alignment after first frame
-            if i > 0:
-                # Get first-order flow and features
+            if i > 1 and self.compile_propagation:
+                # steady state: one captured graph per branch
+                feat_list = [feat_current] + [feats[k][idx] for k in branches]
+                feat_n2 = feats[module_name][-2]
                 flow_n1 = flows[:, flow_idx[i], :, :, :]
+                flow_n2 = flows[:, flow_idx[i - 1], :, :, :]
                 if self.cpu_cache:
-                    flow_n1 = flow_n1.cuda()
-                cond_n1 = flow_warp(feat_prop, flow_n1.permute(0, 2, 3, 1))
-
-                # Initialize second-order terms
-                feat_n2 = torch.zeros_like(feat_prop)
-                flow_n2 = torch.zeros_like(flow_n1)
-                cond_n2 = torch.zeros_like(cond_n1)
-
-                # Compute second-order terms if available
-                if i > 1:
-                    feat_n2 = feats[module_name][-2]
-                    if self.cpu_cache:
-                        feat_n2 = feat_n2.cuda()
-
-                    flow_n2 = flows[:, flow_idx[i - 1], :, :, :]
+                    feat_list = [f.to(self.compute_device) for f in feat_list]
+                    feat_n2 = feat_n2.to(self.compute_device)
+                    flow_n1 = flow_n1.to(self.compute_device)
+                    flow_n2 = flow_n2.to(self.compute_device)
+                feat_list = [from_storage(f, self.feature_dtype) for f in feat_list]
+                feat_prop = self.compiled_step(hg_idx, module_name)(
+                    feat_prop,
+                    from_storage(feat_n2, self.feature_dtype),
+                    from_storage(flow_n1, self.flow_dtype),
+                    from_storage(flow_n2, self.flow_dtype),
+                    *feat_list,
+                )
+                feat_list.append(feat_prop)
+            else:
+                # Apply second-order deformable alignment after first frame
+                if i > 0:
+                    # Get first-order flow and features
+                    flow_n1 = flows[:, flow_idx[i], :, :, :]
                     if self.cpu_cache:
-                        flow_n2 = flow_n2.cuda()
-
-                    # Compose flows for second-order motion
-                    flow_n2 = flow_n1 + flow_warp(flow_n2, flow_n1.permute(0, 2, 3, 1))
-                    cond_n2 = flow_warp(feat_n2, flow_n2.permute(0, 2, 3, 1))
+                        flow_n1 = flow_n1.to(self.compute_device)
+                    flow_n1 = from_storage(flow_n1, self.flow_dtype)
+
+                    # Compute second-order terms if available
+                    if i > 1:
+                        feat_n2 = feats[module_name][-2]
+                        if self.cpu_cache:
+                            feat_n2 = feat_n2.to(self.compute_device)
+                        feat_n2 = from_storage(feat_n2, self.feature_dtype)
+
+                        flow_n2 = flows[:, flow_idx[i - 1], :, :, :]
+                        if self.cpu_cache:
+                            flow_n2 = flow_n2.to(self.compute_device)
+                        flow_n2 = from_storage(flow_n2, self.flow_dtype)
+
+                        # Compose flows for second-order motion
+                        flow_n2 = flow_n1 + flow_warp(flow_n2, flow_n1.permute(0, 2, 3, 1))
+                        # Warp both neighbours with a single grid_sample
+                        if self.fast_propagation:
+                            cond_n1, cond_n2 = flow_warp_batched(
+                                [feat_prop, feat_n2],
+                                [flow_n1.permute(0, 2, 3, 1), flow_n2.permute(0, 2, 3, 1)],
+                            )
+                        else:
+                            cond_n1 = flow_warp(feat_prop, flow_n1.permute(0, 2, 3, 1))
+                            cond_n2 = flow_warp(feat_n2, flow_n2.permute(0, 2, 3, 1))
+                    else:
+                        cond_n1 = flow_warp(feat_prop, flow_n1.permute(0, 2, 3, 1))
+
+                        # Initialize second-order terms
+                        feat_n2 = torch.zeros_like(feat_prop)
+                        flow_n2 = torch.zeros_like(flow_n1)
+                        cond_n2 = torch.zeros_like(cond_n1)
+
+                    # Concatenate features for deformable alignment
+                    cond = self._cat([cond_n1, feat_current, cond_n2], buffers[0])
+                    feat_prop = self._cat([feat_prop, feat_n2], buffers[1])
+                    feat_prop = self.deform_align[f"hg_{hg_idx}"][module_name](
+                        feat_prop, cond, flow_n1, flow_n2
+                    )
 
-                # Concatenate features for deformable alignment
-                cond = torch.cat([cond_n1, feat_current, cond_n2], dim=1)
-                feat_prop = torch.cat([feat_prop, feat_n2], dim=1)
-                feat_prop = self.deform_align[f"hg_{hg_idx}"][module_name](
-                    feat_prop, cond, flow_n1, flow_n2
+                # Aggregate features and apply residual learning
+                feat_list = [feat_current] + [feats[k][idx] for k in branches] + [feat_prop]
+                if self.cpu_cache:
+                    feat_list = [f.to(self.compute_device) for f in feat_list]
+                feat_list = [from_storage(f, self.feature_dtype) for f in feat_list]
+
+                feat = self._cat(feat_list, buffers[2])
+                feat_prop = feat_prop + self.backbone[f"hg_{hg_idx}"][module_name](feat)
+            feat_stored = to_storage(feat_prop, self.feature_dtype)
+            feats[module_name].append(feat_stored)
+
+            if on_frame is not None:
+                # the features of this frame are final: consume and release
+                # them, only the second-order neighbour is still needed
+                on_frame(
+                    idx, feat_list[:-1] + [from_storage(feat_stored, self.feature_dtype)]
                 )
-
-            # Aggregate features and apply residual learning
-            feat = (
-                [feat_current]
-                + [feats[k][idx] for k in feats if k not in ["spatial", module_name]]
-                + [feat_prop]
-            )
-            if self.cpu_cache:
-                feat = [f.cuda() for f in feat]
-
-            feat = torch.cat(feat, dim=1)
-            feat_prop = feat_prop + self.backbone[f"hg_{hg_idx}"][module_name](feat)
-            feats[module_name].append(feat_prop)
+                del feat_list
+                feats["spatial"][mapping_idx[idx]] = None
+                for k in branches:
+                    feats[k][idx] = None
+                if len(feats[module_name]) > 2:
+                    feats[module_name][-3] = None
 
             # Move features to CPU if using CPU cache
             if self.cpu_cache:
@@ -478,10 +864,55 @@ def check_if_mirror_extended(self, lqs):
 
         # Reverse feature order for backward propagation
         if "backward" in module_name:
-            feats[module_name] = feats[module_name][::-1]
+            feats[module_name].reverse()
 
         return feats
 
+    def reconstruct(self, lqs, i, hr, hg_idx):
+        """Compute the output of one frame given its branch features.
+        Args:
+            lqs (tensor): Input low quality (LQ) sequence with
+                shape (n, t, c, h/s, w/s).
+            i (int | list[int]): Index of the frame, or indices of K frames
+                whose features are stacked (frame-major) along the batch.
+            hr (list[tensor]): Features of the frame, in the order 'spatial',
+                'backward_1', 'forward_1', 'backward_2', 'forward_2'.
+            hg_idx: Identify processing stage: init stage or refine stage
+        Returns:
+            tuple(Tensor): depth and confidence with shape (n, 1, h, w) and
+                the fused features with shape (n, c, h/4, w/4); the batch
+                is K * n for a list of frames.
+        """
+        if self.cpu_cache:
+            hr = [f.to(self.compute_device) for f in hr]
+        hr = torch.cat([from_storage(f, self.feature_dtype) for f in hr], dim=1)
+
+        hr = self.reconstruction[f"hg_{hg_idx}"](hr)
+        feat_fused = hr.clone()
+        hr = self.final_pred[f"hg_{hg_idx}"](hr)
+
+        depth, conf = torch.chunk(hr, 2, dim=1)
+        lq = lqs[:, i, :1, :, :]
+        if lq.dim() == 5:  # frames stacked along the batch
+            lq = lq.transpose(0, 1).flatten(0, 1)
+        depth = depth + self.img_upsample(lq)
+        if self.cpu_cache:
+            hr = hr.cpu()
+            depth = depth.cpu()
+            conf = conf.cpu()
+            torch.cuda.empty_cache()
+        return depth, conf, feat_fused
+
+    def recon_frames(self, t, h, w, n=1):
+        """Number of frames reconstructed at once (see 'recon_chunk')."""
+        if self.cpu_cache or self.recon_chunk == 1:
+            return 1
+        if self.recon_chunk == "auto":
+            if self.memory_budget is None:
+                return 1
+            return reconstruction_chunk(self, t, h, w, self.memory_budget, n=n)
+        return min(self.recon_chunk, t)
+
     def upsample(self, lqs, feats, hg_idx):
         """Compute the output image given the features.
         Args:
@@ -500,29 +931,44 @@ def check_if_mirror_extended(self, lqs):
 
         mapping_idx = list(range(0, num_outputs))
         mapping_idx += mapping_idx[::-1]
+        if isinstance(feats, FeatureStore):
+            # every frame reads the first entry of the propagation branches
+            feats.schedule("spatial", mapping_idx[: lqs.size(1)])
+            for k in feats:
+                if k != "spatial":
+                    feats.schedule(k, [0] * lqs.size(1))
+
+        n, t = lqs.shape[:2]
+        # lqs are at 1/4 of the output resolution
+        chunk = self.recon_frames(t, lqs.size(3) * 4, lqs.size(4) * 4, n)
+        if chunk == 1:
+            for i in range(0, t):
+                hr = [feats[k].pop(0) for k in feats if k != "spatial"]
+                hr.insert(0, feats["spatial"][mapping_idx[i]])
+                depth, conf, feat_fused = self.reconstruct(lqs, i, hr, hg_idx)
 
-        for i in range(0, lqs.size(1)):
-            hr = [feats[k].pop(0) for k in feats if k != "spatial"]
-            hr.insert(0, feats["spatial"][mapping_idx[i]])
-            hr = torch.cat(hr, dim=1)
-            if self.cpu_cache:
-                hr = hr.cuda()
-
-            hr = self.reconstruction[f"hg_{hg_idx}"](hr)
-            feat_fused = hr.clone()
-            hr = self.final_pred[f"hg_{hg_idx}"](hr)
-
-            depth, conf = torch.chunk(hr, 2, dim=1)
-            depth = depth + self.img_upsample(lqs[:, i, :1, :, :])
-            if self.cpu_cache:
-                hr = hr.cpu()
-                depth = depth.cpu()
-                conf = conf.cpu()
-                torch.cuda.empty_cache()
-
-            depths.append(depth)
-            confs.append(conf)
-            feats_fused.append(feat_fused)
+                depths.append(depth)
+                confs.append(conf)
+                feats_fused.append(feat_fused)
+        else:
+            # reconstruct chunks of frames stacked along the batch
+            for start in range(0, t, chunk):
+                idx = list(range(start, min(t, start + chunk)))
+                hr = [
+                    torch.cat([feats[k].pop(0) for _ in idx], dim=0)
+                    for k in feats
+                    if k != "spatial"
+                ]
+                hr.insert(
+                    0, torch.cat([feats["spatial"][mapping_idx[i]] for i in idx], dim=0)
+                )
+                outputs = self.reconstruct(lqs, idx, hr, hg_idx)
+                depth, conf, feat_fused = [
+                    x.view(len(idx), n, *x.shape[1:]).unbind(0) for x in outputs
+                ]
+                depths.extend(depth)
+                confs.extend(conf)
+                feats_fused.extend(feat_fused)
 
         return (
             torch.stack(depths, dim=1),
@@ -549,8 +995,16 @@ def check_if_mirror_extended(self, lqs):
         """
         n, t, c, h, w = lqs.size() ## 1/4 resolution of final output
 
+        # all intermediate tensors are computed on the device of the inputs
+        self.compute_device = lqs.device
+
         # whether to cache the features in CPU (no effect if using CPU)
-        if t > self.cpu_cache_length and lqs.is_cuda:
+        if self.memory_budget is not None:
+            self.cpu_cache = lqs.is_cuda and (
+                estimate_activation_bytes(self, t, h * 4, w * 4, n=n)
+                > self.memory_budget
+            )
+        elif t > self.cpu_cache_length and lqs.is_cuda:
             self.cpu_cache = True
         else:
             self.cpu_cache = False
@@ -559,108 +1013,211 @@ def check_if_mirror_extended(self, lqs):
         self.check_if_mirror_extended(lqs)
 
         feats = {}
-        # compute spatial features
-        if self.cpu_cache:
-            feats["spatial"] = []
-            for i in range(0, t):
+        if self.feature_store is not None:
+            # the store takes care of the placement of the features
+            self.cpu_cache = False
+            feats = FeatureStore(
+                capacity=t, device=self.compute_device, **self.feature_store
+            )
+        try:
+            offload = self.cpu_cache or getattr(feats, "offload", False)
+            # compute spatial features
+            if offload:
+                feats["spatial"] = []
+                for i in range(0, t):
+                    if hg_idx == 1:
+                        guide_feat = self.guide_features(guides, i)
+                        feat = self.feat_extract[f"hg_{hg_idx}"](
+                            torch.cat([lqs[:, i, :, :, :], guide_feat], dim=1)
+                        )
+                    else:
+                        guide_feat = self.guide_init_2(extra_inputs[:, i, :, :, :])
+                        feat = self.feat_extract[f"hg_{hg_idx}"](
+                            torch.cat(
+                                [
+                                    lqs[:, i, :, :, :],
+                                    guide_feat,
+                                    extra_feats[:, i, :, :, :],
+                                ],
+                                dim=1,
+                            )
+                        )
+                    feat = to_storage(feat, self.feature_dtype)
+                    if self.cpu_cache:
+                        feat = feat.cpu()
+                    feats["spatial"].append(feat)
+                    torch.cuda.empty_cache()
+            else:
                 if hg_idx == 1:
-                    guide_feat = self.conv_guide_init[f"hg_{hg_idx}"](
-                        guides[:, i, :, :, :]
+                    guide_feats_ = self.guide_features(guides)
+                    feats_ = self.feat_extract[f"hg_{hg_idx}"](
+                        torch.cat(
+                            [
+                                lqs.reshape(-1, c, h, w),
+                                guide_feats_,
+                            ],
+                            dim=1,
+                        )
                     )
-                    feat = self.feat_extract[f"hg_{hg_idx}"](
-                        torch.cat([lqs[:, i, :, :, :], guide_feat], dim=1)
-                    ).cpu()
                 else:
-                    guide_feat = self.conv_guide_init[f"hg_{hg_idx}"](
-                        extra_inputs[:, i, :, :, :]
+                    guide_feats_ = self.guide_init_2(
+                        extra_inputs.reshape(
+                            -1, extra_inputs.size(2), int(h * 4), int(w * 4)
+                        ).to(guides.device)
                     )
-                    feat = self.feat_extract[f"hg_{hg_idx}"](
+                    feats_ = self.feat_extract[f"hg_{hg_idx}"](
                         torch.cat(
                             [
-                                lqs[:, i, :, :, :],
-                                guide_feat,
-                                extra_feats[:, i, :, :, :],
+                                lqs.reshape(-1, c, h, w),
+                                guide_feats_,
+                                extra_feats.reshape(-1, self.mid_channels, h, w),
                             ],
                             dim=1,
                         )
-                    ).cpu()
-                feats["spatial"].append(feat)
-                torch.cuda.empty_cache()
-        else:
-            if hg_idx == 1:
-                guide_feats_ = self.conv_guide_init[f"hg_{hg_idx}"](
-                    guides.view(-1, 3, int(h * 4), int(w * 4))
-                )
-                feats_ = self.feat_extract[f"hg_{hg_idx}"](
-                    torch.cat(
-                        [
-                            lqs.view(-1, c, h, w),
-                            guide_feats_,
-                        ],
-                        dim=1,
                     )
-                )
+                h, w = feats_.shape[2:]
+                feats_ = to_storage(feats_.view(n, t, -1, h, w), self.feature_dtype)
+                feats["spatial"] = [feats_[:, i, :, :, :] for i in range(0, t)]
+
+            # compute optical flow at the propagation resolution
+            if self.share_flow and hg_idx == 2:
+                flows_forward, flows_backward = self._shared_flows
+                self._shared_flows = None
             else:
-                guide_feats_ = self.conv_guide_init[f"hg_{hg_idx}"](
-                    extra_inputs.view(-1, 2 + 6 + 1, int(h * 4), int(w * 4)).to(guides.device)
+                flows_forward, flows_backward = [
+                    to_storage(flow, self.flow_dtype)
+                    for flow in self.guide_flows(guides, hg_idx)
+                ]
+                if self.share_flow:
+                    self._shared_flows = (flows_forward, flows_backward)
+
+            # feature propagation
+            for iter_ in range(1, self.num_prop_iters + 1):
+                for direction in ["backward", "forward"]:
+                    module = f"{direction}_{iter_}"
+
+                    feats[module] = []
+
+                    if direction == "backward":
+                        flows = flows_backward
+                    elif flows_forward is not None:
+                        flows = flows_forward
+                    else:
+                        flows = flows_backward.flip(1)
+
+                    if (
+                        self.stream_reconstruction
+                        and module == f"forward_{self.num_prop_iters}"
+                    ):
+                        # reconstruct every frame as soon as its last branch is done
+                        outputs = []
+                        feats = self.propagate(
+                            feats,
+                            flows,
+                            module,
+                            hg_idx,
+                            on_frame=lambda i, hr: outputs.append(
+                                self.reconstruct(lqs, i, hr, hg_idx)
+                            ),
+                        )
+                    else:
+                        feats = self.propagate(feats, flows, module, hg_idx)
+                    if self.cpu_cache:
+                        del flows
+                        torch.cuda.empty_cache()
+            if self.stream_reconstruction:
+                depth, conf, feats_fused = [
+                    torch.stack(x, dim=1) for x in zip(*outputs)
+                ]
+                del outputs
+            else:
+                depth, conf, feats_fused = self.upsample(lqs, feats, hg_idx)
+            if hg_idx == 1:
+                return depth, conf, feats_fused
+            else:
+                return depth, conf, None
+        finally:
+            if isinstance(feats, FeatureStore):
+                feats.close()
+
+    def refine_runs(self, error):
+        """Frame ranges that run the refinement stage (see 'refine_mode').
+        Args:
+            error (tensor): Per-frame disagreement of the stage-1 prediction
+                with the dToF input, shape (t,); only used by 'adaptive'.
+        Returns:
+            list[tuple[int]]: (start, end) of the refined frames, chunks of
+                ``refine_chunk`` frames merged when consecutive.
+        """
+        t = error.numel()
+        if self.refine_mode == "always":
+            return [(0, t)]
+        if self.refine_mode == "never":
+            return []
+        runs = []
+        for start in range(0, t, self.refine_chunk):
+            end = min(t, start + self.refine_chunk)
+            if error[start:end].max() <= self.refine_threshold:
+                continue
+            if runs and runs[-1][1] == start:
+                runs[-1] = (runs[-1][0], end)
+            else:
+                runs.append((start, end))
+        return runs
+
+    def stage_1_error(self, inp_error, n, t):
+        """Per-frame mean of the valid block errors of 'get_inp_error', maximum over the batch (t,)"""
+        inp_error = inp_error.view(n, t, -1).float()
+        valid = (inp_error >= 0).float()
+        error = (inp_error.clamp(min=0) * valid).sum(dim=2)
+        error = error / valid.sum(dim=2).clamp(min=1)
+        return error.max(dim=0)[0]
+
+    def refine(self, lqs, guides, extra_inputs, extra_feats, rgb_depth, rgb_conf, runs):
+        """Run the refinement stage on the frame ranges in 'runs'.
+        Frames outside the ranges keep the stage-1 prediction: their stage-2
+        depth is the stage-1 depth and their stage-2 confidence the lowest
+        value of its dtype, so the softmax blend gives them no weight.
+        Returns:
+            tuple(Tensor): stage-2 depth and confidence with shape (n, t, 1, h, w)
+        """
+        t = lqs.size(1)
+        self.refine_stats = dict(
+            frames=t, refined_frames=sum(end - start for start, end in runs)
+        )
+        # stage-1 flows of share_flow, released whatever runs
+        shared_flows, self._shared_flows = self._shared_flows, None
+        try:
+            if runs == [(0, t)]:
+                self._shared_flows = shared_flows
+                d_depth, d_conf, _ = self.hg_forward(
+                    lqs, guides, extra_inputs, extra_feats, hg_idx=2
                 )
-                feats_ = self.feat_extract[f"hg_{hg_idx}"](
-                    torch.cat(
-                        [
-                            lqs.view(-1, c, h, w),
-                            guide_feats_,
-                            extra_feats.view(-1, self.mid_channels, h, w),
-                        ],
-                        dim=1,
+                return d_depth, d_conf
+
+            d_depth = rgb_depth.clone()
+            d_conf = torch.full_like(rgb_conf, torch.finfo(rgb_conf.dtype).min)
+            if shared_flows is not None and shared_flows[0] is None:
+                # a mirror-extended sequence only stores the backward flows,
+                # whose flip is not the forward flow of a sub-range
+                shared_flows = (shared_flows[1].flip(1), shared_flows[1])
+            for start, end in runs:
+                if shared_flows is not None:
+                    self._shared_flows = tuple(
+                        flow[:, start : end - 1] for flow in shared_flows
                     )
+                depth, conf, _ = self.hg_forward(
+                    lqs[:, start:end],
+                    guides[:, start:end],
+                    extra_inputs[:, start:end],
+                    extra_feats[:, start:end],
+                    hg_idx=2,
                 )
-            h, w = feats_.shape[2:]
-            feats_ = feats_.view(n, t, -1, h, w)
-            feats["spatial"] = [feats_[:, i, :, :, :] for i in range(0, t)]
-
-        # compute optical flow using the low-res inputs
-        flows_forward, flows_backward = self.compute_flow(guides, hg_idx)
-
-        flows_forward = (
-            F.interpolate(
-                flows_forward.view(-1, 2, int(h * 4), int(w * 4)),
-                scale_factor=0.25,
-                mode="bicubic",
-            ).view(n, t - 1, 2, h, w)
-            / 4
-        )
-        flows_backward = (
-            F.interpolate(
-                flows_backward.view(-1, 2, int(h * 4), int(w * 4)),
-                scale_factor=0.25,
-                mode="bicubic",
-            ).view(n, t - 1, 2, h, w)
-            / 4
-        )
-
-        # feature propagation
-        for iter_ in [1, 2]:
-            for direction in ["backward", "forward"]:
-                module = f"{direction}_{iter_}"
-
-                feats[module] = []
-
-                if direction == "backward":
-                    flows = flows_backward
-                elif flows_forward is not None:
-                    flows = flows_forward
-                else:
-                    flows = flows_backward.flip(1)
-
-                feats = self.propagate(feats, flows, module, hg_idx)
-                if self.cpu_cache:
-                    del flows
-                    torch.cuda.empty_cache()
-        depth, conf, feats_fused = self.upsample(lqs, feats, hg_idx)
-        if hg_idx == 1:
-            return depth, conf, feats_fused
-        else:
-            return depth, conf, None
+                d_depth[:, start:end] = depth
+                d_conf[:, start:end] = conf
+            return d_depth, d_conf
+        finally:
+            self._shared_flows = None
 
     def forward(self, lqs_comb, guides):
         """Forward function for BasicVSR++.
@@ -675,6 +1232,7 @@ def check_if_mirror_extended(self, lqs):
         Returns:
             Tensor: Output HR sequence with shape (n, t, c, h, w).
         """
+        self.flow_stats = dict(pairs=0, skipped_pairs=0)
         mpeaks = lqs_comb[:,:,:self.mpeaks]
         cdfs = lqs_comb[:,:,self.mpeaks:(3*self.mpeaks + 3)]
         rebins = lqs_comb[:,:,(3*self.mpeaks + 3):]
@@ -689,48 +1247,63 @@ def check_if_mirror_extended(self, lqs):
             rgb_depth = rgb_depth.to(guides.device)
             rgb_conf = rgb_conf.to(guides.device)
             
-        inp_error = get_inp_error(
-            cdfs.view(n * t, cdfs.shape[2], h, w),
-            rebins.view(n * t, rebins.shape[2], h, w),
-            rgb_depth.view(n * t, rgb_depth.shape[2], h * self.scale, w * self.scale),
-            guides.view(n * t, guides.shape[2], h * self.scale, w * self.scale),
-            pitch=self.scale,
-            temp_res=self.temp_res,
-        )
-        inp_error = inp_error.view(n, t, 1, h * self.scale, w * self.scale)
-        B, T, _, H, W = inp_error.shape
-        pos_encoding = (
-            get_pos_encoding(B, T, H, W, self.scale)
-            .float()
-            .detach()
-            .to(inp_error.device)
-        )
-        
-        d_depth, d_conf, _ = self.hg_forward(
-            lqs,
-            guides,
-            torch.cat((rgb_depth, rgb_conf, pos_encoding, inp_error), dim=2),
-            rgb_feats,
-            hg_idx=2,
-        )
+        if self.refine_mode == "never":
+            runs, extra_inputs = self.refine_runs(rgb_depth.new_zeros(t)), None
+        else:
+            inp_error = get_inp_error(
+                cdfs.view(n * t, cdfs.shape[2], h, w),
+                rebins.view(n * t, rebins.shape[2], h, w),
+                rgb_depth.view(n * t, rgb_depth.shape[2], h * self.scale, w * self.scale),
+                guides.view(n * t, guides.shape[2], h * self.scale, w * self.scale),
+                pitch=self.scale,
+                temp_res=self.temp_res,
+                upsample=False,
+                chunk_size=self.hist_chunk_size,
+            )
+            runs = self.refine_runs(self.stage_1_error(inp_error, n, t))
+            H, W = h * self.scale, w * self.scale
+            stage_2_inputs = [rgb_depth, rgb_conf]
+            if self.split_guide_init and not torch.is_grad_enabled():
+                # the positional encoding enters through its precomputed term
+                self._pos_term = self.pos_term(H, W, inp_error.device)
+            else:
+                stage_2_inputs.append(
+                    self.pos_encoding(H, W, inp_error.device).expand(n, t, -1, -1, -1)
+                )
+            stage_2_inputs.append(inp_error.new_empty(n, t, 1, H, W))
+
+            # the block-level error is upsampled straight into its input channel
+            extra_inputs = torch.cat(stage_2_inputs, dim=2)
+            extra_inputs[:, :, -1:].unflatten(3, (h, self.scale)).unflatten(
+                5, (w, self.scale)
+            ).copy_(inp_error.view(n, t, 1, h, 1, w, 1))
+            del inp_error, stage_2_inputs
+
+        try:
+            d_depth, d_conf = self.refine(
+                lqs, guides, extra_inputs, rgb_feats, rgb_depth, rgb_conf, runs
+            )
+        finally:
+            self._pos_term = None
 
         if self.cpu_cache:
             d_depth = d_depth.to(guides.device)
             d_conf = d_conf.to(guides.device)
         
-        rgb_conf, d_conf = torch.chunk(
-            self.softmax(
-                torch.cat(
-                    (
-                        rgb_conf,
-                        d_conf,
-                    ),
-                    dim=2,
-                )
-            ),
-            2,
-            dim=2,
-        )
+        with fp32_region(d_conf):
+            rgb_conf, d_conf = torch.chunk(
+                self.softmax(
+                    torch.cat(
+                        (
+                            rgb_conf.float(),
+                            d_conf.float(),
+                        ),
+                        dim=2,
+                    )
+                ),
+                2,
+                dim=2,
+            )
 
         depth_final = d_depth * d_conf + rgb_depth * rgb_conf
         intermed = {
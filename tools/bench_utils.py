@@ -0,0 +1,151 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Helpers shared by the benchmark scripts in this folder."""
+import copy
+import time
+
+import mmcv
+import torch
+from mmcv.runner import load_checkpoint
+
+from apis import load_sequence
+from model.builder import build_backbone
+
+
+def build_generator(config, checkpoint=None, **overrides):
+    """Build a DVSR/HVSR generator (without the restorer wrapper).
+
+    Args:
+        config (str): Config file path.
+        checkpoint (str | None): Restorer checkpoint, whose 'generator.'
+            prefix is stripped. Default: None (random weights).
+        overrides (dict): Generator arguments to override.
+
+    Returns:
+        tuple: (generator in eval mode, mmcv.Config)
+    """
+    cfg = mmcv.Config.fromfile(config)
+    gen_cfg = copy.deepcopy(cfg.model.generator)
+    gen_cfg.spynet_pretrained = None
+    gen_cfg.update(overrides)
+    generator = build_backbone(gen_cfg)
+    if checkpoint is not None:
+        load_checkpoint(
+            generator,
+            checkpoint,
+            map_location='cpu',
+            revise_keys=[(r'^generator\.', '')])
+    return generator.eval(), cfg
+
+
+def random_inputs(generator, t, h, w, n=1, device='cpu'):
+    """Random inputs of the right layout for a DVSR/HVSR generator.
+
+    Args:
+        generator (nn.Module): A DVSR or HVSR generator.
+        t (int): Number of frames.
+        h (int): Guide height (multiple of the dToF scale).
+        w (int): Guide width (multiple of the dToF scale).
+        n (int): Batch size. Default: 1.
+        device (str | torch.device): Device of the inputs. Default: 'cpu'.
+
+    Returns:
+        tuple[Tensor]: lqs and guides.
+    """
+    s = generator.scale
+    guides = torch.rand(n, t, 3, h, w, device=device)
+    if not hasattr(generator, 'mpeaks'):
+        return torch.rand(n, t, 1, h // s, w // s, device=device), guides
+
+    m = generator.mpeaks
+    temp_res = generator.temp_res
+    num_bins = 2 * m + 3
+    peaks = torch.randint(0, temp_res, (n, t, m, h // s, w // s),
+                          device=device).float()
+    cdfs = torch.rand(n, t, num_bins, h // s, w // s, device=device)
+    cdfs = torch.cumsum(cdfs, dim=2)
+    rebins = torch.randint(0, temp_res, (n, t, num_bins, h // s, w // s),
+                           device=device)
+    rebins = torch.sort(rebins, dim=2)[0].float()
+    return torch.cat((peaks, cdfs, rebins), dim=2), guides
+
+
+def load_inputs(cfg, input_dir, max_seq_len=None):
+    """Load a demo sequence with the test pipeline of ``cfg``."""
+    lqs, guides = load_sequence(cfg, input_dir)
+    if max_seq_len is not None:
+        lqs = lqs[:, :max_seq_len]
+        guides = guides[:, :max_seq_len]
+    return lqs, guides
+
+
+def synchronize(device):
+    if torch.device(device).type == 'cuda':
+        torch.cuda.synchronize(device)
+
+
+def benchmark(fn, warmup=1, iters=3, device='cpu'):
+    """Average wall time of ``fn()`` in seconds.
+
+    Returns:
+        tuple: (mean seconds, output of the last call)
+    """
+    out = None
+    with torch.no_grad():
+        for _ in range(warmup):
+            out = fn()
+        synchronize(device)
+        start = time.perf_counter()
+        for _ in range(iters):
+            out = fn()
+        synchronize(device)
+    return (time.perf_counter() - start) / max(iters, 1), out
+
+
+def cpu_peak_memory(fn):
+    """Peak CPU memory allocated by torch during ``fn()``.
+
+    The allocation events of the torch profiler are replayed in order; the
+    result is the peak of the running sum above the memory held at the start.
+
+    Returns:
+        tuple: (peak bytes, output of the call)
+    """
+    from torch.profiler import ProfilerActivity, profile
+
+    with torch.no_grad(), profile(
+            activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        out = fn()
+    events = [e for e in prof.events() if e.name == '[memory]']
+    events.sort(key=lambda e: e.time_range.start)
+    current = peak = 0
+    for event in events:
+        current += event.cpu_memory_usage
+        peak = max(peak, current)
+    return peak, out
+
+
+def peak_memory(fn, device='cpu'):
+    """Peak memory allocated by torch during ``fn()`` on ``device``.
+
+    Returns:
+        tuple: (peak bytes, output of the call)
+    """
+    if torch.device(device).type != 'cuda':
+        return cpu_peak_memory(fn)
+    synchronize(device)
+    torch.cuda.reset_peak_memory_stats(device)
+    start = torch.cuda.memory_allocated(device)
+    with torch.no_grad():
+        out = fn()
+    synchronize(device)
+    return torch.cuda.max_memory_allocated(device) - start, out
+
+
+def print_table(rows, header):
+    """Print a list of rows as a plain text table."""
+    rows = [header] + [[str(x) for x in row] for row in rows]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    for k, row in enumerate(rows):
+        print('  '.join(x.ljust(widths[i]) for i, x in enumerate(row)))
+        if k == 0:
+            print('  '.join('-' * wi for wi in widths))
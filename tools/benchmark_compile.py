@@ -0,0 +1,86 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Compile time and steady-state speedup of ``compile_propagation``.
+
+The generator runs eagerly and with the steady-state propagation steps
+captured by ``torch.compile``. The first compiled call includes the
+compilation of the eight branch graphs; the steady state is the mean of the
+later calls. Both use the same deformable convolution backend ('grid_sample'
+by default, the one used inside the graphs), and their outputs are compared.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/benchmark_compile.py configs/dvsr_config.py \
+        --shape 10 128 160 --device cpu
+"""
+import argparse
+import time
+
+import torch
+
+from bench_utils import (benchmark, build_generator, print_table,
+                         random_inputs, synchronize)
+from model.common import DEFORM_BACKENDS, set_deform_backend
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='torch.compile benchmark')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('--checkpoint', default=None)
+    parser.add_argument(
+        '--shape',
+        type=int,
+        nargs=3,
+        default=[10, 128, 160],
+        metavar=('T', 'H', 'W'))
+    parser.add_argument(
+        '--deform-backend', choices=DEFORM_BACKENDS, default='grid_sample')
+    parser.add_argument('--mode', default=None, help='torch.compile mode')
+    parser.add_argument('--iters', type=int, default=3)
+    parser.add_argument('--device', default='cpu')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    generator, _ = build_generator(args.config, args.checkpoint)
+    generator = generator.to(args.device)
+    set_deform_backend(generator, args.deform_backend)
+    t, h, w = args.shape
+    lqs, guides = random_inputs(generator, t, h, w, device=args.device)
+
+    def run():
+        return generator(lqs, guides)[0]
+
+    generator.compile_propagation = False
+    eager, ref = benchmark(run, iters=args.iters, device=args.device)
+
+    generator.compile_propagation = {} if args.mode is None else dict(
+        mode=args.mode)
+    generator._compiled_steps = {}
+    synchronize(args.device)
+    start = time.perf_counter()
+    with torch.no_grad():
+        run()
+    synchronize(args.device)
+    first = time.perf_counter() - start
+    compiled, out = benchmark(
+        run, warmup=0, iters=args.iters, device=args.device)
+
+    rows = [
+        ['eager', '-', f'{eager:.3f}', '1.00x', '-'],
+        [
+            'compiled', f'{first - compiled:.1f}', f'{compiled:.3f}',
+            f'{eager / compiled:.2f}x',
+            f'{(out - ref).abs().max().item():.3g}'
+        ],
+    ]
+    print_table(rows, [
+        'mode', 'compile_s', 'steady_s_per_call', 'speedup', 'max_abs_diff'
+    ])
+    if compiled < eager:
+        print(f'break-even after {(first - compiled) / (eager - compiled):.0f}'
+              ' calls')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""CPU inference throughput of DVSR/HVSR.
+
+Compares the current CPU path (default threads, contiguous tensors, fp32)
+with the tuned one (pinned thread counts, channels_last, optional bf16). Each
+setting runs in its own process, since thread pools are process-wide.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/benchmark_cpu.py configs/dvsr_config.py \
+        --shape 20 256 320 --threads 8 --interop-threads 1 --bf16
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from bench_utils import (benchmark, build_generator, load_inputs,
+                         print_table, random_inputs)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='CPU inference benchmark')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('--checkpoint', default=None)
+    parser.add_argument(
+        '--input-dir', default=None, help='demo sequence (default: random)')
+    parser.add_argument(
+        '--shape',
+        type=int,
+        nargs=3,
+        default=[10, 256, 320],
+        metavar=('T', 'H', 'W'),
+        help='input shape of random inputs (or T for --input-dir)')
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--interop-threads', type=int, default=None)
+    parser.add_argument('--bf16', action='store_true')
+    parser.add_argument('--no-channels-last', action='store_true')
+    parser.add_argument('--iters', type=int, default=3)
+    parser.add_argument(
+        '--single',
+        choices=['current', 'tuned'],
+        default=None,
+        help='run one setting in this process and print its result')
+    return parser.parse_args()
+
+
+def run_single(args):
+    import torch
+
+    from apis import cpu_autocast, prepare_cpu_model, setup_cpu_inference
+
+    tuned = args.single == 'tuned'
+    if tuned:
+        setup_cpu_inference(args.threads, args.interop_threads)
+    generator, cfg = build_generator(args.config, args.checkpoint)
+    t, h, w = args.shape
+    if args.input_dir is not None:
+        lqs, guides = load_inputs(cfg, args.input_dir, t)
+    else:
+        lqs, guides = random_inputs(generator, t, h, w)
+    if tuned:
+        generator = prepare_cpu_model(
+            generator, channels_last=not args.no_channels_last)
+
+    def fn():
+        with cpu_autocast(tuned and args.bf16):
+            return generator(lqs, guides)[0]
+
+    seconds, _ = benchmark(fn, warmup=1, iters=args.iters)
+    result = dict(
+        setting=args.single,
+        threads=torch.get_num_threads(),
+        interop_threads=torch.get_num_interop_threads(),
+        fps=lqs.size(1) / seconds)
+    print('RESULT ' + json.dumps(result))
+
+
+def main():
+    args = parse_args()
+    if args.single is not None:
+        run_single(args)
+        return
+
+    rows = []
+    for setting in ['current', 'tuned']:
+        cmd = [sys.executable, __file__] + sys.argv[1:] + ['--single', setting]
+        out = subprocess.run(
+            cmd, check=True, capture_output=True, text=True,
+            env=dict(os.environ)).stdout
+        line = [x for x in out.splitlines() if x.startswith('RESULT ')][-1]
+        rows.append(json.loads(line[len('RESULT '):]))
+
+    base = rows[0]['fps']
+    print_table([[
+        r['setting'], r['threads'], r['interop_threads'], f"{r['fps']:.3f}",
+        f"{r['fps'] / base:.2f}x"
+    ] for r in rows], ['setting', 'threads', 'interop', 'fps', 'speedup'])
+
+
+if __name__ == '__main__':
+    main()
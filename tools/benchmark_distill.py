@@ -0,0 +1,81 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Speed and accuracy of distilled DVSR/HVSR students against their teacher.
+
+Every model runs on the demo sequences and reports its parameter count, its
+time per frame and the mean absolute error of its depth to the ground truth
+('mae_gt') and to the teacher output ('mae_teacher'). The students are
+trained with the ``DistillRestorer`` configs, e.g.
+configs/dvsr_distill_{fast,faster,fastest}_config.py.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/benchmark_distill.py \
+        --teacher configs/dvsr_config.py:chkpts/dvsr_tartan.pth \
+        --student configs/dvsr_distill_fast_config.py:work_dirs/dvsr_distill_fast_tartan/latest.pth \
+        --student configs/dvsr_distill_fastest_config.py:work_dirs/dvsr_distill_fastest_tartan/latest.pth \
+        --input-dir data/demo_dvsr --max-seq-len 20
+"""
+import argparse
+
+from apis import load_sequence
+from bench_utils import benchmark, build_generator, print_table
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Distilled model benchmark')
+    parser.add_argument(
+        '--teacher', required=True, metavar='CONFIG:CHECKPOINT')
+    parser.add_argument(
+        '--student',
+        action='append',
+        required=True,
+        metavar='CONFIG:CHECKPOINT',
+        help='student to compare (repeatable)')
+    parser.add_argument(
+        '--input-dir', nargs='+', required=True, help='demo sequences')
+    parser.add_argument('--max-seq-len', type=int, default=None)
+    parser.add_argument('--iters', type=int, default=3)
+    parser.add_argument('--device', default='cuda')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    specs = [args.teacher] + args.student
+    models = []
+    for spec in specs:
+        config, checkpoint = spec.rsplit(':', 1)
+        generator, cfg = build_generator(config, checkpoint)
+        models.append((config, generator.to(args.device), cfg))
+
+    rows = []
+    for input_dir in args.input_dir:
+        lqs, guides, gt = load_sequence(models[0][2], input_dir, return_gt=True)
+        if args.max_seq_len is not None:
+            lqs, guides, gt = (x[:, :args.max_seq_len]
+                               for x in (lqs, guides, gt))
+        lqs, guides, gt = (x.to(args.device) for x in (lqs, guides, gt))
+        ref = None
+        for config, generator, _ in models:
+            seconds, depth = benchmark(
+                lambda: generator(lqs, guides)[0],
+                iters=args.iters,
+                device=args.device)
+            if ref is None:
+                ref, ref_seconds = depth, seconds
+            params = sum(p.numel() for p in generator.parameters())
+            rows.append([
+                input_dir, config, f'{params / 1e6:.2f}M',
+                f'{seconds / lqs.size(1) * 1000:.1f}',
+                f'{ref_seconds / seconds:.2f}x',
+                f'{(depth - gt).abs().mean().item():.4f}',
+                f'{(depth - ref).abs().mean().item():.4f}'
+            ])
+    print_table(rows, [
+        'sequence', 'model', 'params', 'ms_per_frame', 'speedup', 'mae_gt',
+        'mae_teacher'
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Throughput of DVSR/HVSR with the propagation features in each
+``FeatureStore`` tier ('device', 'host' and memory-mapped 'disk').
+
+The outputs of every tier are compared with the default in-memory features;
+they must be equal.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/benchmark_feature_store.py \
+        configs/dvsr_config.py --shape 100 256 320 --root /scratch
+"""
+import argparse
+
+import torch
+
+from bench_utils import benchmark, build_generator, print_table, random_inputs
+from model.common import FEATURE_TIERS
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Feature store benchmark')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('--checkpoint', default=None)
+    parser.add_argument(
+        '--shape',
+        type=int,
+        nargs=3,
+        default=[30, 256, 320],
+        metavar=('T', 'H', 'W'))
+    parser.add_argument(
+        '--root', default=None, help='directory of the disk tier files')
+    parser.add_argument('--prefetch', type=int, default=2)
+    parser.add_argument('--iters', type=int, default=2)
+    parser.add_argument('--device', default='cuda')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    generator, _ = build_generator(args.config, args.checkpoint)
+    generator = generator.to(args.device)
+    t, h, w = args.shape
+    lqs, guides = random_inputs(generator, t, h, w, device=args.device)
+
+    rows = []
+    ref = None
+    for tier in (None, ) + FEATURE_TIERS:
+        generator.feature_store = None
+        if tier is not None:
+            generator.feature_store = dict(
+                tier=tier, root=args.root, prefetch=args.prefetch)
+        seconds, out = benchmark(
+            lambda: generator(lqs, guides)[0],
+            iters=args.iters,
+            device=args.device)
+        if ref is None:
+            ref = out
+        rows.append([
+            tier or 'none', f'{t / seconds:.2f}',
+            f'{(out - ref).abs().max().item():.3g}'
+        ])
+    print_table(rows, ['tier', 'frames_per_s', 'max_abs_diff'])
+
+
+if __name__ == '__main__':
+    main()
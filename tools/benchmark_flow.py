@@ -0,0 +1,76 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Speed and accuracy of the ``flow_resolution`` modes of DVSR/HVSR.
+
+For every sequence, the flows (1/4 resolution) and the final depth of the
+'quarter' and 'pyramid' modes are compared with the default 'full' mode.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/benchmark_flow.py configs/dvsr_config.py \
+        chkpts/dvsr_tartan.pth data/demo_dvsr data/demo_dydtof --max-seq-len 20
+"""
+import argparse
+
+import torch
+
+from bench_utils import benchmark, build_generator, load_inputs, print_table
+
+MODES = ['full', 'quarter', 'pyramid']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Flow resolution benchmark')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('checkpoint', help='checkpoint file')
+    parser.add_argument('input_dirs', nargs='+', help='demo sequences')
+    parser.add_argument('--max-seq-len', type=int, default=None)
+    parser.add_argument('--iters', type=int, default=3)
+    parser.add_argument('--device', default='cuda')
+    return parser.parse_args()
+
+
+def flows_of(generator, guides):
+    generator.cpu_cache = False
+    generator.is_mirror_extended = False
+    return generator.get_flows(guides, 1)
+
+
+def main():
+    args = parse_args()
+    generator, cfg = build_generator(args.config, args.checkpoint)
+    generator = generator.to(args.device)
+
+    rows = []
+    for input_dir in args.input_dirs:
+        lqs, guides = load_inputs(cfg, input_dir, args.max_seq_len)
+        lqs, guides = lqs.to(args.device), guides.to(args.device)
+        ref = {}
+        for mode in MODES:
+            generator.flow_resolution = mode
+            flow_time, flows = benchmark(
+                lambda: flows_of(generator, guides),
+                iters=args.iters,
+                device=args.device)
+            total_time, depth = benchmark(
+                lambda: generator(lqs, guides)[0],
+                iters=args.iters,
+                device=args.device)
+            if mode == 'full':
+                ref = dict(flows=flows, depth=depth, flow_time=flow_time)
+            # end-point error of the backward flows (1/4 resolution pixels)
+            epe = torch.norm(flows[1] - ref['flows'][1], dim=2).mean()
+            mae = (depth - ref['depth']).abs().mean()
+            rows.append([
+                input_dir, mode, f'{flow_time * 1000:.1f}',
+                f"{ref['flow_time'] / flow_time:.2f}x",
+                f'{total_time * 1000:.1f}', f'{epe.item():.4f}',
+                f'{mae.item():.2e}'
+            ])
+    print_table(rows, [
+        'sequence', 'mode', 'flow_ms', 'flow_speedup', 'total_ms', 'flow_epe',
+        'depth_mae'
+    ])
+
+
+if __name__ == '__main__':
+    main()
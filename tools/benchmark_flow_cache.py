@@ -0,0 +1,88 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Flows from cached per-frame pyramids against per-pair SPyNet calls.
+
+``SPyNet.compute_flow_sequence`` must return exactly the flows of the
+previous per-pair computation; this script reports the difference (expected
+to be 0) and the speed of both.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/benchmark_flow_cache.py \
+        --spynet pretrained/spynet_20210409-c6c1bd09.pth --shape 20 480 640
+"""
+import argparse
+
+import torch
+
+from bench_utils import benchmark, print_table
+from model.common import SPyNet
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='SPyNet pyramid cache')
+    parser.add_argument('--spynet', default=None, help='SPyNet weights')
+    parser.add_argument(
+        '--shape',
+        type=int,
+        nargs=3,
+        default=[10, 256, 320],
+        metavar=('T', 'H', 'W'))
+    parser.add_argument('--iters', type=int, default=3)
+    parser.add_argument('--device', default='cuda')
+    return parser.parse_args()
+
+
+def per_pair_flows(spynet, guides, skip_levels, per_pair):
+    """The computation of the generators before the pyramid cache."""
+    n, t, c, h, w = guides.size()
+    guides_1, guides_2 = guides[:, :-1], guides[:, 1:]
+    if per_pair:
+        flows_backward = torch.stack([
+            spynet(guides_1[:, i], guides_2[:, i], skip_levels)
+            for i in range(t - 1)
+        ], dim=1)
+        flows_forward = torch.stack([
+            spynet(guides_2[:, i], guides_1[:, i], skip_levels)
+            for i in range(t - 1)
+        ], dim=1)
+        return flows_backward, flows_forward
+    guides_1 = guides_1.reshape(-1, c, h, w)
+    guides_2 = guides_2.reshape(-1, c, h, w)
+    flows_backward = spynet(guides_1, guides_2, skip_levels)
+    flows_forward = spynet(guides_2, guides_1, skip_levels)
+    return (flows_backward.view(n, t - 1, *flows_backward.shape[1:]),
+            flows_forward.view(n, t - 1, *flows_forward.shape[1:]))
+
+
+def main():
+    args = parse_args()
+    spynet = SPyNet(pretrained=args.spynet).to(args.device).eval()
+    t, h, w = args.shape
+    guides = torch.rand(1, t, 3, h, w, device=args.device)
+
+    rows = []
+    for per_pair in [False, True]:
+        for skip_levels in [0, 2]:
+            old_time, old = benchmark(
+                lambda: per_pair_flows(spynet, guides, skip_levels, per_pair),
+                iters=args.iters,
+                device=args.device)
+            new_time, new = benchmark(
+                lambda: spynet.compute_flow_sequence(
+                    guides, skip_levels, per_pair=per_pair),
+                iters=args.iters,
+                device=args.device)
+            diff = max((a - b).abs().max().item() for a, b in zip(old, new))
+            rows.append([
+                per_pair, skip_levels, f'{old_time * 1000:.1f}',
+                f'{new_time * 1000:.1f}', f'{old_time / new_time:.2f}x',
+                f'{diff:.3g}'
+            ])
+    print_table(rows, [
+        'per_pair', 'skip_levels', 'per_pair_calls_ms', 'cached_ms',
+        'speedup', 'max_abs_diff'
+    ])
+
+
+if __name__ == '__main__':
+    main()
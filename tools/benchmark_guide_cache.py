@@ -0,0 +1,80 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Hit rate and time saved of the guide cache in a dToF input sweep.
+
+Every demo sequence runs ``--variants`` times with the same guides and a
+different dToF input (a random share ``--drop`` of the dToF blocks set to
+invalid, standing in for other sensor or simulator settings), first without
+and then with a :class:`GuideCache`. The first cached run fills the cache,
+the later ones reuse the flows and stage-1 guide features. The outputs of
+both runs must be equal.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/benchmark_guide_cache.py configs/dvsr_config.py \
+        chkpts/dvsr_tartan.pth data/demo_dvsr --variants 4 --max-seq-len 20
+"""
+import argparse
+import time
+
+import torch
+
+from bench_utils import build_generator, load_inputs, print_table, synchronize
+from model.common import GuideCache
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Guide cache')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('checkpoint', help='checkpoint file')
+    parser.add_argument('input_dirs', nargs='+', help='demo sequences')
+    parser.add_argument('--variants', type=int, default=4)
+    parser.add_argument('--drop', type=float, default=0.1)
+    parser.add_argument(
+        '--cache-dir', default=None, help='disk cache (default: memory)')
+    parser.add_argument('--max-seq-len', type=int, default=None)
+    parser.add_argument('--device', default='cuda')
+    return parser.parse_args()
+
+
+def timed(generator, lqs, guides, device):
+    synchronize(device)
+    start = time.perf_counter()
+    with torch.no_grad():
+        depth = generator(lqs, guides)[0]
+    synchronize(device)
+    return time.perf_counter() - start, depth
+
+
+def main():
+    args = parse_args()
+    generator, cfg = build_generator(args.config, args.checkpoint)
+    generator = generator.to(args.device)
+    cache = GuideCache(root=args.cache_dir)
+
+    rows = []
+    for input_dir in args.input_dirs:
+        lqs, guides = load_inputs(cfg, input_dir, args.max_seq_len)
+        lqs, guides = lqs.to(args.device), guides.to(args.device)
+        torch.manual_seed(0)
+        for variant in range(args.variants):
+            keep = torch.rand_like(lqs[:, :, :1]) >= args.drop * (variant > 0)
+            lqs_v = lqs * keep
+            generator.guide_cache = None
+            base, ref = timed(generator, lqs_v, guides, args.device)
+            generator.guide_cache = cache
+            cache.reset_stats()
+            seconds, depth = timed(generator, lqs_v, guides, args.device)
+            rows.append([
+                input_dir, variant, f'{cache.hit_rate:.0%}',
+                f'{base:.2f}', f'{seconds:.2f}',
+                f"{cache.stats['seconds_saved']:.2f}",
+                f'{(depth - ref).abs().max().item():.3g}'
+            ])
+    print_table(rows, [
+        'sequence', 'variant', 'hit_rate', 'uncached_s', 'cached_s',
+        'seconds_saved', 'max_abs_diff'
+    ])
+
+
+if __name__ == '__main__':
+    main()
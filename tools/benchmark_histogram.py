@@ -0,0 +1,109 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Block-level histogram of HVSR ``get_inp_error`` against the previous
+full-resolution formulation.
+
+Both versions run on random depth maps, guides and sorted rebin indices; the
+script reports their time, peak memory and the largest difference of the
+error maps.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/benchmark_histogram.py --shape 100 480 640 \
+        --chunk-size 16 --device cuda
+"""
+import argparse
+
+import torch
+
+from bench_utils import benchmark, peak_memory, print_table
+from model.hvsr import get_inp_error
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='HVSR histogram benchmark')
+    parser.add_argument(
+        '--shape',
+        type=int,
+        nargs=3,
+        default=[20, 256, 320],
+        metavar=('T', 'H', 'W'))
+    parser.add_argument('--scale', type=int, default=16)
+    parser.add_argument('--bins', type=int, default=10, help='2*mpeaks+2')
+    parser.add_argument('--temp-res', type=int, default=1024)
+    parser.add_argument('--chunk-size', type=int, default=16)
+    parser.add_argument('--iters', type=int, default=3)
+    parser.add_argument('--device', default='cuda')
+    return parser.parse_args()
+
+
+def reference_hist(d, img, rebin_idx, pitch, temp_res):
+    """The full-resolution histogram of the previous implementation."""
+    d = torch.clamp(d.clone(), min=0.0, max=1.0).to(img.device)
+    B, _, H, W = d.shape
+    _, M, _, _ = rebin_idx.shape
+    albedo = torch.mean(img, dim=1).unsqueeze(1)
+    r = albedo / (1e-3 + d**2)
+    rebin_idx = torch.repeat_interleave(
+        torch.repeat_interleave(rebin_idx, pitch, dim=2), pitch, dim=3)
+    hist = torch.sum(
+        ((torch.round(d * (temp_res - 1)) - rebin_idx) >= 0).float(),
+        dim=1).unsqueeze(1)
+    idx_volume = torch.arange(1, M + 1).view(1, M, 1, 1).float().to(
+        img.device)
+    hist = ((hist - idx_volume) == 0).float()
+    return torch.sum((hist * r).view(B, M, H // pitch, pitch, W // pitch,
+                                     pitch),
+                     dim=(3, 5))
+
+
+def reference_error(cdf, rebin_idx, pred, img, pitch, temp_res):
+    """``get_inp_error`` of the previous implementation."""
+    delta_idx = rebin_idx[:, 1:] - rebin_idx[:, :-1]
+    cdf_inp = cdf / (torch.max(cdf, dim=1)[0].unsqueeze(1) + 1e-3)
+    hist_pred = reference_hist(pred, img, rebin_idx[:, :-1], pitch, temp_res)
+    hist_pred = hist_pred / (torch.sum(hist_pred, dim=1).unsqueeze(1) + 1e-3)
+    cdf_pred = torch.cumsum(hist_pred, dim=1)
+    inp_error = torch.mean(
+        torch.abs((cdf_inp[:, 1:] - cdf_pred) * delta_idx), dim=1).unsqueeze(1)
+    inp_error[torch.max(cdf_inp, axis=1)[0].unsqueeze(1) == 0] = -1
+    return torch.repeat_interleave(
+        torch.repeat_interleave(inp_error, pitch, dim=2), pitch, dim=3)
+
+
+def main():
+    args = parse_args()
+    t, h, w = args.shape
+    s, m = args.scale, args.bins
+    device = torch.device(args.device)
+    pred = torch.rand(t, 1, h, w, device=device)
+    img = torch.rand(t, 3, h, w, device=device)
+    rebin_idx = torch.randint(
+        0, args.temp_res, (t, m, h // s, w // s),
+        device=device).sort(dim=1)[0].float()
+    cdf = torch.rand(t, m, h // s, w // s, device=device).cumsum(dim=1)
+    inputs = (cdf, rebin_idx, pred, img, s, args.temp_res)
+
+    runs = [
+        ('full_resolution', lambda: reference_error(*inputs)),
+        ('block_level', lambda: get_inp_error(*inputs)),
+        ('block_level_chunked',
+         lambda: get_inp_error(*inputs, chunk_size=args.chunk_size)),
+    ]
+    rows = []
+    ref = None
+    for name, fn in runs:
+        seconds, out = benchmark(fn, iters=args.iters, device=args.device)
+        peak, _ = peak_memory(fn, args.device)
+        if ref is None:
+            ref = out
+        rows.append([
+            name, f'{seconds * 1000:.1f}', f'{peak / 2**20:.0f}',
+            f'{(out - ref).abs().max().item():.3g}',
+            torch.equal(out, ref)
+        ])
+    print_table(rows,
+                ['version', 'ms', 'peak_mb', 'max_abs_diff', 'bit_equal'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Throughput and accuracy of keyframe inference as the interval grows.
+
+For every demo sequence, the network runs on every k-th frame (and, with
+``--modes``, on the frames chosen by guide or dToF change detection with the
+interval as the longest one); the other frames are interpolated from the
+neighbouring keyframes. The depth difference is measured against the first
+interval, by default 1: the full network on all frames.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/benchmark_keyframes.py configs/dvsr_config.py \
+        chkpts/dvsr_tartan.pth data/demo_dvsr --intervals 1 2 4 8 \
+        --modes interval guide dtof --max-seq-len 40
+"""
+import argparse
+
+import torch
+
+from apis import KEYFRAME_MODES, init_model, keyframe_inference
+from bench_utils import benchmark, load_inputs, print_table
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Keyframe inference')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('checkpoint', help='checkpoint file')
+    parser.add_argument('input_dirs', nargs='+', help='demo sequences')
+    parser.add_argument(
+        '--intervals', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument(
+        '--modes', nargs='+', choices=KEYFRAME_MODES, default=['interval'])
+    parser.add_argument('--threshold', type=float, default=0.05)
+    parser.add_argument('--max-seq-len', type=int, default=None)
+    parser.add_argument('--iters', type=int, default=3)
+    parser.add_argument('--device', default='cuda')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    device = torch.device(args.device)
+    model = init_model(args.config, args.checkpoint, device)
+
+    rows = []
+    for input_dir in args.input_dirs:
+        lqs, guides = load_inputs(model.cfg, input_dir, args.max_seq_len)
+        t = guides.size(1)
+        ref = base = None
+        for interval in args.intervals:
+            for mode in args.modes:
+                if interval == 1 and mode != args.modes[0]:
+                    continue  # every frame is a keyframe
+                cfg = dict(
+                    interval=interval, mode=mode, threshold=args.threshold)
+                seconds, (depth, keyframes) = benchmark(
+                    lambda: keyframe_inference(model, lqs, guides, device,
+                                               cfg),
+                    iters=args.iters,
+                    device=args.device)
+                if ref is None:
+                    ref, base = depth, seconds
+                err = (depth - ref).abs()
+                rows.append([
+                    input_dir, interval, mode,
+                    f'{len(keyframes) / t:.0%}', f'{t / seconds:.1f}',
+                    f'{base / seconds:.2f}x', f'{err.mean().item():.2e}',
+                    f'{err.max().item():.2e}'
+                ])
+    print_table(rows, [
+        'sequence', 'interval', 'mode', 'keyframes', 'frames_per_s',
+        'speedup', 'mean_abs_diff', 'max_abs_diff'
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Execution plans of the memory planner and their measured peak memory.
+
+For every sequence length, ``plan_execution`` picks full, offloaded, chunked
+or tiled execution within the budget; the plan is then run (one segment for
+'chunked') and its measured peak is compared with the prediction.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/benchmark_memory_plan.py configs/dvsr_config.py \
+        --budget 8 --lengths 10 50 200 --size 480 640 --device cuda
+"""
+import argparse
+
+import torch
+
+from apis import plan_execution, tiled_forward
+from bench_utils import (build_generator, peak_memory, print_table,
+                         random_inputs)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Memory planner')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('--checkpoint', default=None)
+    parser.add_argument(
+        '--budget', type=float, default=8, help='memory budget in GiB')
+    parser.add_argument(
+        '--lengths', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument(
+        '--size', type=int, nargs=2, default=[480, 640], metavar=('H', 'W'))
+    parser.add_argument('--device', default='cuda')
+    return parser.parse_args()
+
+
+def run_plan(generator, plan, lqs, guides):
+    if plan['mode'] == 'chunked':
+        # the segments are independent, measuring one of them is enough
+        return generator(lqs[:, :plan['chunk_len']],
+                         guides[:, :plan['chunk_len']])[0]
+    if plan['mode'] == 'tiled':
+        return tiled_forward(generator, lqs, guides, plan['tile_size'],
+                             plan['tile_halo'])
+    return generator(lqs, guides)[0]
+
+
+def main():
+    args = parse_args()
+    generator, _ = build_generator(args.config, args.checkpoint)
+    generator = generator.to(args.device)
+    budget = int(args.budget * 1024**3)
+    generator.memory_budget = budget
+    h, w = args.size
+
+    rows = []
+    for t in args.lengths:
+        plan = plan_execution(
+            generator, t, h, w, budget,
+            offload=torch.device(args.device).type == 'cuda')
+        lqs, guides = random_inputs(generator, t, h, w, device=args.device)
+        measured, _ = peak_memory(
+            lambda: run_plan(generator, plan, lqs, guides), args.device)
+        detail = plan['chunk_len'] or plan['tile_size'] or ''
+        rows.append([
+            t, plan['mode'], detail,
+            f"{plan['predicted_peak'] / 2**30:.2f}",
+            f'{measured / 2**30:.2f}',
+            f"{measured / plan['predicted_peak']:.2f}"
+        ])
+    print_table(rows, [
+        'frames', 'plan', 'chunk/tile', 'predicted_gib', 'measured_gib',
+        'measured/predicted'
+    ])
+
+
+if __name__ == '__main__':
+    main()
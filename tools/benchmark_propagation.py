@@ -0,0 +1,84 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Per-frame time of the propagation loop, with and without
+``fast_propagation`` (batched warping and reused concatenation buffers).
+
+The full generator outputs of both settings are also compared; they must be
+bit-for-bit equal.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/benchmark_propagation.py configs/dvsr_config.py \
+        --shape 20 256 320 --device cuda
+"""
+import argparse
+
+import torch
+
+from bench_utils import benchmark, build_generator, print_table, random_inputs
+
+MODULES = ['backward_1', 'forward_1', 'backward_2', 'forward_2']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Propagation benchmark')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('--checkpoint', default=None)
+    parser.add_argument(
+        '--shape',
+        type=int,
+        nargs=3,
+        default=[10, 256, 320],
+        metavar=('T', 'H', 'W'))
+    parser.add_argument('--iters', type=int, default=5)
+    parser.add_argument('--device', default='cuda')
+    return parser.parse_args()
+
+
+def propagate_all(generator, spatial, flows):
+    feats = dict(spatial=spatial)
+    for module in MODULES:
+        feats[module] = []
+        feats = generator.propagate(feats, flows, module, 1)
+    return feats
+
+
+def main():
+    args = parse_args()
+    generator, _ = build_generator(args.config, args.checkpoint)
+    generator = generator.to(args.device)
+    t, h, w = args.shape
+    c = generator.mid_channels
+    device = torch.device(args.device)
+
+    # propagation inputs at 1/4 resolution
+    spatial = [
+        torch.randn(1, c, h // 4, w // 4, device=device) for _ in range(t)
+    ]
+    flows = torch.randn(1, t - 1, 2, h // 4, w // 4, device=device) * 2
+    generator.cpu_cache = False
+    generator.compute_device = device
+
+    rows = []
+    for fast in [False, True]:
+        generator.fast_propagation = fast
+        seconds, _ = benchmark(
+            lambda: propagate_all(generator, spatial, flows),
+            iters=args.iters,
+            device=args.device)
+        rows.append([fast, f'{seconds / (len(MODULES) * t) * 1000:.2f}'])
+
+    lqs, guides = random_inputs(generator, t, h, w, device=device)
+    outputs = []
+    for fast in [False, True]:
+        generator.fast_propagation = fast
+        with torch.no_grad():
+            outputs.append(generator(lqs, guides)[0])
+    base = float(rows[0][1])
+    for row in rows:
+        row.append(f'{base / float(row[1]):.2f}x')
+    print_table(rows, ['fast_propagation', 'ms_per_frame_step', 'speedup'])
+    print(f'bit-for-bit equal: {torch.equal(outputs[0], outputs[1])}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Throughput of the per-frame reconstruction against chunks of K frames
+stacked along the batch (``recon_chunk``).
+
+The outputs of every K are compared with the per-frame loop (K=1).
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/benchmark_reconstruction.py configs/dvsr_config.py \
+        --shape 20 480 640 --chunks 1 2 4 8 --device cuda
+"""
+import argparse
+
+import torch
+
+from bench_utils import benchmark, build_generator, print_table
+
+BRANCHES = ['spatial', 'backward_1', 'forward_1', 'backward_2', 'forward_2']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Batched reconstruction')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('--checkpoint', default=None)
+    parser.add_argument(
+        '--shape',
+        type=int,
+        nargs=3,
+        default=[10, 256, 320],
+        metavar=('T', 'H', 'W'))
+    parser.add_argument(
+        '--chunks', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--iters', type=int, default=3)
+    parser.add_argument('--device', default='cuda')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    generator, _ = build_generator(args.config, args.checkpoint)
+    generator = generator.to(args.device)
+    generator.cpu_cache = False
+    t, h, w = args.shape
+    c = generator.mid_channels
+    device = torch.device(args.device)
+
+    # propagated features and the 1/4 resolution LQ input of one stage
+    branches = {
+        k: [torch.randn(1, c, h // 4, w // 4, device=device)
+            for _ in range(t)]
+        for k in BRANCHES
+    }
+    lqs = torch.rand(1, t, 1, h // 4, w // 4, device=device)
+
+    def run():
+        # upsample pops the branch lists, hand it fresh ones
+        feats = {k: list(v) for k, v in branches.items()}
+        return generator.upsample(lqs, feats, 1)[0]
+
+    rows = []
+    ref = None
+    for chunk in args.chunks:
+        generator.recon_chunk = chunk
+        seconds, out = benchmark(run, iters=args.iters, device=args.device)
+        if ref is None:
+            ref = out
+        rows.append([
+            chunk, f'{t / seconds:.1f}',
+            f'{(out - ref).abs().max().item():.3g}'
+        ])
+    base = float(rows[0][1])
+    for row in rows:
+        row.insert(2, f'{float(row[1]) / base:.2f}x')
+    print_table(rows, ['K', 'frames_per_s', 'speedup', 'max_abs_diff'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Compute saved and accuracy change of the adaptive refinement stage.
+
+For every demo sequence, DVSR/HVSR runs with ``refine_mode`` 'always'
+(reference), 'never' (stage-1 prediction only) and 'adaptive' at each of the
+given thresholds. The script reports the share of the frames that ran the
+refinement stage, the time saved against 'always' and the depth difference
+with the 'always' output; use it to calibrate ``refine_threshold`` on data
+with ground truth before relying on the 'adaptive' mode.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/benchmark_refinement.py configs/dvsr_config.py \
+        chkpts/dvsr_tartan.pth data/demo_dvsr data/demo_dydtof \
+        --thresholds 0.005 0.01 0.02 --refine-chunk 10
+"""
+import argparse
+
+from bench_utils import benchmark, build_generator, load_inputs, print_table
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Adaptive refinement')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('checkpoint', help='checkpoint file')
+    parser.add_argument('input_dirs', nargs='+', help='demo sequences')
+    parser.add_argument(
+        '--thresholds', type=float, nargs='+', default=[0.005, 0.01, 0.02])
+    parser.add_argument('--refine-chunk', type=int, default=10)
+    parser.add_argument('--max-seq-len', type=int, default=None)
+    parser.add_argument('--iters', type=int, default=3)
+    parser.add_argument('--device', default='cuda')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    generator, cfg = build_generator(
+        args.config, args.checkpoint, refine_chunk=args.refine_chunk)
+    generator = generator.to(args.device)
+    settings = [('always', None), ('never', None)]
+    settings += [('adaptive', threshold) for threshold in args.thresholds]
+
+    rows = []
+    for input_dir in args.input_dirs:
+        lqs, guides = load_inputs(cfg, input_dir, args.max_seq_len)
+        lqs, guides = lqs.to(args.device), guides.to(args.device)
+        ref = base = None
+        for mode, threshold in settings:
+            generator.refine_mode = mode
+            if threshold is not None:
+                generator.refine_threshold = threshold
+            seconds, (depth, _) = benchmark(
+                lambda: generator(lqs, guides),
+                iters=args.iters,
+                device=args.device)
+            if ref is None:
+                ref, base = depth, seconds
+            stats = generator.refine_stats
+            err = (depth - ref).abs()
+            rows.append([
+                input_dir, mode, '-' if threshold is None else threshold,
+                f"{stats['refined_frames'] / stats['frames']:.0%}",
+                f'{seconds:.2f}', f'{1 - seconds / base:.0%}',
+                f'{err.mean().item():.2e}', f'{err.max().item():.2e}'
+            ])
+    print_table(rows, [
+        'sequence', 'refine_mode', 'threshold', 'refined', 'seconds',
+        'time_saved', 'mean_abs_diff', 'max_abs_diff'
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Accuracy and speed of ``share_flow=True`` against the two-SPyNet models.
+
+The shared model is built from the same checkpoint with the stage-2 SPyNet
+dropped (as tools/convert_share_flow.py does), so the report shows the effect
+of reusing the stage-1 flows without fine-tuning.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/benchmark_share_flow.py \
+        --model configs/dvsr_config.py:chkpts/dvsr_tartan.pth \
+        --model configs/hvsr_config.py:chkpts/hvsr_tartan.pth \
+        --input-dir data/demo_dvsr --max-seq-len 20
+"""
+import argparse
+
+from bench_utils import benchmark, build_generator, load_inputs, print_table
+from convert_share_flow import convert_state_dict
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Shared flow benchmark')
+    parser.add_argument(
+        '--model',
+        action='append',
+        required=True,
+        metavar='CONFIG:CHECKPOINT',
+        help='model to compare (repeatable)')
+    parser.add_argument('--input-dir', required=True, help='demo sequence')
+    parser.add_argument('--max-seq-len', type=int, default=None)
+    parser.add_argument('--iters', type=int, default=3)
+    parser.add_argument('--device', default='cuda')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    rows = []
+    for spec in args.model:
+        config, checkpoint = spec.rsplit(':', 1)
+        base, cfg = build_generator(config, checkpoint)
+        shared, _ = build_generator(config, share_flow=True)
+        shared.load_state_dict(convert_state_dict(base.state_dict()))
+        base, shared = base.to(args.device), shared.to(args.device)
+
+        lqs, guides = load_inputs(cfg, args.input_dir, args.max_seq_len)
+        lqs, guides = lqs.to(args.device), guides.to(args.device)
+        base_time, base_out = benchmark(
+            lambda: base(lqs, guides), iters=args.iters, device=args.device)
+        shared_time, shared_out = benchmark(
+            lambda: shared(lqs, guides), iters=args.iters, device=args.device)
+
+        name = type(base).__name__
+        for key in ['rgb_depth', 'd_depth']:
+            err = (shared_out[1][key] - base_out[1][key]).abs()
+            rows.append([name, key, f'{err.mean().item():.2e}',
+                         f'{err.max().item():.2e}', '', ''])
+        err = (shared_out[0] - base_out[0]).abs()
+        rows.append([
+            name, 'depth', f'{err.mean().item():.2e}',
+            f'{err.max().item():.2e}', f'{base_time * 1000:.1f}',
+            f'{shared_time * 1000:.1f} ({base_time / shared_time:.2f}x)'
+        ])
+    print_table(rows, [
+        'model', 'output', 'mae', 'max_abs_err', 'two_spynet_ms',
+        'shared_ms'
+    ])
+
+
+if __name__ == '__main__':
+    main()
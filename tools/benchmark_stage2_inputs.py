@@ -0,0 +1,78 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Stage-2 input assembly of HVSR with and without ``split_guide_init``.
+
+With the split, the positional encoding is not concatenated to the stage-2
+inputs; its contribution to the first guide convolution is computed once
+per resolution. The script reports the time of the stage-2 guide encoder,
+of the whole forward pass, and the output difference (float rounding only).
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/benchmark_stage2_inputs.py configs/hvsr_config.py \
+        --shape 20 480 640 --device cuda
+"""
+import argparse
+
+import torch
+
+from bench_utils import benchmark, build_generator, print_table, random_inputs
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='HVSR stage-2 inputs')
+    parser.add_argument('config', help='HVSR config file path')
+    parser.add_argument('--checkpoint', default=None)
+    parser.add_argument(
+        '--shape',
+        type=int,
+        nargs=3,
+        default=[10, 256, 320],
+        metavar=('T', 'H', 'W'))
+    parser.add_argument('--iters', type=int, default=3)
+    parser.add_argument('--device', default='cuda')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    generator, _ = build_generator(args.config, args.checkpoint)
+    generator = generator.to(args.device)
+    t, h, w = args.shape
+    lqs, guides = random_inputs(generator, t, h, w, device=args.device)
+    device = torch.device(args.device)
+    # depth, confidence, positional encoding and error of every frame
+    inputs = torch.rand(t, 9, h, w, device=device)
+    inputs[:, 2:8] = generator.pos_encoding(h, w, device)[0]
+
+    rows = []
+    outputs = []
+    for split in [False, True]:
+        generator.split_guide_init = split
+        with torch.no_grad():
+            if split:
+                generator._pos_term = generator.pos_term(h, w, device)
+                frames = torch.cat((inputs[:, :2], inputs[:, 8:]), dim=1)
+            else:
+                frames = inputs
+            guide_time, guide_feats = benchmark(
+                lambda: generator.guide_init_2(frames),
+                iters=args.iters,
+                device=args.device)
+            generator._pos_term = None
+        total_time, out = benchmark(
+            lambda: generator(lqs, guides)[0],
+            iters=args.iters,
+            device=args.device)
+        outputs.append((guide_feats, out))
+        rows.append([
+            split, f'{guide_time / t * 1000:.2f}', f'{total_time * 1000:.1f}'
+        ])
+    guide_diff = (outputs[0][0] - outputs[1][0]).abs().max().item()
+    depth_diff = (outputs[0][1] - outputs[1][1]).abs().max().item()
+    print_table(rows, ['split_guide_init', 'guide_ms_per_frame', 'total_ms'])
+    print(f'max abs diff: guide features {guide_diff:.3g}, '
+          f'depth {depth_diff:.3g}')
+
+
+if __name__ == '__main__':
+    main()
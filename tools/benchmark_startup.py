@@ -0,0 +1,116 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Time to first frame of the demo, with and without the fast startup path.
+
+Every mode runs in a fresh interpreter, since imports are cached:
+
+    legacy  imports the training stack as before, loads the pretrained
+            SPyNets and then the full checkpoint
+    fast    inference imports only, no SPyNet load, the given checkpoint
+            (use a file written by tools/slim_checkpoint.py)
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/benchmark_startup.py configs/dvsr_config.py \
+        chkpts/dvsr_tartan.pth data/demo_dvsr \
+        --slim-checkpoint chkpts/dvsr_tartan_slim.pth
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+T0 = time.perf_counter()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Startup benchmark')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('checkpoint', help='training checkpoint')
+    parser.add_argument('input_dir', help='directory of the input video')
+    parser.add_argument('--slim-checkpoint', default=None)
+    parser.add_argument(
+        '--seq-len',
+        type=int,
+        default=2,
+        help='frames of the first segment (recurrent models)')
+    parser.add_argument('--device', default='0', help='CUDA device id or cpu')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument(
+        '--single', choices=['legacy', 'fast'], default=None)
+    return parser.parse_args()
+
+
+def run_single(args):
+    timings = {}
+    if args.single == 'legacy':
+        import apis.test  # noqa: F401
+        import apis.train  # noqa: F401
+        import terminaltables  # noqa: F401
+        import tqdm  # noqa: F401
+    import torch
+
+    from apis import init_model, load_sequence, model_forward
+    timings['import'] = time.perf_counter() - T0
+
+    device = (torch.device('cpu') if args.device == 'cpu' else torch.device(
+        'cuda', int(args.device)))
+    start = time.perf_counter()
+    if args.single == 'legacy':
+        import mmcv
+        from mmcv.runner import load_checkpoint
+
+        from model.builder import build_model
+        cfg = mmcv.Config.fromfile(args.config)
+        cfg.model.pretrained = None
+        cfg.test_cfg.metrics = None
+        model = build_model(cfg.model, test_cfg=cfg.test_cfg)
+        load_checkpoint(model, args.checkpoint, map_location='cpu')
+        model.cfg = cfg
+        model = model.to(device).eval()
+    else:
+        model = init_model(
+            args.config, args.slim_checkpoint or args.checkpoint, device)
+    timings['build_and_load'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    lqs, guides = load_sequence(model.cfg, args.input_dir)
+    lqs = lqs[:, :args.seq_len].to(device)
+    guides = guides[:, :args.seq_len].to(device)
+    with torch.no_grad():
+        model_forward(model, lqs, guides)
+    timings['first_segment'] = time.perf_counter() - start
+    timings['time_to_first_frame'] = time.perf_counter() - T0
+    print('RESULT ' + json.dumps(timings))
+
+
+def main():
+    args = parse_args()
+    if args.single is not None:
+        run_single(args)
+        return
+
+    from bench_utils import print_table
+
+    keys = ['import', 'build_and_load', 'first_segment', 'time_to_first_frame']
+    rows = []
+    for mode in ['legacy', 'fast']:
+        runs = []
+        for _ in range(args.repeats):
+            out = subprocess.run(
+                [sys.executable, __file__] + sys.argv[1:] +
+                ['--single', mode],
+                check=True,
+                capture_output=True,
+                text=True).stdout
+            line = [x for x in out.splitlines() if x.startswith('RESULT ')][-1]
+            runs.append(json.loads(line[len('RESULT '):]))
+        # the median run of every stage
+        rows.append([mode] + [
+            f'{sorted(r[k] for r in runs)[len(runs) // 2]:.2f}s' for k in keys
+        ])
+    print_table(rows, ['mode'] + keys)
+
+
+if __name__ == '__main__':
+    main()
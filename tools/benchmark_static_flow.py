@@ -0,0 +1,81 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Skipped SPyNet pairs, time saved and accuracy of static flow skipping.
+
+For every sequence, the flows (1/4 resolution) and the final depth with
+``static_flow_threshold`` at each given value are compared with all flows
+computed (no threshold). The statistics are those of one forward call,
+i.e. both stages unless ``share_flow`` is set.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/benchmark_static_flow.py configs/dvsr_config.py \
+        chkpts/dvsr_tartan.pth data/demo_arkit --thresholds 0.002 0.005 0.01
+"""
+import argparse
+
+import torch
+
+from bench_utils import benchmark, build_generator, load_inputs, print_table
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Static flow skipping')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('checkpoint', help='checkpoint file')
+    parser.add_argument('input_dirs', nargs='+', help='demo sequences')
+    parser.add_argument(
+        '--thresholds', type=float, nargs='+', default=[0.002, 0.005, 0.01])
+    parser.add_argument('--max-seq-len', type=int, default=None)
+    parser.add_argument('--iters', type=int, default=3)
+    parser.add_argument('--device', default='cuda')
+    return parser.parse_args()
+
+
+def flows_of(generator, guides):
+    generator.cpu_cache = False
+    generator.is_mirror_extended = False
+    return generator.get_flows(guides, 1)
+
+
+def main():
+    args = parse_args()
+    generator, cfg = build_generator(args.config, args.checkpoint)
+    generator = generator.to(args.device)
+
+    rows = []
+    for input_dir in args.input_dirs:
+        lqs, guides = load_inputs(cfg, input_dir, args.max_seq_len)
+        lqs, guides = lqs.to(args.device), guides.to(args.device)
+        ref = None
+        for threshold in [None] + args.thresholds:
+            generator.static_flow_threshold = threshold
+            flow_time, flows = benchmark(
+                lambda: flows_of(generator, guides),
+                iters=args.iters,
+                device=args.device)
+            total_time, depth = benchmark(
+                lambda: generator(lqs, guides)[0],
+                iters=args.iters,
+                device=args.device)
+            stats = generator.flow_stats
+            if ref is None:
+                ref = dict(flows=flows[1], depth=depth, flow_time=flow_time,
+                           total_time=total_time)
+            epe = torch.norm(flows[1] - ref['flows'], dim=2).mean().item()
+            skipped = (stats['skipped_pairs'] / stats['pairs']
+                       if stats['pairs'] else 0)
+            rows.append([
+                input_dir, '-' if threshold is None else threshold,
+                f'{skipped:.0%}', f'{flow_time * 1000:.1f}',
+                f"{(ref['flow_time'] - flow_time) * 1000:.1f}",
+                f"{ref['total_time'] / total_time:.2f}x", f'{epe:.3f}',
+                f"{(depth - ref['depth']).abs().mean().item():.2e}"
+            ])
+    print_table(rows, [
+        'sequence', 'threshold', 'skipped_pairs', 'flow_ms', 'flow_ms_saved',
+        'total_speedup', 'epe_vs_all', 'depth_mean_abs_diff'
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Accuracy, peak memory and stored volume of 16-bit feature/flow storage.
+
+For every demo sequence, DVSR/HVSR runs with the branch features and flows
+stored in float32 (reference), float16 or bfloat16. The depth error is
+measured against the float32 run; 'stored_mb' is the volume of the branch
+features and flows of one stage, i.e. what ``cpu_cache`` or a feature store
+moves off the compute device.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/benchmark_storage_dtype.py configs/dvsr_config.py \
+        chkpts/dvsr_tartan.pth data/demo_dvsr data/demo_dydtof --max-seq-len 20
+"""
+import argparse
+
+import torch
+
+from bench_utils import build_generator, load_inputs, peak_memory, print_table
+
+# (feature_dtype, flow_dtype)
+SETTINGS = [
+    (None, None),
+    ('float16', None),
+    ('bfloat16', None),
+    ('float16', 'float16'),
+    ('bfloat16', 'bfloat16'),
+]
+ITEM_BYTES = {None: 4, 'float16': 2, 'bfloat16': 2}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Feature storage dtype')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('checkpoint', help='checkpoint file')
+    parser.add_argument('input_dirs', nargs='+', help='demo sequences')
+    parser.add_argument('--max-seq-len', type=int, default=None)
+    parser.add_argument('--device', default='cuda')
+    return parser.parse_args()
+
+
+def stored_bytes(generator, t, h, w, feature_dtype, flow_dtype):
+    """Bytes of the five branches and the two flow directions of a stage."""
+    q = (h // 4) * (w // 4)
+    feats = 5 * t * generator.mid_channels * q * ITEM_BYTES[feature_dtype]
+    flows = 2 * (t - 1) * 2 * q * ITEM_BYTES[flow_dtype]
+    return feats + flows
+
+
+def main():
+    args = parse_args()
+    generator, cfg = build_generator(args.config, args.checkpoint)
+    generator = generator.to(args.device)
+
+    rows = []
+    for input_dir in args.input_dirs:
+        lqs, guides = load_inputs(cfg, input_dir, args.max_seq_len)
+        lqs, guides = lqs.to(args.device), guides.to(args.device)
+        t, _, h, w = guides.shape[1:]
+        ref = None
+        for feature_dtype, flow_dtype in SETTINGS:
+            generator.feature_dtype = None
+            generator.flow_dtype = None
+            if feature_dtype is not None:
+                generator.feature_dtype = getattr(torch, feature_dtype)
+            if flow_dtype is not None:
+                generator.flow_dtype = getattr(torch, flow_dtype)
+            peak, (depth, _) = peak_memory(
+                lambda: generator(lqs, guides), args.device)
+            if ref is None:
+                ref = depth
+            err = (depth - ref).abs()
+            stored = stored_bytes(generator, t, h, w, feature_dtype,
+                                  flow_dtype)
+            rows.append([
+                input_dir, feature_dtype or 'float32', flow_dtype or 'float32',
+                f'{err.mean().item():.2e}', f'{err.max().item():.2e}',
+                f'{peak / 2**20:.0f}', f'{stored / 2**20:.0f}'
+            ])
+    print_table(rows, [
+        'sequence', 'features', 'flows', 'depth_mae', 'depth_max_err',
+        'peak_mb', 'stored_mb'
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Peak CPU memory per frame with and without ``stream_reconstruction``.
+
+With streaming, every frame is reconstructed during the 'forward_2' branch
+and the propagated features are released after their last consumer. The
+outputs of both settings are compared; they must be bit-for-bit equal.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/benchmark_streaming.py configs/dvsr_config.py \
+        --lengths 5 10 20 --size 128 160
+"""
+import argparse
+
+import torch
+
+from bench_utils import (build_generator, cpu_peak_memory, print_table,
+                         random_inputs)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Streaming reconstruction')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('--checkpoint', default=None)
+    parser.add_argument(
+        '--lengths', type=int, nargs='+', default=[5, 10, 20])
+    parser.add_argument(
+        '--size', type=int, nargs=2, default=[128, 160], metavar=('H', 'W'))
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    generator, _ = build_generator(args.config, args.checkpoint)
+    h, w = args.size
+
+    rows = []
+    for t in args.lengths:
+        lqs, guides = random_inputs(generator, t, h, w)
+        outputs, peaks = [], []
+        for stream in [False, True]:
+            generator.stream_reconstruction = stream
+            peak, out = cpu_peak_memory(lambda: generator(lqs, guides))
+            outputs.append(out)
+            peaks.append(peak)
+        (depth_a, intermed_a), (depth_b, intermed_b) = outputs
+        equal = torch.equal(depth_a, depth_b) and all(
+            torch.equal(intermed_a[k], intermed_b[k]) for k in intermed_a)
+        rows.append([
+            t, f'{peaks[0] / t / 2**20:.1f}', f'{peaks[1] / t / 2**20:.1f}',
+            f'{1 - peaks[1] / peaks[0]:.1%}', equal
+        ])
+    print_table(rows, [
+        'frames', 'peak_mb_per_frame', 'streaming_mb_per_frame', 'saving',
+        'bit_equal'
+    ])
+
+
+if __name__ == '__main__':
+    main()
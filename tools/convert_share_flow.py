@@ -0,0 +1,49 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Convert a DVSR/HVSR checkpoint for the ``share_flow=True`` generators.
+
+The stage-1 SPyNet (``spynet.hg_1``) is kept and the stage-2 SPyNet
+(``spynet.hg_2``) is dropped. The optimizer state no longer matches the
+smaller model and is dropped too; everything else is copied unchanged.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/convert_share_flow.py chkpts/dvsr_tartan.pth \
+        chkpts/dvsr_share_flow_tartan.pth
+"""
+import argparse
+import re
+
+import torch
+
+SPYNET_HG_2 = re.compile(r'(^|\.)spynet\.hg_2\.')
+
+
+def convert_state_dict(state_dict):
+    """Drop the stage-2 SPyNet weights of a state dict."""
+    return type(state_dict)(
+        (k, v) for k, v in state_dict.items() if not SPYNET_HG_2.search(k))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Convert a checkpoint for share_flow=True')
+    parser.add_argument('checkpoint', help='input checkpoint')
+    parser.add_argument('out', help='output checkpoint')
+    args = parser.parse_args()
+
+    ckpt = torch.load(args.checkpoint, map_location='cpu')
+    if 'state_dict' in ckpt:
+        before = len(ckpt['state_dict'])
+        ckpt['state_dict'] = convert_state_dict(ckpt['state_dict'])
+        after = len(ckpt['state_dict'])
+    else:
+        before = len(ckpt)
+        ckpt = convert_state_dict(ckpt)
+        after = len(ckpt)
+    ckpt.pop('optimizer', None)
+    torch.save(ckpt, args.out)
+    print(f'dropped {before - after} spynet.hg_2 tensors')
+
+
+if __name__ == '__main__':
+    main()
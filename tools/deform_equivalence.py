@@ -0,0 +1,99 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Numerical equivalence of the deformable alignment backends.
+
+Compares every available backend against a reference backend, first on a
+single alignment module with random offsets, then (with a config) on the
+full generator output.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/deform_equivalence.py \
+        --config configs/dvsr_config.py --shape 4 128 128 --device cuda
+"""
+import argparse
+
+import torch
+
+from bench_utils import build_generator, print_table, random_inputs
+from model.common import SecondOrderDeformableAlignment, set_deform_backend
+from model.common import second_order_deform
+
+
+def available_backends():
+    backends = ['grid_sample']
+    if second_order_deform.deform_conv2d is not None:
+        backends.insert(0, 'torchvision')
+    if second_order_deform.modulated_deform_conv2d is not None:
+        backends.insert(0, 'mmcv')
+    return backends
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Compare deformable alignment backends')
+    parser.add_argument('--config', default=None, help='also compare a model')
+    parser.add_argument('--checkpoint', default=None)
+    parser.add_argument(
+        '--shape',
+        type=int,
+        nargs=3,
+        default=[4, 128, 128],
+        metavar=('T', 'H', 'W'),
+        help='generator input shape')
+    parser.add_argument('--reference', default=None, help='reference backend')
+    parser.add_argument('--atol', type=float, default=1e-4)
+    parser.add_argument('--device', default='cpu')
+    return parser.parse_args()
+
+
+def compare(outputs, reference, atol):
+    rows = []
+    for name, out in outputs.items():
+        err = (out - outputs[reference]).abs()
+        rows.append([
+            name, f'{err.max().item():.3g}', f'{err.mean().item():.3g}',
+            bool(err.max().item() <= atol)
+        ])
+    return rows
+
+
+def main():
+    args = parse_args()
+    backends = available_backends()
+    reference = args.reference or backends[0]
+    header = ['backend', 'max_abs_err', 'mean_abs_err', 'within_atol']
+    torch.manual_seed(0)
+
+    # a single alignment module with non-trivial offsets
+    c = 64
+    module = SecondOrderDeformableAlignment(
+        3, 2 * c, c, 3, padding=1, deform_groups=16).to(args.device).eval()
+    torch.nn.init.normal_(module.conv_offset[-1].weight, std=0.1)
+    x = torch.randn(2, 2 * c, 32, 40, device=args.device)
+    extra = torch.randn(2, 3 * c, 32, 40, device=args.device)
+    flow_1 = torch.randn(2, 2, 32, 40, device=args.device) * 3
+    flow_2 = torch.randn(2, 2, 32, 40, device=args.device) * 3
+    outputs = {}
+    with torch.no_grad():
+        for backend in backends:
+            module.backend = backend
+            outputs[backend] = module(x, extra, flow_1, flow_2)
+    print('SecondOrderDeformableAlignment')
+    print_table(compare(outputs, reference, args.atol), header)
+
+    if args.config is None:
+        return
+    generator, _ = build_generator(args.config, args.checkpoint)
+    generator = generator.to(args.device)
+    lqs, guides = random_inputs(generator, *args.shape, device=args.device)
+    outputs = {}
+    with torch.no_grad():
+        for backend in backends:
+            set_deform_backend(generator, backend)
+            outputs[backend] = generator(lqs, guides)[0]
+    print(f'\n{type(generator).__name__}')
+    print_table(compare(outputs, reference, args.atol), header)
+
+
+if __name__ == '__main__':
+    main()
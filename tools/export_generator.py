@@ -0,0 +1,94 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Export a DVSR/HVSR generator to TorchScript and ONNX for a fixed T/H/W.
+
+The deformable alignment uses the 'grid_sample' backend, so the graphs only
+contain standard operators (ONNX opset >= 16 for GridSample) and run without
+mmcv. The graph takes (lqs, guides) and returns the final depth
+(n, t, 1, h, w).
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/export_generator.py configs/dvsr_config.py \
+        --checkpoint chkpts/dvsr_tartan.pth --shape 20 256 320 --out-dir export
+"""
+import argparse
+import os
+import os.path as osp
+
+import torch
+import torch.nn as nn
+
+from bench_utils import build_generator, random_inputs
+from model.common import set_deform_backend
+
+
+class ExportWrapper(nn.Module):
+    """Return the final depth only."""
+
+    def __init__(self, generator):
+        super().__init__()
+        self.generator = generator
+
+    def forward(self, lqs, guides):
+        return self.generator(lqs, guides)[0]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Export a generator')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('--checkpoint', default=None)
+    parser.add_argument(
+        '--shape',
+        type=int,
+        nargs=3,
+        required=True,
+        metavar=('T', 'H', 'W'),
+        help='number of frames and guide size (multiple of the dToF scale)')
+    parser.add_argument(
+        '--format',
+        nargs='+',
+        choices=['torchscript', 'onnx'],
+        default=['torchscript', 'onnx'])
+    parser.add_argument('--opset', type=int, default=16)
+    parser.add_argument('--out-dir', default='export')
+    parser.add_argument(
+        '--verify',
+        action='store_true',
+        help='compare the TorchScript output with eager mode')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    generator, _ = build_generator(args.config, args.checkpoint)
+    set_deform_backend(generator, 'grid_sample')
+    t, h, w = args.shape
+    if t > generator.cpu_cache_length:
+        raise ValueError('T must not exceed cpu_cache_length')
+    model = ExportWrapper(generator).eval()
+    lqs, guides = random_inputs(generator, t, h, w)
+    name = f'{type(generator).__name__.lower()}_t{t}_{h}x{w}'
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    with torch.no_grad():
+        if 'torchscript' in args.format:
+            traced = torch.jit.trace(model, (lqs, guides), check_trace=False)
+            path = osp.join(args.out_dir, f'{name}.pt')
+            traced.save(path)
+            print(f'saved {path}')
+            if args.verify:
+                err = (traced(lqs, guides) - model(lqs, guides)).abs().max()
+                print(f'torchscript max_abs_err: {err.item():.3g}')
+        if 'onnx' in args.format:
+            path = osp.join(args.out_dir, f'{name}.onnx')
+            torch.onnx.export(
+                model, (lqs, guides),
+                path,
+                input_names=['lqs', 'guides'],
+                output_names=['depth'],
+                opset_version=args.opset)
+            print(f'saved {path}')
+
+
+if __name__ == '__main__':
+    main()
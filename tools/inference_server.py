@@ -0,0 +1,69 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Serve DVSR/HVSR models from a long-lived process.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/inference_server.py \
+        --model dvsr=configs/dvsr_config.py:chkpts/dvsr_tartan.pth \
+        --model hvsr=configs/hvsr_config.py:chkpts/hvsr_tartan.pth \
+        --unix-socket /tmp/dvsr.sock
+
+    # from another process
+    from apis import InferenceClient
+    client = InferenceClient(unix_socket='/tmp/dvsr.sock')
+    client.infer_sequence('dvsr', 'data/demo_dvsr', 'results/demo_dvsr')
+"""
+import argparse
+
+import torch
+
+from apis import InferenceService, serve
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Inference server')
+    parser.add_argument(
+        '--model',
+        action='append',
+        required=True,
+        metavar='NAME=CONFIG:CHECKPOINT',
+        help='model to serve (repeatable)')
+    parser.add_argument('--device', type=str, default=0, help='CUDA device id')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--unix-socket', default=None)
+    parser.add_argument('--max-batch', type=int, default=4)
+    parser.add_argument(
+        '--batch-timeout',
+        type=float,
+        default=0.01,
+        help='seconds to wait for compatible requests to batch')
+    parser.add_argument('--max-seq-len', type=int, default=None)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    models = {}
+    for spec in args.model:
+        name, paths = spec.split('=', 1)
+        config, checkpoint = paths.rsplit(':', 1)
+        models[name] = (config, checkpoint)
+    if args.device == 'cpu':
+        device = torch.device('cpu')
+    else:
+        device = torch.device('cuda', int(args.device))
+
+    service = InferenceService(
+        models,
+        device=device,
+        max_batch=args.max_batch,
+        batch_timeout=args.batch_timeout,
+        max_seq_len=args.max_seq_len)
+    where = args.unix_socket or f'http://{args.host}:{args.port}'
+    print(f'serving {sorted(models)} on {where}')
+    serve(service, args.host, args.port, args.unix_socket)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Structured channel pruning of a DVSR/HVSR checkpoint.
+
+The channel importance is measured on the calibration sequences, see
+:func:`apis.channel_importance`, and the generator is pruned to every ratio
+of ``--ratios`` (the remaining channel number is rounded to a multiple of 8,
+see :func:`apis.prune_generator`). Every pruned generator is compared with
+the original one on the evaluation sequences:
+
+- 'params': number of parameters.
+- 'ms_per_frame': inference time per frame.
+- 'peak_mb': peak memory of the forward pass.
+- 'mae': mean absolute depth difference to the original output, before any
+  fine-tuning.
+
+With ``--out-dir``, the pruned checkpoints are written there together with
+a config that fine-tunes them for ``--finetune-iters`` iterations (by
+default distilled from the original checkpoint with ``DistillRestorer``):
+
+    bash train_scripts/train.sh <OUT_DIR>/<NAME>_config.py #NUM_GPUS
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/prune_generator.py configs/dvsr_config.py \
+        chkpts/dvsr_tartan.pth --calib data/demo_dvsr --eval data/demo_dydtof \
+        --ratios 0.25 0.5 0.75 --max-seq-len 20 --out-dir work_dirs/pruned
+"""
+import argparse
+import os
+import os.path as osp
+
+import torch
+
+from apis import channel_importance, prune_generator, pruned_width
+from bench_utils import (benchmark, build_generator, load_inputs, peak_memory,
+                         print_table)
+
+CONFIG_TEMPLATE = """\
+# {config} with {width} of {mid_channels} channels, pruned by
+# tools/prune_generator.py, and its fine-tuning schedule.
+_base_ = ['{base}']
+
+exp_name = '{name}'
+
+model = dict({model})
+
+# short fine-tuning from the pruned weights
+load_from = '{checkpoint}'
+total_iters = {iters}
+optimizers = dict(lr=5e-5)
+lr_config = dict(step=[{step}])
+checkpoint_config = dict(interval={interval})
+work_dir = f'./work_dirs/{{exp_name}}'
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Channel pruning')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('checkpoint', help='checkpoint file')
+    parser.add_argument(
+        '--calib', nargs='+', required=True, help='calibration sequences')
+    parser.add_argument(
+        '--eval', nargs='+', default=None,
+        help='evaluation sequences (default: the calibration ones)')
+    parser.add_argument(
+        '--ratios', type=float, nargs='+', default=[0.25, 0.5, 0.75])
+    parser.add_argument('--max-seq-len', type=int, default=None)
+    parser.add_argument('--iters', type=int, default=3)
+    parser.add_argument('--device', default='cuda')
+    parser.add_argument(
+        '--out-dir', default=None,
+        help='write the pruned checkpoints and fine-tuning configs')
+    parser.add_argument('--finetune-iters', type=int, default=20000)
+    parser.add_argument(
+        '--no-distill', action='store_true',
+        help='fine-tune on the ground truth only')
+    return parser.parse_args()
+
+
+def save_pruned(args, cfg, generator, ratio):
+    """Write the checkpoint and the fine-tuning config of a pruned model."""
+    name = osp.splitext(osp.basename(args.config))[0]
+    name = name[:-len('_config')] if name.endswith('_config') else name
+    name = f'{name}_pruned{generator.mid_channels}'
+    checkpoint = osp.join(args.out_dir, f'{name}.pth')
+    torch.save(
+        dict(
+            meta=dict(
+                pruned_from=args.checkpoint,
+                ratio=ratio,
+                mid_channels=generator.mid_channels),
+            state_dict={
+                f'generator.{k}': v.cpu()
+                for k, v in generator.state_dict().items()
+            }), checkpoint)
+
+    model = f'generator=dict(mid_channels={generator.mid_channels})'
+    if not args.no_distill:
+        teacher = cfg.model.generator.to_dict()
+        teacher.pop('spynet_pretrained', None)
+        model = (f"type='DistillRestorer', {model}, teacher={teacher!r}, "
+                 f"teacher_pretrained='{args.checkpoint}'")
+    iters = args.finetune_iters
+    with open(osp.join(args.out_dir, f'{name}_config.py'), 'w') as f:
+        f.write(
+            CONFIG_TEMPLATE.format(
+                config=args.config,
+                width=generator.mid_channels,
+                mid_channels=cfg.model.generator.get('mid_channels', 64),
+                base=osp.relpath(osp.abspath(args.config), args.out_dir),
+                name=name,
+                model=model,
+                checkpoint=checkpoint,
+                iters=iters,
+                step=int(iters * 0.75),
+                interval=max(iters // 4, 1)))
+
+
+def main():
+    args = parse_args()
+    generator, cfg = build_generator(args.config, args.checkpoint)
+    generator = generator.to(args.device)
+    calib = [[
+        x.to(args.device)
+        for x in load_inputs(cfg, input_dir, args.max_seq_len)
+    ] for input_dir in args.calib]
+    importance = channel_importance(generator, calib)
+    del calib
+    if args.out_dir is not None:
+        os.makedirs(args.out_dir, exist_ok=True)
+
+    models = [(0., generator)]
+    for ratio in args.ratios:
+        width = pruned_width(generator.mid_channels, ratio)
+        pruned = prune_generator(generator, cfg.model.generator, width,
+                                 importance).eval()
+        if args.out_dir is not None:
+            save_pruned(args, cfg, pruned, ratio)
+        models.append((ratio, pruned))
+
+    rows = []
+    for input_dir in args.eval or args.calib:
+        lqs, guides = load_inputs(cfg, input_dir, args.max_seq_len)
+        lqs, guides = lqs.to(args.device), guides.to(args.device)
+        ref = None
+        for ratio, model in models:
+            seconds, depth = benchmark(
+                lambda: model(lqs, guides)[0],
+                iters=args.iters,
+                device=args.device)
+            peak, _ = peak_memory(
+                lambda: model(lqs, guides)[0], device=args.device)
+            if ref is None:
+                ref = depth
+            rows.append([
+                input_dir, f'{ratio:.2f}', model.mid_channels,
+                f'{sum(p.numel() for p in model.parameters()) / 1e6:.2f}M',
+                f'{seconds / lqs.size(1) * 1000:.1f}',
+                f'{peak / 2**20:.0f}',
+                f'{(depth - ref).abs().mean().item():.4f}'
+            ])
+    print_table(rows, [
+        'sequence', 'ratio', 'channels', 'params', 'ms_per_frame', 'peak_mb',
+        'mae'
+    ])
+
+
+if __name__ == '__main__':
+    main()
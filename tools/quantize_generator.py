@@ -0,0 +1,84 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Int8 post-training quantization of a DVSR/HVSR generator for CPU.
+
+The residual block stacks (and, unless excluded, the SPyNet basic modules)
+are calibrated on a few demo sequences and converted to int8, see
+:func:`apis.quantize_generator`; the deformable alignment and the output
+heads stay in float. The float and int8 generators are then compared on the
+evaluation sequences:
+
+- 'mae': mean absolute depth difference to the float output.
+- 'tc_diff': mean absolute difference of the frame-to-frame depth changes
+  to those of the float output (added flicker).
+- 'speedup': CPU time of the float generator over the int8 one.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/quantize_generator.py configs/dvsr_config.py \
+        chkpts/dvsr_tartan.pth --calib data/demo_dvsr --eval data/demo_dydtof \
+        --max-seq-len 20 --out chkpts/dvsr_tartan_int8.pth
+"""
+import argparse
+import copy
+
+import torch
+
+from apis import QUANT_TARGETS, quantize_generator, setup_cpu_inference
+from bench_utils import benchmark, build_generator, load_inputs, print_table
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Int8 quantization')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('checkpoint', help='checkpoint file')
+    parser.add_argument(
+        '--calib', nargs='+', required=True, help='calibration sequences')
+    parser.add_argument(
+        '--eval', nargs='+', default=None,
+        help='evaluation sequences (default: the calibration ones)')
+    parser.add_argument(
+        '--targets', nargs='+', choices=QUANT_TARGETS, default=QUANT_TARGETS)
+    parser.add_argument('--backend', default='x86')
+    parser.add_argument('--max-seq-len', type=int, default=None)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--iters', type=int, default=3)
+    parser.add_argument(
+        '--out', default=None, help='save the int8 generator (torch.save)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    setup_cpu_inference(args.threads)
+    generator, cfg = build_generator(args.config, args.checkpoint)
+    calib = [
+        load_inputs(cfg, input_dir, args.max_seq_len)
+        for input_dir in args.calib
+    ]
+    int8 = quantize_generator(
+        copy.deepcopy(generator), calib, args.targets, args.backend)
+    if args.out is not None:
+        torch.save(int8, args.out)
+
+    rows = []
+    for input_dir in args.eval or args.calib:
+        lqs, guides = load_inputs(cfg, input_dir, args.max_seq_len)
+        float_time, ref = benchmark(
+            lambda: generator(lqs, guides)[0], iters=args.iters)
+        int8_time, depth = benchmark(
+            lambda: int8(lqs, guides)[0], iters=args.iters)
+        change = depth[:, 1:] - depth[:, :-1]
+        ref_change = ref[:, 1:] - ref[:, :-1]
+        rows.append([
+            input_dir, f'{(depth - ref).abs().mean().item():.2e}',
+            f'{(change - ref_change).abs().mean().item():.2e}',
+            f'{float_time:.2f}', f'{int8_time:.2f}',
+            f'{float_time / int8_time:.2f}x'
+        ])
+    print_table(rows, [
+        'sequence', 'mae', 'tc_diff', 'float_s', 'int8_s', 'speedup'
+    ])
+
+
+if __name__ == '__main__':
+    main()
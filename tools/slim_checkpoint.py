@@ -0,0 +1,57 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Strip a training checkpoint down to the weights used for inference.
+
+The optimizer state, the meta data and (by default) the discriminator or
+other non-generator weights are dropped, and the result is saved in the zip
+format of ``torch.save``, which ``apis.load_weights`` memory-maps.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/slim_checkpoint.py chkpts/dvsr_tartan.pth \
+        chkpts/dvsr_tartan_slim.pth
+"""
+import argparse
+import os
+import re
+
+import torch
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Write a slim checkpoint')
+    parser.add_argument('checkpoint', help='training checkpoint')
+    parser.add_argument('out', help='output weights file')
+    parser.add_argument(
+        '--keep-prefix',
+        default='generator.',
+        help='keep only the weights starting with this prefix ("" keeps all)')
+    parser.add_argument(
+        '--half',
+        action='store_true',
+        help='store floating point weights in float16 (upcast on load)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    ckpt = torch.load(args.checkpoint, map_location='cpu')
+    state_dict = ckpt.get('state_dict', ckpt)
+
+    slim = {}
+    for k, v in state_dict.items():
+        k = re.sub(r'^module\.', '', k)
+        if not k.startswith(args.keep_prefix):
+            continue
+        if args.half and v.is_floating_point():
+            v = v.half()
+        slim[k] = v.contiguous()
+    torch.save({'state_dict': slim}, args.out)
+
+    before = os.path.getsize(args.checkpoint) / 1024**2
+    after = os.path.getsize(args.out) / 1024**2
+    print(f'{len(state_dict)} -> {len(slim)} tensors, '
+          f'{before:.1f} MiB -> {after:.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+"""Per-pixel equivalence of tiled and untiled inference.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python tools/tiled_equivalence.py configs/dvsr_config.py \
+        chkpts/dvsr_tartan.pth data/demo_dvsr --tile-size 128
+"""
+import argparse
+
+import numpy as np
+import torch
+
+from apis import init_model, load_sequence, tiled_equivalence_report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Compare tiled against untiled inference')
+    parser.add_argument('config', help='test config file path')
+    parser.add_argument('checkpoint', help='checkpoint file')
+    parser.add_argument('input_dir', help='directory of the input video')
+    parser.add_argument('--tile-size', type=int, required=True)
+    parser.add_argument('--tile-halo', type=int, default=None)
+    parser.add_argument('--max-seq-len', type=int, default=None)
+    parser.add_argument('--atol', type=float, default=1e-3)
+    parser.add_argument(
+        '--error-map', default=None, help='save the per-pixel error (.npy)')
+    parser.add_argument('--device', type=str, default=0, help='CUDA device id')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.device == 'cpu':
+        device = torch.device('cpu')
+    else:
+        device = torch.device('cuda', int(args.device))
+    model = init_model(args.config, args.checkpoint, device=device)
+
+    lqs, guides = load_sequence(model.cfg, args.input_dir)
+    if args.max_seq_len is not None:
+        lqs = lqs[:, :args.max_seq_len]
+        guides = guides[:, :args.max_seq_len]
+
+    report = tiled_equivalence_report(
+        model.generator, lqs.to(device), guides.to(device), args.tile_size,
+        args.tile_halo, atol=args.atol)
+    error_map = report.pop('error_map')
+    for k, v in report.items():
+        print(f'{k}: {v:.6g}')
+    if args.error_map is not None:
+        np.save(args.error_map, error_map.numpy())
+
+
+if __name__ == '__main__':
+    main()
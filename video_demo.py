@@ -1,51 +1,20 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates.
 
 import argparse
-import os
+import glob
+import os.path as osp
 import sys
 import re
+import warnings
 
 import cv2
 import mmcv
 import numpy as np
 import torch
 
-from model.builder import build_model
-from mmcv.runner import load_checkpoint
-from apis import video_inference
-
-
-def init_model(config, checkpoint=None, device='cuda:0'):
-    """Initialize a model from config file.
-
-    Args:
-        config (str or :obj:`mmcv.Config`): Config file path or the config
-            object.
-        checkpoint (str, optional): Checkpoint path. If left as None, the model
-            will not load any weights.
-        device (str): Which device the model will deploy. Default: 'cuda:0'.
-
-    Returns:
-        nn.Module: The constructed model.
-    """
-    if isinstance(config, str):
-        config = mmcv.Config.fromfile(config)
-    elif not isinstance(config, mmcv.Config):
-        raise TypeError('config must be a filename or Config object, '
-                        f'but got {type(config)}')
-    config.model.pretrained = None
-    config.test_cfg.metrics = None
-    model = build_model(config.model, test_cfg=config.test_cfg)
-    if checkpoint is not None:
-        if device == torch.device('cpu'):
-            checkpoint = load_checkpoint(model, checkpoint, map_location = 'cpu')
-        else:
-            checkpoint = load_checkpoint(model, checkpoint)
-    
-    model.cfg = config  # save the config in the model for convenience
-    model.to(device)
-    model.eval()
-    return model
+from apis import (ResultWriter, cpu_autocast, init_model, prepare_cpu_model,
+                  setup_cpu_inference, video_inference)
+from model.common import GuideCache, set_deform_backend
 
 
 def modify_args():
@@ -88,6 +57,102 @@ def parse_args():
         default=None,
         help='maximum sequence length if recurrent framework is used')
     parser.add_argument('--device', type=str, default=0, help='CUDA device id')
+    parser.add_argument(
+        '--layout',
+        choices=['frames', 'memmap'],
+        default='frames',
+        help='one file per frame (filename_tmpl) or a single memory-mapped '
+        '(T,H,W) array per video')
+    parser.add_argument(
+        '--encoding',
+        choices=['float32', 'float16', 'uint16_mm'],
+        default='float32',
+        help='storage encoding of the results')
+    parser.add_argument(
+        '--depth-range',
+        type=float,
+        default=10.0,
+        help='metric depth (m) of a network output of 1, used by uint16_mm')
+    parser.add_argument(
+        '--num-writers',
+        type=int,
+        default=2,
+        help='number of background threads writing results')
+    parser.add_argument(
+        '--tile',
+        action='store_true',
+        help='process frames in spatial tiles (for high-resolution guides)')
+    parser.add_argument(
+        '--tile-size',
+        type=int,
+        default=None,
+        help='core tile size in pixels (multiple of the dToF scale), chosen '
+        'from --memory-budget if not given')
+    parser.add_argument(
+        '--tile-halo',
+        type=int,
+        default=None,
+        help='overlap in pixels added on every tile side (default 4 * scale)')
+    parser.add_argument(
+        '--memory-budget',
+        type=float,
+        default=None,
+        help='memory budget in GiB used to choose the tile size (with '
+        '--tile) or the execution plan: full, offload, chunked or tiled')
+    parser.add_argument(
+        '--cpu-threads',
+        type=int,
+        default=None,
+        help='intra-op threads of this process (cpu only)')
+    parser.add_argument(
+        '--cpu-interop-threads',
+        type=int,
+        default=None,
+        help='inter-op threads of this process (cpu only)')
+    parser.add_argument(
+        '--no-channels-last',
+        action='store_true',
+        help='keep the contiguous memory format on cpu')
+    parser.add_argument(
+        '--bf16',
+        action='store_true',
+        help='bf16 autocast on cpu (flow and softmax stay in fp32)')
+    parser.add_argument(
+        '--deform-backend',
+        choices=['auto', 'mmcv', 'torchvision', 'grid_sample'],
+        default=None,
+        help='implementation of the deformable alignment (default: config)')
+    parser.add_argument(
+        '--feature-store',
+        choices=['device', 'host', 'disk'],
+        default=None,
+        help='storage tier of the propagation features (default: config)')
+    parser.add_argument(
+        '--feature-store-dir',
+        default=None,
+        help='directory of the memory-mapped features of the disk tier')
+    parser.add_argument(
+        '--keyframe-interval',
+        type=int,
+        default=None,
+        help='run the network on every k-th frame only (the longest interval '
+        'with --keyframe-mode guide/dtof) and interpolate the others; not '
+        'combined with --memory-budget unless --tile is given')
+    parser.add_argument(
+        '--keyframe-mode',
+        choices=['interval', 'guide', 'dtof'],
+        default='interval',
+        help='keyframe selection: fixed interval, or guide / dToF change')
+    parser.add_argument(
+        '--keyframe-threshold',
+        type=float,
+        default=0.05,
+        help='mean absolute change that starts a new keyframe')
+    parser.add_argument(
+        '--guide-cache',
+        default=None,
+        help='directory caching the flows and guide features of the guides, '
+        'reused by later runs of the same video with other dToF inputs')
     args = parser.parse_args()
     return args
 
@@ -99,25 +164,53 @@ def main():
     args = parse_args()
     
     if args.device == 'cpu':
+        setup_cpu_inference(args.cpu_threads, args.cpu_interop_threads)
         model = init_model(
             args.config, args.checkpoint, device=torch.device('cpu'))
+        model = prepare_cpu_model(
+            model, channels_last=not args.no_channels_last)
     else:
         model = init_model(
             args.config, args.checkpoint, device=torch.device('cuda', int(args.device)))
-
-    output = video_inference(model, args.input_dir,
-                                         args.window_size, args.start_idx,
-                                         args.filename_tmpl, args.max_seq_len)
-
-    file_extension = os.path.splitext(args.output_dir)[1]
-    
-    ## save results
-    if not os.path.exists(args.output_dir):
-        os.makedirs(args.output_dir, exist_ok=True)
-    for i in range(args.start_idx, args.start_idx + output.size(1)):
-        output_i = output[:, i - args.start_idx, :, :, :]
-        save_path_i = f'{args.output_dir}/{args.filename_tmpl.format(i)}'
-        np.save(save_path_i, output_i.detach().cpu().numpy())
+    if args.deform_backend is not None:
+        set_deform_backend(model, args.deform_backend)
+    if args.feature_store is not None:
+        model.generator.feature_store = dict(
+            tier=args.feature_store, root=args.feature_store_dir)
+    if args.guide_cache is not None:
+        model.generator.guide_cache = GuideCache(root=args.guide_cache)
+
+    writer = ResultWriter(
+        args.output_dir,
+        filename_tmpl=args.filename_tmpl,
+        start_idx=args.start_idx,
+        layout=args.layout,
+        encoding=args.encoding,
+        depth_range=args.depth_range,
+        num_frames=len(glob.glob(osp.join(args.input_dir, 'color', '*'))),
+        num_workers=args.num_writers)
+    tile_cfg = None
+    memory_budget = None
+    if args.memory_budget is not None and not args.tile:
+        memory_budget = int(args.memory_budget * 1024**3)
+    if args.tile:
+        tile_cfg = dict(tile_size=args.tile_size, tile_halo=args.tile_halo)
+        if args.memory_budget is not None:
+            tile_cfg['memory_budget'] = int(args.memory_budget * 1024**3)
+
+    keyframe_cfg = None
+    if args.keyframe_interval is not None:
+        keyframe_cfg = dict(
+            interval=args.keyframe_interval,
+            mode=args.keyframe_mode,
+            threshold=args.keyframe_threshold)
+
+    with writer, cpu_autocast(args.device == 'cpu' and args.bf16):
+        video_inference(model, args.input_dir, args.window_size,
+                        args.start_idx, args.filename_tmpl, args.max_seq_len,
+                        writer=writer, tile_cfg=tile_cfg,
+                        memory_budget=memory_budget,
+                        keyframe_cfg=keyframe_cfg)
 
 if __name__ == '__main__':
     main()